@@ -0,0 +1,141 @@
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+TRAIN_DIR = Path(__file__).resolve().parents[1] / "train"
+
+# Trained architectures: name -> (training script, model file it saves)
+MODELS = {
+    "dense_mnist": ("mnist", "output/dense_mnist.npz"),
+    "cnn_mnist": ("cnn_mnist", "output/cnn_mnist.npz"),
+    "super_cnn_mnist": ("super_cnn", "output/super_cnn_mnist.npz"),
+    "dense_emnist_letters": ("emnist_letters_dense", "output/dense_emnist_letters.npz"),
+}
+
+
+def measure(fn, repeat=100, warmup=5):
+    """
+    Calls fn repeatedly and returns its latency distribution.
+
+    Returns:
+        dict: {"p50_ms", "p95_ms", "mean_ms", "n"}
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+
+    timings *= 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "mean_ms": float(timings.mean()),
+        "n": repeat,
+    }
+
+
+def measure_throughput(fn, items, min_seconds=1.0):
+    """Calls fn (processing `items` items per call) for at least min_seconds."""
+    fn()
+
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_seconds:
+        fn()
+        calls += 1
+
+    return {"items_per_s": calls * items / elapsed, "n": calls}
+
+
+def build_model_file(name, directory):
+    """
+    Returns the trained model file of an architecture if it exists, otherwise saves
+    a randomly initialized model built by its training script in `directory`. The
+    weights do not matter for timing, so benchmarks run without a trained model.
+    """
+    script, trained_path = MODELS[name]
+    if Path(trained_path).exists():
+        return Path(trained_path), False
+
+    from mpneuralnetwork.losses import CategoricalCrossEntropy
+    from mpneuralnetwork.model import Model
+    from mpneuralnetwork.optimizers import Adam
+    from mpneuralnetwork.serialization import save_model
+
+    # The training scripts import their siblings (dataset, trainer) by name
+    if str(TRAIN_DIR) not in sys.path:
+        sys.path.insert(0, str(TRAIN_DIR))
+    module = importlib.import_module(script)
+
+    model = Model(module.build_network(), CategoricalCrossEntropy(), Adam())
+    path = Path(directory) / f"{name}.npz"
+    save_model(model, str(path))
+
+    return path, True
+
+
+def metadata():
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "threads": os.environ.get("OMP_NUM_THREADS"),
+    }
+
+
+def write_results(results, path):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"meta": metadata(), "results": results}, f, indent=2)
+
+
+def compare(results, baseline_path, tolerance=0.1):
+    """
+    Compares results against a stored results file. Latencies (p50_ms) regress when
+    they grow, throughputs (items_per_s) when they shrink, by more than `tolerance`.
+
+    Returns:
+        list: (name, metric, baseline, current, relative change, regressed) rows.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    rows = []
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+
+        for metric, lower_is_better in (("p50_ms", True), ("items_per_s", False)):
+            if metric not in current or metric not in baseline[name]:
+                continue
+
+            before, after = baseline[name][metric], current[metric]
+            change = (after - before) / before if before else 0.0
+            regressed = change > tolerance if lower_is_better else change < -tolerance
+            rows.append((name, metric, before, after, change, regressed))
+
+    return rows
+
+
+def print_comparison(rows):
+    """Prints the comparison table and returns True if anything regressed."""
+    width = max((len(name) for name, *_ in rows), default=10)
+    for name, metric, before, after, change, regressed in rows:
+        flag = "REGRESSION" if regressed else ""
+        print(f"{name:<{width}}  {metric:<12} {before:>12.4f} -> {after:>12.4f}  {change:+7.1%}  {flag}")
+
+    return any(row[-1] for row in rows)
@@ -0,0 +1,74 @@
+"""
+Compares the NeuralNetHandler backends on the convolutional architectures:
+"model" (layer by layer through `model.predict`), "tensordot" (inference plan
+with the library's convolution) and "im2col" (inference plan with gui/convolution.py).
+
+    python -m benchmarks.convolution -o output/convolution.json
+"""
+
+import os
+
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import build_model_file, compare, measure, print_comparison, write_results
+from gui.neuralnethandler import NeuralNetHandler
+
+CNN_MODELS = ("cnn_mnist", "super_cnn_mnist")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the convolution backends")
+
+    parser.add_argument("-o", "--output", type=str, default="output/convolution.json", help="JSON results file")
+    parser.add_argument("--compare", type=str, default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown allowed")
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 16, 256],
+        help="Batch sizes to time",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=50, help="Timed calls per benchmark")
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as directory:
+        for name in CNN_MODELS:
+            model_path, _ = build_model_file(name, directory)
+            handlers = {backend: NeuralNetHandler(model_path, backend=backend) for backend in NeuralNetHandler.BACKENDS}
+
+            for batch_size in args.batch_sizes:
+                batch = rng.random((batch_size, 28, 28), dtype=np.float32)
+                # Fewer repetitions for large batches, at least 5
+                repeat = max(args.repeat * 16 // max(batch_size, 16), 5)
+
+                for backend, handler in handlers.items():
+                    result = measure(
+                        lambda handler=handler, batch=batch: handler.predict_normalized(batch), repeat=repeat
+                    )
+                    result["items_per_s"] = batch_size / (result["p50_ms"] / 1000)
+                    results[f"{name}.{backend}.batch_{batch_size}"] = result
+
+                    print(
+                        f"{name:<16} {backend:<10} batch {batch_size:>4}   "
+                        f"p50 {result['p50_ms']:>9.3f} ms   {result['items_per_s']:>9.0f} images/s"
+                    )
+
+    write_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print(f"\nComparison against {args.compare} (tolerance {args.tolerance:.0%}):")
+        if print_comparison(compare(results, args.compare, args.tolerance)):
+            sys.exit(1)
@@ -0,0 +1,99 @@
+"""
+Times model loading (`NeuralNetHandler`) from the `.npz` archives and from
+mapped model files (gui/mappedmodel.py), for every architecture in train/.
+
+Load times are measured with the files in the OS cache. On Linux, a fresh
+process per file also reports the private memory its load adds (Private_Dirty
+in /proc/self/smaps_rollup): weights decompressed from an archive are private
+to each process, mapped weights are shared page cache.
+
+    python -m benchmarks.loading -o output/loading.json
+    python -m benchmarks.loading --compare output/loading.json
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import MODELS, build_model_file, compare, measure, print_comparison, write_results
+from gui.mappedmodel import SUFFIX, save_mapped
+from gui.neuralnethandler import NeuralNetHandler
+
+ROOT = Path(__file__).resolve().parents[1]
+SMAPS = Path("/proc/self/smaps_rollup")
+
+# Loads a model and prints the private memory it added, in bytes
+MEMORY_PROBE = """
+import sys
+import numpy as np
+from gui.neuralnethandler import NeuralNetHandler
+
+def private_dirty():
+    with open("/proc/self/smaps_rollup") as f:
+        return sum(int(line.split()[1]) * 1024 for line in f if line.startswith("Private_Dirty:"))
+
+before = private_dirty()
+handler = NeuralNetHandler(sys.argv[1])
+handler.predict_normalized(np.zeros((1, 28, 28), dtype=np.float32))
+print(private_dirty() - before)
+"""
+
+
+def private_memory(model_path):
+    """Private memory (bytes) added by loading model_path in a fresh process, None if unknown."""
+    if not SMAPS.exists():
+        return None
+
+    output = subprocess.run(
+        [sys.executable, "-c", MEMORY_PROBE, str(model_path)],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return int(output.split()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark model loading from .npz and mapped files")
+
+    parser.add_argument("-o", "--output", type=str, default="output/loading.json", help="JSON results file")
+    parser.add_argument("--compare", type=str, default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown allowed")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="Loads per file")
+
+    args = parser.parse_args()
+
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as directory:
+        for name in MODELS:
+            npz_path, _ = build_model_file(name, directory)
+            mapped_path = Path(directory) / f"{name}{SUFFIX}"
+            save_mapped(NeuralNetHandler(npz_path, backend="model").model, mapped_path)
+
+            for file_format, path in (("npz", npz_path), ("mapped", mapped_path)):
+                result = measure(lambda path=path: NeuralNetHandler(path), repeat=args.repeat, warmup=1)
+                result["file_mb"] = path.stat().st_size / 1e6
+
+                memory = private_memory(path.resolve())
+                if memory is not None:
+                    result["private_mb"] = memory / 1e6
+
+                results[f"load.{name}.{file_format}"] = result
+
+                print(
+                    f"{name:<22} {file_format:<7} p50 {result['p50_ms']:>8.2f} ms   p95 {result['p95_ms']:>8.2f} ms"
+                    f"   file {result['file_mb']:>6.2f} MB"
+                    + (f"   private {result['private_mb']:>6.2f} MB" if "private_mb" in result else "")
+                )
+
+    write_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print(f"\nComparison against {args.compare} (tolerance {args.tolerance:.0%}):")
+        if print_comparison(compare(results, args.compare, args.tolerance)):
+            sys.exit(1)
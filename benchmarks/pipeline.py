@@ -0,0 +1,188 @@
+"""
+Benchmarks the stroke-to-prediction pipeline: ImageHandler.add_line, ImageHandler.update
+(both rasterizations, on the GUI canvas and on a 4K one) and NeuralNetHandler.predict for
+every trained architecture, headless (no Tk).
+
+    python -m benchmarks.pipeline -o output/benchmarks.json
+    python -m benchmarks.pipeline --compare baseline.json
+
+Architectures without a trained model in output/ are benchmarked with random weights.
+BLAS runs on a single thread unless OMP_NUM_THREADS says otherwise, so throughputs
+are per core.
+"""
+
+import os
+
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import itertools
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import (
+    MODELS,
+    build_model_file,
+    compare,
+    measure,
+    measure_throughput,
+    print_comparison,
+    write_results,
+)
+from gui.imagehandler import ImageHandler, preprocess
+from gui.neuralnethandler import NeuralNetHandler
+
+CANVAS_SIZE = 600
+PEN_WIDTH = 50
+# (width, height) of a 4K tablet, strokes are scaled up to it
+LARGE_CANVAS = (3840, 2160)
+
+
+def synthetic_strokes(rng, n_strokes=3, n_points=40, canvas_size=CANVAS_SIZE):
+    """
+    Generates pen strokes as smooth random walks, sampled like <B1-Motion> events.
+
+    Returns:
+        list: One list of (x, y) points per stroke.
+    """
+    strokes = []
+    for _ in range(n_strokes):
+        heading = rng.uniform(0, 2 * np.pi)
+        x, y = rng.uniform(0.3, 0.7, size=2) * canvas_size
+        points = []
+        for _ in range(n_points):
+            heading += rng.normal(0, 0.3)
+            x = float(np.clip(x + 8 * np.cos(heading), 0, canvas_size - 1))
+            y = float(np.clip(y + 8 * np.sin(heading), 0, canvas_size - 1))
+            points.append((int(x), int(y)))
+        strokes.append(points)
+
+    return strokes
+
+
+def segments(strokes):
+    return [(*a, *b) for points in strokes for a, b in zip(points, points[1:])]
+
+
+def draw(strokes, canvas=(CANVAS_SIZE, CANVAS_SIZE), rasterization="canvas"):
+    handler = ImageHandler(*canvas, rasterization=rasterization)
+    scale = canvas[1] / CANVAS_SIZE
+    for segment in segments(strokes):
+        handler.add_line(*(int(c * scale) for c in segment), PEN_WIDTH * scale, "white")
+
+    return handler
+
+
+def bench_image_handler(rng, repeat):
+    strokes = synthetic_strokes(rng)
+    results = {}
+
+    handler = ImageHandler(CANVAS_SIZE, CANVAS_SIZE)
+    cycle = itertools.cycle(segments(strokes))
+    results["image_handler.add_line"] = measure(
+        lambda: handler.add_line(*next(cycle), PEN_WIDTH, "white"), repeat=repeat * 10
+    )
+
+    handler = draw(strokes)
+    results["image_handler.update"] = measure(handler.update, repeat=repeat)
+
+    # The vector rasterization should cost the same whatever the canvas size
+    for name, canvas, rasterization in (
+        ("image_handler.vector.update", (CANVAS_SIZE, CANVAS_SIZE), "vector"),
+        ("image_handler.4k.update", LARGE_CANVAS, "canvas"),
+        ("image_handler.4k.vector.update", LARGE_CANVAS, "vector"),
+    ):
+        handler = draw(strokes, canvas, rasterization)
+        results[name] = measure(handler.update, repeat=repeat)
+
+    return results
+
+
+def bench_model(name, model_path, rng, repeat, batch_size):
+    handler = NeuralNetHandler(model_path)
+    strokes = synthetic_strokes(rng)
+
+    image = preprocess(draw(strokes).snapshot())
+    batch = [preprocess(draw(synthetic_strokes(rng)).snapshot()) for _ in range(batch_size)]
+
+    results = {
+        f"{name}.predict": measure(lambda: handler.predict(image), repeat=repeat),
+        f"{name}.predict_batch": measure_throughput(lambda: handler.predict_batch(batch), batch_size),
+    }
+
+    # One motion event as the GUI sees it: draw the segment, preprocess, predict
+    image_handler = ImageHandler(CANVAS_SIZE, CANVAS_SIZE)
+    cycle = itertools.cycle(segments(strokes))
+
+    def keystroke():
+        image_handler.add_line(*next(cycle), PEN_WIDTH, "white")
+        image_handler.update()
+        handler.predict(image_handler.image)
+
+    results[f"{name}.keystroke"] = measure(keystroke, repeat=repeat)
+
+    return results
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        if "items_per_s" in result:
+            print(f"{name:<{width}}  {result['items_per_s']:>10.0f} images/s")
+        else:
+            print(f"{name:<{width}}  p50 {result['p50_ms']:>8.3f} ms   p95 {result['p95_ms']:>8.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stroke-to-prediction pipeline")
+
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default="output/benchmarks.json",
+        help="JSON file to write the results to",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Results file to compare against; exits with status 1 on regression",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative slowdown allowed before a result counts as a regression",
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(MODELS),
+        default=list(MODELS),
+        help="Architectures to benchmark",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=200, help="Timed calls per latency benchmark")
+    parser.add_argument("-b", "--batch_size", type=int, default=256, help="Batch size of the throughput benchmark")
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = bench_image_handler(rng, args.repeat)
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as directory:
+        for name in args.models:
+            model_path, synthetic = build_model_file(name, directory)
+            print(f"{name}: {'random weights' if synthetic else model_path}", file=sys.stderr)
+            results.update(bench_model(name, model_path, rng, args.repeat, args.batch_size))
+
+    print_results(results)
+    write_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print(f"\nComparison against {args.compare} (tolerance {args.tolerance:.0%}):")
+        if print_comparison(compare(results, args.compare, args.tolerance)):
+            sys.exit(1)
@@ -0,0 +1,138 @@
+"""
+Memory and throughput of the dtype policies (gui/precision.py, train/dataset.py)
+for every architecture in train/:
+
+- train_step: mini-batches built by `dataset.BatchIterator` in the dtype and
+  trained on with `trainer.train_step`, with the size of a batch and of the
+  whole dataset loaded in that dtype (non-lazy `load_mnist` / `load_emnist`).
+- predict: `NeuralNetHandler` with the precision, with the size of its weights
+  and the largest output difference from the float64 plan.
+
+    python -m benchmarks.precision -o output/precision.json
+    python -m benchmarks.precision --compare output/precision.json
+"""
+
+import os
+
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import itertools
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import (
+    MODELS,
+    TRAIN_DIR,
+    build_model_file,
+    compare,
+    measure_throughput,
+    print_comparison,
+    write_results,
+)
+from gui.inferenceplan import fold_model
+from gui.neuralnethandler import NeuralNetHandler
+from gui.precision import PRECISIONS
+
+# Samples and classes of the dataset each architecture trains on (train, validation and test)
+DATASETS = {
+    "dense_mnist": (70000, 10),
+    "cnn_mnist": (70000, 10),
+    "super_cnn_mnist": (70000, 10),
+    "dense_emnist_letters": (145600, 27),
+}
+
+
+def dataset_mb(name, precision):
+    samples, classes = DATASETS[name]
+    return samples * (784 + classes) * np.dtype(precision).itemsize / 1e6
+
+
+def weights_mb(model, precision):
+    _, arrays = fold_model(model)
+    return sum(array.size for array in arrays.values()) * np.dtype(precision).itemsize / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the memory and throughput of the dtype policies")
+
+    parser.add_argument("-o", "--output", type=str, default="output/precision.json", help="JSON results file")
+    parser.add_argument("--compare", type=str, default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown allowed")
+    parser.add_argument("--train_batch_size", type=int, default=128, help="Mini-batch size of the training steps")
+    parser.add_argument("--predict_batch_size", type=int, default=256, help="Batch size of the predict calls")
+    parser.add_argument("-s", "--seconds", type=float, default=1.0, help="Minimum time per measurement")
+
+    args = parser.parse_args()
+
+    # The training modules import their siblings by name
+    if str(TRAIN_DIR) not in sys.path:
+        sys.path.insert(0, str(TRAIN_DIR))
+    from dataset import BatchIterator
+    from trainer import train_step
+
+    from mpneuralnetwork import serialization
+    from mpneuralnetwork.layers import Convolutional
+
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(4096, 28, 28), dtype=np.uint8)
+    x = rng.random((args.predict_batch_size, 28, 28), dtype=np.float32)
+
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as directory:
+        for name in MODELS:
+            path, _ = build_model_file(name, directory)
+            reference = NeuralNetHandler(path, precision="float64").predict_normalized(x)
+
+            for precision in PRECISIONS:
+                # Same starting weights for every precision
+                model = serialization.load_model(path)
+                conv = isinstance(model.layers[0], Convolutional)
+                num_classes = DATASETS[name][1]
+                labels = rng.integers(0, num_classes, size=len(images))
+
+                batches = BatchIterator(
+                    images.reshape(-1, 1, 28, 28) if conv else images.reshape(-1, 784),
+                    labels,
+                    batch_size=args.train_batch_size,
+                    num_classes=num_classes,
+                    dtype=precision,
+                )
+                stream = itertools.chain.from_iterable(itertools.repeat(batches))
+                X_batch, y_batch = next(stream)
+
+                train = measure_throughput(
+                    lambda model=model, stream=stream: train_step(model, *next(stream)),
+                    args.train_batch_size,
+                    args.seconds,
+                )
+                train["batch_mb"] = (X_batch.nbytes + y_batch.nbytes) / 1e6
+                train["dataset_mb"] = dataset_mb(name, precision)
+                results[f"precision.{name}.{precision}.train_step"] = train
+
+                handler = NeuralNetHandler(path, precision=precision)
+                predict = measure_throughput(
+                    lambda handler=handler: handler.predict_normalized(x), args.predict_batch_size, args.seconds
+                )
+                predict["weights_mb"] = weights_mb(handler.model, precision)
+                predict["max_difference"] = float(np.max(np.abs(handler.predict_normalized(x) - reference)))
+                results[f"precision.{name}.{precision}.predict"] = predict
+
+                print(
+                    f"{name:<22} {precision:<8}"
+                    f" train {train['items_per_s']:>9,.0f} samples/s   dataset {train['dataset_mb']:>7.1f} MB"
+                    f"   |   predict {predict['items_per_s']:>9,.0f} images/s   weights {predict['weights_mb']:>6.2f} MB"
+                    f"   max diff {predict['max_difference']:.1e}"
+                )
+
+    write_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print(f"\nComparison against {args.compare} (tolerance {args.tolerance:.0%}):")
+        if print_comparison(compare(results, args.compare, args.tolerance)):
+            sys.exit(1)
@@ -0,0 +1,105 @@
+"""
+Times the GUI startup phases (see gui/startup.py) over fresh processes, in the
+default mode and with --fast_startup, and reports the median of each phase.
+
+Without a display, the window phases cannot be measured: a headless probe
+times the imports of run_gui.py and the model load / warm-up instead.
+
+    python -m benchmarks.startup -o output/startup.json
+    python -m benchmarks.startup --compare output/startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import MODELS, build_model_file, compare, print_comparison, write_results
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# What run_gui.py does before and after the window, without the window
+HEADLESS_PROBE = """
+import time
+STARTED = time.perf_counter()
+import sys
+import numpy as np
+from gui.paint import Paint
+from gui.startup import StartupTimer
+startup = StartupTimer(STARTED)
+startup.mark("imports")
+from gui.neuralnethandler import NeuralNetHandler
+handler = NeuralNetHandler(sys.argv[1], cache_size=Paint.PREDICTION_CACHE_SIZE)
+startup.mark("model_loaded")
+handler.predict_normalized(np.zeros((1, 28, 28), dtype=np.float32))
+startup.mark("model_warm")
+startup.save(sys.argv[2])
+"""
+
+
+def has_display():
+    return sys.platform in ("win32", "darwin") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def run_once(mode, model_path, report_path):
+    """Starts a fresh process in the given mode and returns its phases, in ms."""
+    if mode == "headless":
+        command = [sys.executable, "-c", HEADLESS_PROBE, str(model_path), str(report_path)]
+    else:
+        command = [sys.executable, "run_gui.py", "-m", str(model_path), "--startup_report", str(report_path)]
+        if mode == "fast_startup":
+            command.append("--fast_startup")
+
+    environment = dict(os.environ)
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        environment.setdefault(var, "1")
+
+    subprocess.run(command, cwd=ROOT, env=environment, check=True, stdout=subprocess.DEVNULL)
+    with open(report_path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the GUI startup")
+
+    parser.add_argument("-o", "--output", type=str, default="output/startup.json", help="JSON results file")
+    parser.add_argument("--compare", type=str, default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown allowed")
+    parser.add_argument("--model", type=str, default="dense_mnist", choices=MODELS, help="Architecture to load")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="Process starts per mode")
+
+    args = parser.parse_args()
+
+    modes = ("default", "fast_startup") if has_display() else ("headless",)
+    if modes == ("headless",):
+        print("No display: timing the imports and the model load only\n")
+
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as directory:
+        model_path, _ = build_model_file(args.model, directory)
+        report_path = Path(directory) / "startup.json"
+
+        for mode in modes:
+            # The first start fills the OS file cache, it is not timed
+            run_once(mode, model_path.resolve(), report_path)
+            runs = [run_once(mode, model_path.resolve(), report_path) for _ in range(args.repeat)]
+
+            for phase in runs[0]:
+                timings = [run[phase] for run in runs]
+                result = {"p50_ms": statistics.median(timings), "min_ms": min(timings), "n": len(timings)}
+                results[f"startup.{mode}.{phase}"] = result
+
+                print(f"{mode:<14} {phase:<14} p50 {result['p50_ms']:>8.1f} ms   min {result['min_ms']:>8.1f} ms")
+
+    write_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print(f"\nComparison against {args.compare} (tolerance {args.tolerance:.0%}):")
+        if print_comparison(compare(results, args.compare, args.tolerance)):
+            sys.exit(1)
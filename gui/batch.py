@@ -0,0 +1,130 @@
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+
+from PIL import Image
+
+from gui.ensemble import load_handler
+from gui.preprocessing import preprocess_batch, stack_images
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".pgm"}
+
+# Each worker process loads its own copy of the model once, in the pool initializer
+_worker_handler = None
+
+
+def _is_image(name):
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def _open_image(data, invert):
+    img = Image.open(data).convert("L")
+    if invert:
+        # Scans are usually dark ink on white paper, the model expects white ink on black
+        img = Image.eval(img, lambda px: 255 - px)
+    return img
+
+
+def iter_images(source, invert=False):
+    """
+    Yields (name, image) pairs from a directory (searched recursively) or from a
+    .zip / .tar(.gz) archive. Images are returned as grayscale PIL images.
+    """
+    source = Path(source)
+
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and _is_image(path.name):
+                yield str(path.relative_to(source)), _open_image(path, invert)
+
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in sorted(archive.namelist()):
+                if not member.endswith("/") and _is_image(member):
+                    yield member, _open_image(BytesIO(archive.read(member)), invert)
+
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and _is_image(member.name):
+                    yield member.name, _open_image(BytesIO(archive.extractfile(member).read()), invert)
+
+    else:
+        raise ValueError(f"{source} is neither a directory nor a .zip/.tar archive")
+
+
+def iter_batches(items, batch_size):
+    """Groups an iterable into lists of at most batch_size elements."""
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        yield batch
+
+
+def score_batch(handler, batch):
+    """
+    Preprocesses a list of (name, image) pairs and returns a list of
+    (name, class index, probability vector) tuples, using one predict call.
+    """
+    names = [name for name, _ in batch]
+    processed = preprocess_batch(stack_images([image for _, image in batch]))
+    predictions = handler.predict_normalized(processed)
+
+    return list(zip(names, predictions.argmax(axis=1), predictions))
+
+
+def _init_worker(model_paths, handler_options):
+    global _worker_handler
+    _worker_handler = load_handler(model_paths, **handler_options)
+
+
+def _score_in_worker(batch):
+    results = score_batch(_worker_handler, batch)
+    stats = _worker_handler.cache.stats if _worker_handler.cache else None
+    return os.getpid(), results, stats
+
+
+def score(source, model_paths, batch_size=256, workers=1, invert=False, cache_stats=None, **handler_options):
+    """
+    Scores every image found in source and yields (name, class index, probabilities).
+
+    With workers > 1 the batches are sharded across a process pool, each worker
+    holding its own model(s). Results are yielded in input order. Extra keyword
+    arguments (cache_size, cascade, ...) are passed to `load_handler`; if a cache_stats
+    dict is given, it is filled with the prediction cache counters (summed over
+    the workers) as the scoring progresses.
+    """
+    batches = iter_batches(iter_images(source, invert), batch_size)
+
+    if workers <= 1:
+        handler = load_handler(model_paths, **handler_options)
+        for batch in batches:
+            yield from score_batch(handler, batch)
+            if cache_stats is not None and handler.cache:
+                cache_stats.update(handler.cache.stats)
+        return
+
+    worker_stats = {}
+
+    def collect(future):
+        pid, results, stats = future.result()
+        if cache_stats is not None and stats:
+            worker_stats[pid] = stats
+            cache_stats.update({key: sum(s[key] for s in worker_stats.values()) for key in stats})
+        return results
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(model_paths, handler_options)
+    ) as pool:
+        # Keep a bounded number of batches in flight so huge sources don't fill memory
+        pending = []
+        for batch in batches:
+            pending.append(pool.submit(_score_in_worker, batch))
+            if len(pending) >= 2 * workers:
+                yield from collect(pending.pop(0))
+
+        for future in pending:
+            yield from collect(future)
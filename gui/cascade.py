@@ -0,0 +1,255 @@
+"""
+Confidence-gated cascade of models behind the NeuralNetHandler interface.
+
+Every image goes through the first (cheap) model; the images it is not
+confident about are re-batched and sent to the next (stronger) model, and so
+on. Confidence is either the top-1 probability ("probability") or the gap
+between the top-1 and top-2 probabilities ("margin"). The thresholds are
+chosen on validation data by `tools/cascade.py` for a target accuracy.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from gui.ensemble import check_label_mappings, member_names, percentiles
+from gui.neuralnethandler import NeuralNetHandler
+from gui.precision import compute_dtype
+from gui.predictioncache import PredictionCache
+
+CRITERIA = ("probability", "margin")
+
+
+def confidence(predictions, criterion):
+    """Confidence of every row of (N, classes) probabilities, see CRITERIA."""
+    if criterion == "probability":
+        return predictions.max(axis=1)
+
+    top2 = np.partition(predictions, -2, axis=1)[:, -2:]
+    return top2[:, 1] - top2[:, 0]
+
+
+class CascadeHandler(NeuralNetHandler):
+    """
+    Args:
+        model_paths (list): Model files of the stages, cheapest first.
+        calibration (str | Path | None): JSON file written by `tools/cascade.py`,
+            giving the criterion and the thresholds.
+        thresholds (list | None): Otherwise, the confidence below which each stage
+            but the last escalates an image.
+        criterion (str): Otherwise, see CRITERIA.
+        cache_size (int): Size of the prediction cache of the cascade (0 disables it).
+        near_duplicate_threshold (float | None): See `PredictionCache`.
+        backend (str): Backend of every stage, see `NeuralNetHandler.BACKENDS`.
+        precision (str): Precision of every stage, see `gui.precision.PRECISIONS`.
+        stats_window (int): Number of recent calls the latency statistics cover.
+    """
+
+    def __init__(
+        self,
+        model_paths,
+        calibration=None,
+        thresholds=None,
+        criterion="probability",
+        cache_size=0,
+        near_duplicate_threshold=None,
+        backend="im2col",
+        precision="float32",
+        stats_window=1000,
+    ):
+        if len(model_paths) < 2:
+            raise ValueError("A cascade needs at least two models")
+
+        self.model_paths = [Path(path) for path in model_paths]
+        self.names = member_names(self.model_paths)
+
+        self.stages = [NeuralNetHandler(path, backend=backend, precision=precision) for path in self.model_paths]
+        self.label_mapping = check_label_mappings(self.names, self.stages)
+        self.input_shape = (28, 28)
+        self.dtype = compute_dtype(precision)
+
+        if calibration is not None:
+            criterion, thresholds = load_calibration(calibration, self.names)
+        if criterion not in CRITERIA:
+            raise ValueError(f"Unknown criterion {criterion}, expected one of {CRITERIA}")
+        if thresholds is None or len(thresholds) != len(self.stages) - 1:
+            raise ValueError(f"Expected {len(self.stages) - 1} thresholds, got {thresholds}")
+        self.criterion = criterion
+        self.thresholds = [float(threshold) for threshold in thresholds]
+
+        self.model_id = "|".join(stage.model_id for stage in self.stages) + f"|{criterion}:{self.thresholds}"
+
+        self.cache = None
+        if cache_size > 0:
+            self.cache = PredictionCache(cache_size, near_duplicate_threshold=near_duplicate_threshold)
+
+        self._stats_lock = threading.Lock()
+        self._latencies = [deque(maxlen=stats_window) for _ in range(len(self.stages) + 1)]
+        # Images that reached each stage
+        self._reached = np.zeros(len(self.stages), dtype=np.int64)
+
+    def _predict(self, batch):
+        start = time.perf_counter()
+        batch = np.asarray(batch, dtype=self.dtype).reshape(-1, 28, 28)
+
+        outputs = None
+        pending = np.arange(len(batch))
+        reached = []
+        elapsed = []
+
+        for i, stage in enumerate(self.stages):
+            reached.append(len(pending))
+            if len(pending) == 0:
+                break
+
+            stage_start = time.perf_counter()
+            # Only the escalated images are sent, as one smaller batch
+            predictions = stage.predict_normalized(batch if i == 0 else batch[pending])
+            elapsed.append(time.perf_counter() - stage_start)
+
+            if outputs is None:
+                outputs = np.array(predictions, dtype=np.float32)
+            else:
+                outputs[pending] = predictions
+
+            if i < len(self.thresholds):
+                pending = pending[confidence(predictions, self.criterion) < self.thresholds[i]]
+
+        with self._stats_lock:
+            self._reached[: len(reached)] += reached
+            for latencies, seconds in zip(self._latencies, elapsed):
+                latencies.append(seconds)
+            self._latencies[-1].append(time.perf_counter() - start)
+
+        return outputs
+
+    def summary(self):
+        """
+        Share of the images that reached each stage, and latency of each stage (when
+        it ran) and of the cascade over the recent calls.
+
+        Returns:
+            dict: {name: {"threshold", "reached", "p50_ms", "p95_ms"}, "cascade": {"p50_ms",
+            "p95_ms", "escalation_rate", "samples"}}
+        """
+        with self._stats_lock:
+            latencies = [np.array(window) * 1000 for window in self._latencies]
+            samples = max(int(self._reached[0]), 1)
+
+            summary = {}
+            for i, name in enumerate(self.names):
+                summary[name] = {
+                    "threshold": self.thresholds[i] if i < len(self.thresholds) else None,
+                    "reached": float(self._reached[i] / samples),
+                    **percentiles(latencies[i]),
+                }
+            summary["cascade"] = {
+                **percentiles(latencies[-1]),
+                "escalation_rate": float(self._reached[1] / samples),
+                "samples": int(self._reached[0]),
+            }
+
+        return summary
+
+    def report(self):
+        lines = [f"Cascade ({self.criterion}):"]
+        for name, stats in self.summary().items():
+            if name == "cascade":
+                lines.append(
+                    f"   {name:<24} p50 {stats['p50_ms']:7.2f} ms   p95 {stats['p95_ms']:7.2f} ms   "
+                    f"escalated {stats['escalation_rate']:.1%} of {stats['samples']} images"
+                )
+            else:
+                threshold = "" if stats["threshold"] is None else f"   threshold {stats['threshold']:.4f}"
+                lines.append(
+                    f"   {name:<24} p50 {stats['p50_ms']:7.2f} ms   p95 {stats['p95_ms']:7.2f} ms   "
+                    f"reached by {stats['reached']:.1%}{threshold}"
+                )
+
+        return "\n".join(lines)
+
+    def close(self):
+        # Stages holding a pool (EnsembleHandler) release it, plain models have nothing to release
+        for stage in self.stages:
+            close = getattr(stage, "close", None)
+            if close is not None:
+                close()
+
+    @property
+    def output_size(self):
+        return self.stages[0].output_size
+
+
+def calibrate(first, second, labels, target_accuracy):
+    """
+    Smallest escalation threshold of a two-stage cascade reaching a target accuracy.
+
+    Escalating the k least confident images gives an accuracy that can be computed
+    for every k at once from the cumulative sums of the per-image correctness of
+    both models, sorted by confidence.
+
+    Args:
+        first (np.ndarray): (N, classes) probabilities of the first model.
+        second (np.ndarray): (N, classes) probabilities of the second model.
+        labels (np.ndarray): Integer labels of shape (N,).
+        target_accuracy (float): Accuracy the cascade must reach.
+
+    Returns:
+        dict: {criterion: {"threshold", "accuracy", "escalation_rate"}} for every
+        criterion. If the target is out of reach, the most accurate threshold.
+    """
+    first_correct = first.argmax(axis=1) == labels
+    second_correct = second.argmax(axis=1) == labels
+    n = len(labels)
+
+    results = {}
+    for criterion in CRITERIA:
+        scores = confidence(first, criterion)
+        order = np.argsort(scores, kind="stable")
+        sorted_scores = scores[order]
+
+        # accuracy[k]: the k least confident images escalated
+        gained = np.concatenate([[0], np.cumsum(second_correct[order])])
+        lost = np.concatenate([[0], np.cumsum(first_correct[order])])
+        accuracy = (first_correct.sum() + gained - lost) / n
+
+        # Only cut between different scores, so that "score < threshold" escalates exactly k images
+        valid = np.concatenate([[True], sorted_scores[1:] > sorted_scores[:-1], [True]])
+        candidates = np.flatnonzero(valid & (accuracy >= target_accuracy))
+        k = int(candidates[0]) if len(candidates) else int(np.flatnonzero(valid)[np.argmax(accuracy[valid])])
+
+        if k == 0:
+            threshold = float(sorted_scores[0])
+        elif k == n:
+            threshold = float(np.nextafter(sorted_scores[-1], np.inf))
+        else:
+            threshold = float((sorted_scores[k - 1] + sorted_scores[k]) / 2)
+
+        results[criterion] = {"threshold": threshold, "accuracy": float(accuracy[k]), "escalation_rate": k / n}
+
+    return results
+
+
+def save_calibration(path, names, criterion, thresholds, report=None):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {"stages": list(names), "criterion": criterion, "thresholds": list(thresholds), "report": report or {}},
+            f,
+            indent=2,
+        )
+
+
+def load_calibration(path, names):
+    """(criterion, thresholds) of a JSON file written by `save_calibration`."""
+    with open(path) as f:
+        data = json.load(f)
+
+    if data["stages"] != list(names):
+        raise ValueError(f"{path} was calibrated for {data['stages']}, not for {list(names)}")
+
+    return data["criterion"], data["thresholds"]
@@ -0,0 +1,120 @@
+"""
+Batched Convolutional / MaxPooling2D inference kernels with reusable work buffers.
+
+Feature maps are kept channels-last (N, H, W, C) between these steps: the
+im2col matrix of a convolution is then gathered with K * K contiguous slice
+copies into a preallocated buffer, and the whole batch is convolved with a
+single matrix product written into another preallocated buffer. Buffers are
+allocated on the first call for a given batch size (and dtype) and reused
+afterwards, one set per thread, so the GUI worker and the server executor
+never share them.
+
+The arrays returned by a step are its work buffers: they are only valid until
+the next call from the same thread, which is fine inside an inference plan
+since each step consumes the output of the previous one.
+"""
+
+import threading
+
+import numpy as np
+
+
+class _WorkBuffers(threading.local):
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, name, shape, dtype=np.float32, zeros=False):
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = np.zeros(shape, dtype=dtype) if zeros else np.empty(shape, dtype=dtype)
+            self.arrays[name] = array
+        return array
+
+
+class Conv2D:
+    """
+    Convolution (with its bias and optional ReLU) from (N, H, W, C) to (N, H', W', O).
+    Kernels are stored in `dtype`, the output is computed in the wider of the
+    kernel and input dtypes (see gui/precision.py).
+    """
+
+    layout = "nhwc"
+
+    def __init__(self, kernels, biases, stride=1, padding=0, relu=False, dtype=np.float32):
+        out_channels, in_channels, kernel_size, _ = kernels.shape
+
+        # Rows ordered like the gathered patches: (ky, kx, c)
+        self.weights = np.ascontiguousarray(
+            kernels.transpose(2, 3, 1, 0).reshape(kernel_size * kernel_size * in_channels, out_channels),
+            dtype=dtype,
+        )
+        self.biases = np.asarray(biases, dtype=np.result_type(dtype, np.float32))
+        self.kernel_size = kernel_size
+        self.stride = stride
+        self.padding = padding
+        self.relu = relu
+
+        self._buffers = _WorkBuffers()
+
+    def __call__(self, x):
+        n, h, w, c = x.shape
+        k, s, p = self.kernel_size, self.stride, self.padding
+
+        if p > 0:
+            # Borders are zeroed once, only the interior is rewritten
+            padded = self._buffers.get("padded", (n, h + 2 * p, w + 2 * p, c), x.dtype, zeros=True)
+            padded[:, p : p + h, p : p + w] = x
+            x, h, w = padded, h + 2 * p, w + 2 * p
+
+        out_h = (h - k) // s + 1
+        out_w = (w - k) // s + 1
+
+        cols = self._buffers.get("cols", (n, out_h, out_w, k, k, c), x.dtype)
+        for ky in range(k):
+            for kx in range(k):
+                cols[:, :, :, ky, kx] = x[:, ky : ky + s * (out_h - 1) + 1 : s, kx : kx + s * (out_w - 1) + 1 : s]
+
+        out = self._buffers.get("out", (n * out_h * out_w, self.weights.shape[1]), np.result_type(x, self.weights))
+        np.matmul(cols.reshape(n * out_h * out_w, -1), self.weights, out=out)
+        out += self.biases
+        if self.relu:
+            np.maximum(out, 0, out=out)
+
+        return out.reshape(n, out_h, out_w, -1)
+
+
+class MaxPool2D:
+    """Max pooling from (N, H, W, C) to (N, H', W', C)."""
+
+    layout = "nhwc"
+
+    def __init__(self, pool_size=2, stride=None):
+        self.pool_size = pool_size
+        self.stride = stride if stride is not None else pool_size
+
+        self._buffers = _WorkBuffers()
+
+    def __call__(self, x):
+        n, h, w, c = x.shape
+        k, s = self.pool_size, self.stride
+        out_h = (h - k) // s + 1
+        out_w = (w - k) // s + 1
+
+        out = self._buffers.get("out", (n, out_h, out_w, c), x.dtype)
+        for py in range(k):
+            for px in range(k):
+                window = x[:, py : py + s * (out_h - 1) + 1 : s, px : px + s * (out_w - 1) + 1 : s]
+                if py == 0 and px == 0:
+                    np.copyto(out, window)
+                else:
+                    np.maximum(out, window, out=out)
+
+        return out
+
+
+def to_channels_last(x):
+    return x.transpose(0, 2, 3, 1)
+
+
+def to_channels_first(x):
+    return x.transpose(0, 3, 1, 2)
@@ -0,0 +1,323 @@
+"""
+Ensemble of several trained models behind the NeuralNetHandler interface.
+
+Every batch is sent to all the members concurrently and their probabilities
+are combined by a weighted mean: equal weights ("mean"), weights given by hand
+("weighted"), or weights fitted on validation data by `tools/ensemble.py`
+("learned", stored in a JSON file). The members run in a thread pool (NumPy
+releases the GIL in the matrix products) or in one process each, so the
+latency of the ensemble is close to that of its slowest member.
+"""
+
+import json
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from gui.labels import get_label_mapping
+from gui.neuralnethandler import NeuralNetHandler
+from gui.precision import compute_dtype
+from gui.predictioncache import PredictionCache
+
+EXECUTORS = ("thread", "process")
+
+# What the parent process needs to know of a member it does not load
+MemberInfo = namedtuple("MemberInfo", ["output_size", "model_id"])
+
+# Member handler of each worker process, set once by _init_member
+_member_handler = None
+
+
+def _init_member(model_path, backend, precision):
+    global _member_handler
+    _member_handler = NeuralNetHandler(model_path, backend=backend, precision=precision)
+
+
+def _member_info():
+    return MemberInfo(_member_handler.output_size, _member_handler.model_id)
+
+
+def _predict_member(batch):
+    start = time.perf_counter()
+    return _member_handler.predict_normalized(batch), time.perf_counter() - start
+
+
+class EnsembleHandler(NeuralNetHandler):
+    """
+    Args:
+        model_paths (list): Model files of the members (plain or quantized).
+        weights (list | str | Path | None): One weight per member, or a JSON file
+            written by `tools/ensemble.py`. Equal weights if None.
+        cache_size (int): Size of the prediction cache of the ensemble (0 disables it).
+        near_duplicate_threshold (float | None): See `PredictionCache`.
+        backend (str): Backend of every member, see `NeuralNetHandler.BACKENDS`.
+        precision (str): Precision of every member, see `gui.precision.PRECISIONS`.
+        executor (str): "thread" or "process", see EXECUTORS.
+        stats_window (int): Number of recent calls the latency statistics cover.
+    """
+
+    def __init__(
+        self,
+        model_paths,
+        weights=None,
+        cache_size=0,
+        near_duplicate_threshold=None,
+        backend="im2col",
+        precision="float32",
+        executor="thread",
+        stats_window=1000,
+    ):
+        if len(model_paths) < 2:
+            raise ValueError("An ensemble needs at least two models")
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, expected one of {EXECUTORS}")
+
+        self.model_paths = [Path(path) for path in model_paths]
+        self.names = member_names(self.model_paths)
+
+        self.executor = executor
+        if executor == "thread":
+            self.members = [NeuralNetHandler(path, backend=backend, precision=precision) for path in self.model_paths]
+            self.member_info = [MemberInfo(member.output_size, member.model_id) for member in self.members]
+            self._pool = ThreadPoolExecutor(len(self.members), thread_name_prefix="ensemble")
+            # model.predict keeps per-call state in its layers, one call per member at a time
+            self._locks = [threading.Lock() for _ in self.members]
+        else:
+            # One process per member, so each keeps its own model loaded. Members are
+            # only loaded there (in parallel), the checks below ask the workers.
+            self.members = None
+            self._pool = [
+                ProcessPoolExecutor(1, initializer=_init_member, initargs=(path, backend, precision))
+                for path in self.model_paths
+            ]
+            futures = [pool.submit(_member_info) for pool in self._pool]
+            self.member_info = [future.result() for future in futures]
+
+        self.label_mapping = check_label_mappings(self.names, self.member_info)
+        self.input_shape = (28, 28)
+        self.dtype = compute_dtype(precision)
+
+        if weights is None:
+            self.combination = "mean"
+            weights = np.ones(len(self.model_paths))
+        elif isinstance(weights, (str, Path)):
+            self.combination = "learned"
+            weights = load_weights(weights, self.names)
+        else:
+            self.combination = "weighted"
+        self.weights = _normalize_weights(weights, len(self.model_paths))
+
+        self.model_id = "|".join(info.model_id for info in self.member_info) + f"|{self.weights.tolist()}"
+
+        self.cache = None
+        if cache_size > 0:
+            self.cache = PredictionCache(cache_size, near_duplicate_threshold=near_duplicate_threshold)
+
+        self._stats_lock = threading.Lock()
+        self._latencies = [deque(maxlen=stats_window) for _ in range(len(self.model_paths) + 1)]
+        self._agreements = np.zeros(len(self.model_paths), dtype=np.int64)
+        self._unanimous = 0
+        self._samples = 0
+
+    def _predict(self, batch):
+        start = time.perf_counter()
+        predictions, elapsed = self._run_members(batch)
+        combined = np.tensordot(self.weights, predictions, axes=1).astype(np.float32)
+
+        self._record(predictions, combined, elapsed, time.perf_counter() - start)
+        return combined
+
+    def predict_members(self, batch):
+        """(members, N, classes) probabilities of every member for a normalized batch, not combined."""
+        return self._run_members(batch)[0]
+
+    def _run_members(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=self.dtype).reshape(-1, 28, 28)
+
+        if self.executor == "thread":
+            futures = [self._pool.submit(self._predict_member, i, batch) for i in range(len(self.members))]
+        else:
+            futures = [pool.submit(_predict_member, batch) for pool in self._pool]
+        outputs, elapsed = zip(*(future.result() for future in futures))
+
+        return np.stack(outputs), elapsed
+
+    def _predict_member(self, i, batch):
+        start = time.perf_counter()
+        with self._locks[i]:
+            prediction = self.members[i].predict_normalized(batch)
+        return prediction, time.perf_counter() - start
+
+    def _record(self, predictions, combined, elapsed, total):
+        member_labels = predictions.argmax(axis=2)
+        agree = member_labels == combined.argmax(axis=1)
+
+        with self._stats_lock:
+            for latencies, seconds in zip(self._latencies, (*elapsed, total)):
+                latencies.append(seconds)
+            self._agreements += agree.sum(axis=1)
+            self._unanimous += int(np.all(member_labels == member_labels[0], axis=0).sum())
+            self._samples += combined.shape[0]
+
+    def summary(self):
+        """
+        Latency of every member and of the ensemble over the recent calls, and how
+        often each member agreed with the ensemble's top class.
+
+        Returns:
+            dict: {name: {"weight", "p50_ms", "p95_ms", "agreement"}, "ensemble": {"p50_ms",
+            "p95_ms", "unanimous", "samples"}}
+        """
+        with self._stats_lock:
+            latencies = [np.array(window) * 1000 for window in self._latencies]
+            samples = max(self._samples, 1)
+
+            summary = {}
+            for name, weight, window, agreements in zip(self.names, self.weights, latencies, self._agreements):
+                summary[name] = {
+                    "weight": float(weight),
+                    **percentiles(window),
+                    "agreement": float(agreements / samples),
+                }
+            summary["ensemble"] = {
+                **percentiles(latencies[-1]),
+                "unanimous": self._unanimous / samples,
+                "samples": self._samples,
+            }
+
+        return summary
+
+    def report(self):
+        lines = [f"Ensemble ({self.combination}, {self.executor} pool):"]
+        for name, stats in self.summary().items():
+            if name == "ensemble":
+                lines.append(
+                    f"   {name:<24} p50 {stats['p50_ms']:7.2f} ms   p95 {stats['p95_ms']:7.2f} ms   "
+                    f"unanimous on {stats['unanimous']:.1%} of {stats['samples']} images"
+                )
+            else:
+                lines.append(
+                    f"   {name:<24} p50 {stats['p50_ms']:7.2f} ms   p95 {stats['p95_ms']:7.2f} ms   "
+                    f"weight {stats['weight']:.3f}   agrees {stats['agreement']:.1%}"
+                )
+
+        return "\n".join(lines)
+
+    def close(self):
+        pools = [self._pool] if self.executor == "thread" else self._pool
+        for pool in pools:
+            pool.shutdown(cancel_futures=True)
+
+    @property
+    def output_size(self):
+        return self.member_info[0].output_size
+
+
+def load_handler(model_paths, weights=None, cascade=None, **options):
+    """
+    A NeuralNetHandler for a single model, an EnsembleHandler for several, or a
+    CascadeHandler if a cascade calibration file is given. Extra keyword arguments
+    (cache_size, backend, ...) are passed to the handler.
+    """
+    if cascade is not None:
+        # Imported here, gui.cascade depends on this module
+        from gui.cascade import CascadeHandler
+
+        return CascadeHandler(model_paths, calibration=cascade, **options)
+
+    if len(model_paths) > 1:
+        return EnsembleHandler(model_paths, weights=weights, **options)
+
+    return NeuralNetHandler(model_paths[0], **options)
+
+
+def fit_weights(predictions, labels, steps=300, learning_rate=1.0):
+    """
+    Learns the member weights maximizing the log-likelihood of the weighted mean
+    of their probabilities. Weights are kept positive and summing to one through
+    a softmax over their logits.
+
+    Args:
+        predictions (np.ndarray): Member probabilities of shape (members, N, classes).
+        labels (np.ndarray): Integer labels of shape (N,).
+
+    Returns:
+        np.ndarray: Weights of shape (members,).
+    """
+    # Probability each member gives to the right class, (members, N)
+    correct = np.asarray(predictions, dtype=np.float64)[:, np.arange(len(labels)), labels]
+    logits = np.zeros(correct.shape[0])
+
+    for _ in range(steps):
+        weights = np.exp(logits - logits.max())
+        weights /= weights.sum()
+
+        mixture = weights @ correct + 1e-12
+        gradient = (correct / mixture).mean(axis=1)
+        logits += learning_rate * weights * (gradient - weights @ gradient)
+
+    weights = np.exp(logits - logits.max())
+    return weights / weights.sum()
+
+
+def save_weights(path, names, weights):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"members": list(names), "weights": [float(w) for w in weights]}, f, indent=2)
+
+
+def load_weights(path, names):
+    """Weights of a JSON file written by `save_weights`, in the order of names."""
+    with open(path) as f:
+        data = json.load(f)
+
+    learned = dict(zip(data["members"], data["weights"]))
+    missing = [name for name in names if name not in learned]
+    if missing or len(learned) != len(names):
+        raise ValueError(f"{path} has weights for {data['members']}, not for {list(names)}")
+
+    return [learned[name] for name in names]
+
+
+def member_names(paths):
+    """File names, with their parent directory when two members share a name."""
+    names = [path.stem for path in paths]
+    if len(set(names)) < len(names):
+        names = [f"{path.parent.name}/{path.stem}" for path in paths]
+    return names
+
+
+def check_label_mappings(names, members):
+    """All the members must predict the same classes, in the same order."""
+    mappings = [get_label_mapping(member.output_size) for member in members]
+
+    for name, mapping in zip(names[1:], mappings[1:]):
+        if mapping != mappings[0]:
+            raise ValueError(
+                f"Members predict different classes: {names[0]} has {members[0].output_size} "
+                f"({''.join(mappings[0].values())[:12]}...), {name} has {len(mapping)} "
+                f"({''.join(mapping.values())[:12]}...)"
+            )
+
+    return mappings[0]
+
+
+def _normalize_weights(weights, count):
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (count,):
+        raise ValueError(f"Expected {count} weights, got {weights.size}")
+    if np.any(weights < 0) or weights.sum() <= 0:
+        raise ValueError("Weights must be non-negative, and not all zero")
+
+    return weights / weights.sum()
+
+
+def percentiles(window):
+    """p50 and p95 of a window of latencies in milliseconds."""
+    if len(window) == 0:
+        return {"p50_ms": 0.0, "p95_ms": 0.0}
+    return {"p50_ms": float(np.percentile(window, 50)), "p95_ms": float(np.percentile(window, 95))}
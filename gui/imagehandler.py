@@ -1,73 +1,213 @@
-from PIL import Image, ImageDraw
+from PIL import Image, ImageColor, ImageDraw
 from pathlib import Path
 import numpy as np
-import scipy.ndimage as ndi
+
+# "canvas" draws every stroke into a canvas-sized image, "vector" keeps the
+# strokes and only rasterizes the inked region, at most VECTOR_RASTER_SIZE wide
+RASTERIZATIONS = ("canvas", "vector")
+# The region is then resized to 20x20, so strokes are still downsampled (and
+# anti-aliased) about 10 times: preprocessed images differ from the canvas
+# ones about as much as when the same drawing is shifted by one pixel
+VECTOR_RASTER_SIZE = 192
+
+
+def center_of_mass(image):
+    """
+    (row, column) center of mass of a 2D image, same as scipy.ndimage.center_of_mass
+    (importing scipy.ndimage alone would take longer than the rest of the startup).
+    """
+    data = np.asarray(image, dtype=np.float64)
+    total = data.sum()
+
+    return (
+        np.arange(data.shape[0]) @ data.sum(axis=1) / total,
+        np.arange(data.shape[1]) @ data.sum(axis=0) / total,
+    )
+
+
+def preprocess(base_img):
+    """
+    Turns a grayscale drawing (white ink on black) of any size into the
+    28x28 centered image the neural network expects. None stands for an
+    empty drawing.
+    """
+    if base_img is None:
+        return Image.new('L', (28, 28))
+
+    # Converting image to numpy array to crop it
+    base_img_data = np.asarray(base_img)
+    try:
+        non_empty_columns = np.where(base_img_data.max(axis=0) > 0)[0]
+        non_empty_rows = np.where(base_img_data.max(axis=1) > 0)[0]
+        cropBox = (min(non_empty_rows), max(non_empty_rows), min(non_empty_columns), max(non_empty_columns))
+
+        base_img_data_cropped = base_img_data[cropBox[0]:cropBox[1]+1, cropBox[2]:cropBox[3]+1]
+        cropped_img = Image.fromarray(base_img_data_cropped)
+    except ValueError: # Handle case where image is empty
+        return Image.new('L', (28, 28))
+
+    if cropped_img.size[0] <= 1 and cropped_img.size[1] <= 1:
+        return Image.new('L', (28, 28))
+
+    # Resizing image to (20, 20) while keeping aspect ratio
+    percent = min(20 / float(cropped_img.size[0]), 20 / float(cropped_img.size[1]))
+    # (at least 1 pixel, very thin strokes would otherwise round down to an empty image)
+    wsize = max(int((float(cropped_img.size[0]) * float(percent))), 1)
+    hsize = max(int((float(cropped_img.size[1]) * float(percent))), 1)
+    resized_img = cropped_img.resize((wsize, hsize), Image.Resampling.LANCZOS)
+
+    # Finding center of mass of image
+    cy, cx = center_of_mass(resized_img)
+
+    # Creating a (28, 28) image and pasting the old one at the center of the new one
+    final_img = Image.new('L', (28, 28))
+    final_img.paste(resized_img, (int(final_img.size[0]/2 - round(cx)), int(final_img.size[1]/2 - round(cy))))
+
+    return final_img
+
 
 class ImageHandler():
 
-    def __init__(self, root, canvas):
-        self.root = root
-        self.canvas = canvas
-        
-        # Get canvas size and create a PIL image and a draw object
-        self.canvas_width = self.canvas.winfo_width()
-        self.canvas_height = self.canvas.winfo_height()
-        self.pil_image = Image.new("L", (self.canvas_width, self.canvas_height), "black")
-        self.draw = ImageDraw.Draw(self.pil_image)
-        
+    def __init__(self, canvas_width, canvas_height, rasterization="canvas"):
+        if rasterization not in RASTERIZATIONS:
+            raise ValueError(f"Unknown rasterization {rasterization}, expected one of {RASTERIZATIONS}")
+
+        # Nothing here depends on Tk, so the handler also runs headless (batch, benchmarks)
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.rasterization = rasterization
+
+        if rasterization == "canvas":
+            # A PIL image of the canvas size and a draw object
+            self.pil_image = Image.new("L", (self.canvas_width, self.canvas_height), "black")
+            self.draw = ImageDraw.Draw(self.pil_image)
+        else:
+            # (x0, y0, x1, y1, width, ink) segments, rasterized by snapshot: memory and
+            # snapshot cost depend on the drawing, not on the canvas size
+            self.pil_image = None
+            self.draw = None
+            self._segments = []
+
+        # Region pixels per canvas pixel of the last snapshot: 1 on the canvas,
+        # below 1 for drawings larger than VECTOR_RASTER_SIZE in vector mode
+        self.snapshot_scale = 1.0
+
+        # Running (left, top, right, bottom) box around all the ink drawn so far,
+        # None while the image is empty. It can be larger than the ink itself
+        # (stroke margins, erased strokes) and is tightened by update.
+        self.bbox = None
+
         # This is the final processed image that the neural net will use
         self.image = Image.new('L', (28, 28))
 
     def add_line(self, old_x, old_y, x, y, width, color):
-        """Draws a line on the in-memory PIL image."""
+        """Draws a line on the in-memory PIL image (stores it in vector mode)."""
         # This check is crucial to avoid drawing a line from (None, None)
         if old_x is not None and old_y is not None:
-            self.draw.line([old_x, old_y, x, y], fill=color, width=int(width), joint="curve")
+            ink = ImageColor.getcolor(color, "L")
+            if self.draw is not None:
+                self.draw.line([old_x, old_y, x, y], fill=ink, width=int(width), joint="curve")
+            else:
+                self._segments.append((old_x, old_y, x, y, width, ink))
+
+            # Eraser strokes can only remove ink, so they leave the box as it is and
+            # the next update rescans it. Pen strokes grow it by the line extent.
+            if ink > 0:
+                self._grow_bbox(old_x, old_y, x, y, width)
+
+    def _grow_bbox(self, old_x, old_y, x, y, width):
+        margin = int(width) // 2 + 2
+        stroke_box = (
+            max(int(min(old_x, x)) - margin, 0),
+            max(int(min(old_y, y)) - margin, 0),
+            min(int(max(old_x, x)) + margin + 1, self.canvas_width),
+            min(int(max(old_y, y)) + margin + 1, self.canvas_height),
+        )
+        # Segments entirely off the canvas leave no ink
+        if stroke_box[0] >= stroke_box[2] or stroke_box[1] >= stroke_box[3]:
+            return
+
+        if self.bbox is None:
+            self.bbox = stroke_box
+        else:
+            self.bbox = (
+                min(self.bbox[0], stroke_box[0]),
+                min(self.bbox[1], stroke_box[1]),
+                max(self.bbox[2], stroke_box[2]),
+                max(self.bbox[3], stroke_box[3]),
+            )
 
     def clear(self):
         """Clears the in-memory PIL image."""
-        self.draw.rectangle([0, 0, self.canvas_width, self.canvas_height], fill="black")
+        if self.draw is None:
+            self._segments.clear()
+        elif self.bbox is not None:
+            self.draw.rectangle(self.bbox, fill="black")
+        self.bbox = None
         self.image = Image.new('L', (28, 28))
 
-    def update(self):
+    def snapshot(self):
         """
-        Processes the in-memory PIL image to create the 28x28 centered image
-        for the neural network.
+        Returns a copy of the inked region of the in-memory PIL image as a numpy
+        array, or None if nothing is drawn. Only the region inside the running
+        bounding box is read, so the cost depends on the drawing size, not on the
+        canvas size. The copy can safely be preprocessed on another thread.
+
+        In vector mode the region is rasterized at `snapshot_scale` of the canvas
+        resolution.
         """
-        base_img = self.pil_image
-
-        # Converting image to numpy array to crop it
-        base_img_data = np.asarray(base_img)
-        try:
-            non_empty_columns = np.where(base_img_data.max(axis=0) > 0)[0]
-            non_empty_rows = np.where(base_img_data.max(axis=1) > 0)[0]
-            cropBox = (min(non_empty_rows), max(non_empty_rows), min(non_empty_columns), max(non_empty_columns))
-            
-            base_img_data_cropped = base_img_data[cropBox[0]:cropBox[1]+1, cropBox[2]:cropBox[3]+1]
-            cropped_img = Image.fromarray(base_img_data_cropped)
-        except ValueError: # Handle case where image is empty
-            self.image = Image.new('L', (28, 28))
-            return
+        if self.bbox is None or self.bbox[0] >= self.bbox[2] or self.bbox[1] >= self.bbox[3]:
+            return None
 
-        if cropped_img.size[0] <= 1 and cropped_img.size[1] <= 1:
-            self.image = Image.new('L', (28, 28))
-            return
+        left, top, _, _ = self.bbox
+        if self.draw is None:
+            region, scale = self._rasterize_segments()
+        else:
+            region, scale = np.asarray(self.pil_image.crop(self.bbox)), 1.0
+
+        # Tighten the box to the actual ink, dropping erased strokes and margins
+        non_empty_columns = np.where(region.max(axis=0) > 0)[0]
+        non_empty_rows = np.where(region.max(axis=1) > 0)[0]
+        if len(non_empty_rows) == 0:
+            # Everything was erased
+            if self.draw is None:
+                self._segments.clear()
+            self.bbox = None
+            return None
+
+        self.snapshot_scale = scale
+        self.bbox = (
+            left + int(non_empty_columns[0] / scale),
+            top + int(non_empty_rows[0] / scale),
+            min(left + int(np.ceil((non_empty_columns[-1] + 1) / scale)), self.canvas_width),
+            min(top + int(np.ceil((non_empty_rows[-1] + 1) / scale)), self.canvas_height),
+        )
+        return region[non_empty_rows[0]:non_empty_rows[-1] + 1, non_empty_columns[0]:non_empty_columns[-1] + 1]
 
-        # Resizing image to (20, 20) while keeping aspect ratio
-        percent = min(20 / float(cropped_img.size[0]), 20 / float(cropped_img.size[1]))
-        wsize = int((float(cropped_img.size[0]) * float(percent)))
-        hsize = int((float(cropped_img.size[1]) * float(percent)))
-        resized_img = cropped_img.resize((wsize, hsize), Image.Resampling.LANCZOS)
+    def _rasterize_segments(self):
+        """Draws the segments inside the bounding box, scaled down to VECTOR_RASTER_SIZE."""
+        left, top, right, bottom = self.bbox
+        scale = min(1.0, VECTOR_RASTER_SIZE / max(right - left, bottom - top))
 
-        # Finding center of mass of image
-        cy, cx = ndi.center_of_mass(resized_img)
+        image = Image.new("L", (max(round((right - left) * scale), 1), max(round((bottom - top) * scale), 1)))
+        draw = ImageDraw.Draw(image)
+        for x0, y0, x1, y1, width, ink in self._segments:
+            draw.line(
+                [(x0 - left) * scale, (y0 - top) * scale, (x1 - left) * scale, (y1 - top) * scale],
+                fill=ink,
+                width=max(round(width * scale), 1),
+                joint="curve",
+            )
 
-        # Creating a (28, 28) image and pasting the old one at the center of the new one
-        final_img = Image.new('L', (28, 28))
-        final_img.paste(resized_img, (int(final_img.size[0]/2 - round(cx)), int(final_img.size[1]/2 - round(cy))))
+        return np.asarray(image), scale
+
+    def update(self):
+        """
+        Processes the in-memory PIL image to create the 28x28 centered image
+        for the neural network.
+        """
+        self.image = preprocess(self.snapshot())
 
-        self.image = final_img
-    
     def save(self):
         Path("output").mkdir(parents=True, exist_ok=True)
         self.image.save("output/image.jpg", quality=100)
\ No newline at end of file
@@ -0,0 +1,314 @@
+"""
+Inference-only compilation of a trained model.
+
+At inference time, BatchNormalization is a per-channel affine transform and
+Dropout is the identity. `compile_plan` folds every BatchNormalization into the
+weights of the preceding Dense / Convolutional layer, drops Dropout and applies
+ReLU in place right after the layer it follows, so a Dense -> BN -> ReLU ->
+Dropout block costs a single matmul and an in-place maximum.
+
+Convolutional and MaxPooling2D layers run on one of two backends:
+
+- "tensordot": the library's own im2col view and tensordot, channels-first.
+- "im2col": `gui.convolution`, channels-last with reused work buffers.
+
+Weights are stored and products computed in the dtypes of a precision (see
+gui/precision.py), float32 by default.
+"""
+
+import numpy as np
+
+from mpneuralnetwork.activations import ReLU, Softmax
+from mpneuralnetwork.layers import (
+    BatchNormalization,
+    BatchNormalization2D,
+    Convolutional,
+    Dense,
+    Dropout,
+    Flatten,
+    MaxPooling2D,
+)
+from mpneuralnetwork.layers.utils import im2col
+
+from gui.convolution import Conv2D, MaxPool2D, to_channels_first, to_channels_last
+from gui.precision import compute_dtype, storage_dtype
+
+CONV_BACKENDS = ("tensordot", "im2col")
+
+
+class InferencePlan:
+    """
+    A sequence of steps, each a function of the batch. Unlike `Model.predict`,
+    steps keep no per-call state on the layers.
+    """
+
+    def __init__(self, steps, output_activation, dtype=np.float32):
+        self.steps = steps
+        self.output_activation = output_activation
+        # Dtype the inputs are computed in
+        self.dtype = np.dtype(dtype)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=self.dtype)
+        for step in self.steps:
+            x = step(x)
+
+        return self.output_activation(x)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def max_difference(self, model, input_shape, samples=16, seed=0):
+        """
+        Largest absolute difference between the plan and `model.predict` outputs
+        on random inputs in [0, 1] of shape (samples, *input_shape).
+        """
+        x = np.random.default_rng(seed).random((samples, *input_shape), dtype=np.float32)
+        return float(np.max(np.abs(self(x) - model.predict(x))))
+
+
+def compile_plan(model, conv_backend="tensordot", precision="float32"):
+    """
+    Builds the InferencePlan of a model, with its weights stored in the given
+    precision. Layers it does not know run as they are.
+    """
+    if conv_backend not in CONV_BACKENDS:
+        raise ValueError(f"Unknown convolution backend {conv_backend}, expected one of {CONV_BACKENDS}")
+
+    storage, compute = storage_dtype(precision), compute_dtype(precision)
+
+    steps = []
+    layers = list(model.layers)
+    i = 0
+
+    while i < len(layers):
+        layer = layers[i]
+        i += 1
+
+        if isinstance(layer, Dropout):
+            continue
+
+        if isinstance(layer, (Dense, Convolutional)):
+            weights, biases, i = _folded_params(layers, i)
+
+            j = _skip_dropout(layers, i)
+            relu = j < len(layers) and isinstance(layers[j], ReLU)
+            if relu:
+                i = j + 1
+
+            if isinstance(layer, Dense):
+                steps.append(_dense_step(weights, biases, relu, storage, compute))
+            elif conv_backend == "im2col":
+                steps.append(Conv2D(weights, biases, layer.stride, layer.padding, relu, storage))
+            else:
+                steps.append(_conv_step(weights, biases, layer.stride, layer.padding, relu, storage, compute))
+
+        elif isinstance(layer, (BatchNormalization, BatchNormalization2D)):
+            scale, shift = _batchnorm_affine(layer)
+            scale, shift = scale.astype(compute), shift.astype(compute)
+            if isinstance(layer, BatchNormalization2D):
+                scale, shift = scale[:, None, None], shift[:, None, None]
+            steps.append(lambda x, scale=scale, shift=shift: x * scale + shift)
+
+        elif isinstance(layer, ReLU):
+            steps.append(_relu)
+
+        elif isinstance(layer, MaxPooling2D):
+            if conv_backend == "im2col":
+                steps.append(MaxPool2D(layer.pool_size, layer.stride))
+            else:
+                steps.append(_max_pool_step(layer.pool_size, layer.stride))
+
+        elif isinstance(layer, Flatten):
+            steps.append(lambda x: x.reshape(x.shape[0], -1))
+
+        else:
+            steps.append(lambda x, layer=layer: layer.forward(x, training=False))
+
+    if isinstance(model.output_activation, Softmax):
+        output_activation = _softmax
+    elif model.output_activation is None:
+        output_activation = _identity
+    else:
+        output_activation = lambda x, activation=model.output_activation: activation.forward(x)
+
+    return InferencePlan(_convert_layouts(steps), output_activation, compute)
+
+
+def fold_model(model):
+    """
+    Inference-only version of a model: every BatchNormalization directly
+    following a Dense / Convolutional layer is folded into its weights and
+    Dropout is dropped. The plan of the folded model needs no copy of its
+    weights.
+
+    Returns:
+        tuple: (layer configs, arrays) where arrays holds float32 parameters and
+        states under the `save_model` keys ("layer_{i}_{param}", "layer_{i}_state_{name}").
+        Biases are stored per output channel.
+    """
+    configs = []
+    arrays = {}
+    layers = list(model.layers)
+    i = 0
+
+    while i < len(layers):
+        layer = layers[i]
+        i += 1
+
+        if isinstance(layer, Dropout):
+            continue
+
+        index = len(configs)
+        config = layer.get_config()
+
+        if isinstance(layer, (Dense, Convolutional)):
+            weights, biases, i = _folded_params(layers, i)
+            name = "weights" if isinstance(layer, Dense) else "kernels"
+            arrays[f"layer_{index}_{name}"] = weights.astype(np.float32)
+            arrays[f"layer_{index}_biases"] = biases.astype(np.float32)
+            config["no_bias"] = False
+        else:
+            for name, (param, _) in getattr(layer, "params", {}).items():
+                arrays[f"layer_{index}_{name}"] = np.asarray(param, dtype=np.float32)
+            for name, value in getattr(layer, "state", {}).items():
+                arrays[f"layer_{index}_state_{name}"] = np.asarray(value, dtype=np.float32)
+
+        configs.append(config)
+
+    return configs, arrays
+
+
+def _convert_layouts(steps):
+    """
+    Inserts transposes where steps working on channels-last feature maps
+    (`layout = "nhwc"`) meet steps expecting channels-first ones. Layout
+    agnostic steps (ReLU) keep the current layout.
+    """
+    converted = []
+    current = "nchw"
+
+    for step in steps:
+        layout = None if step is _relu else getattr(step, "layout", "nchw")
+
+        if layout is not None and layout != current:
+            converted.append(to_channels_last if layout == "nhwc" else to_channels_first)
+            current = layout
+        converted.append(step)
+
+    if current != "nchw":
+        converted.append(to_channels_first)
+
+    return converted
+
+
+def _skip_dropout(layers, i):
+    while i < len(layers) and isinstance(layers[i], Dropout):
+        i += 1
+    return i
+
+
+def _linear_params(layer):
+    """
+    Weights and per-output-channel biases (zeros without bias), as views of the
+    layer arrays when possible (memory-mapped models share them across processes).
+    """
+    if isinstance(layer, Dense):
+        weights = np.asarray(layer.weights)
+        out_channels = weights.shape[1]
+    else:
+        weights = np.asarray(layer.kernels)
+        out_channels = weights.shape[0]
+
+    if layer.no_bias:
+        biases = np.zeros(out_channels, dtype=np.float32)
+    else:
+        biases = np.asarray(layer.biases).reshape(out_channels)
+
+    return weights, biases
+
+
+def _folded_params(layers, i):
+    """
+    Parameters of the Dense / Convolutional layers[i - 1] with the BatchNormalization
+    that directly follows folded in (as float64 then, Dropout in between is
+    skipped), and the index of the next layer.
+    """
+    layer = layers[i - 1]
+    weights, biases = _linear_params(layer)
+
+    j = _skip_dropout(layers, i)
+    if j < len(layers) and isinstance(layers[j], (BatchNormalization, BatchNormalization2D)):
+        scale, shift = _batchnorm_affine(layers[j])
+        if isinstance(layer, Dense):
+            weights = weights * scale
+        else:
+            weights = weights * scale[:, None, None, None]
+        biases = biases * scale + shift
+        i = j + 1
+
+    return weights, biases, i
+
+
+def _batchnorm_affine(layer):
+    """(scale, shift) per channel such that BN(x) = x * scale + shift at inference."""
+    gamma = np.asarray(layer.gamma, dtype=np.float64).ravel()
+    beta = np.asarray(layer.beta, dtype=np.float64).ravel()
+    mean = np.asarray(layer.cache_m, dtype=np.float64).ravel()
+    var = np.asarray(layer.cache_v, dtype=np.float64).ravel()
+
+    scale = gamma / np.sqrt(var + layer.epsilon)
+    return scale, beta - mean * scale
+
+
+def _dense_step(weights, biases, relu, storage=np.float32, compute=np.float32):
+    # float16 weights are converted to float32 by every product (see gui/precision.py)
+    weights = weights.astype(storage, copy=False)
+    biases = biases.astype(compute, copy=False)
+
+    def step(x):
+        y = x @ weights
+        y += biases
+        if relu:
+            np.maximum(y, 0, out=y)
+        return y
+
+    return step
+
+
+def _conv_step(kernels, biases, stride, padding, relu, storage=np.float32, compute=np.float32):
+    kernels = kernels.astype(storage, copy=False)
+    biases = biases.astype(compute, copy=False)
+    kernel_size = kernels.shape[2]
+
+    def step(x):
+        if padding > 0:
+            x = np.pad(x, ((0, 0), (0, 0), (padding, padding), (padding, padding)))
+
+        y = np.tensordot(im2col(x, kernel_size, stride), kernels, axes=((3, 4, 5), (1, 2, 3)))
+        y += biases
+        if relu:
+            np.maximum(y, 0, out=y)
+        return y.transpose(0, 3, 1, 2)
+
+    return step
+
+
+def _max_pool_step(pool_size, stride):
+    def step(x):
+        return im2col(x, pool_size, stride).max(axis=(4, 5)).transpose(0, 3, 1, 2)
+
+    return step
+
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _identity(x):
+    return x
@@ -0,0 +1,91 @@
+import threading
+import time
+import traceback
+
+
+class InferenceWorker:
+    """
+    Runs a processing function on a background thread, one job at a time.
+
+    Only the newest submitted job is kept: submitting while a job is waiting
+    replaces it, so the worker never falls behind the user. Results are not
+    delivered from the worker thread (Tk is not thread safe), the GUI collects
+    them with `poll` from its own event loop.
+    """
+
+    MIN_INTERVAL_MS = 16
+    MAX_INTERVAL_MS = 250
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self, process):
+        self._process = process
+
+        self._condition = threading.Condition()
+        self._pending = None
+        self._result = None
+        self._stopped = False
+
+        # Exponential moving average of the processing time, in seconds
+        self.latency = None
+
+        self._thread = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def submit(self, job):
+        """Queues a job, dropping the previous one if it has not been started yet."""
+        with self._condition:
+            self._pending = (job,)
+            self._condition.notify()
+
+    def poll(self):
+        """Returns the latest finished result (only once), or None."""
+        with self._condition:
+            result, self._result = self._result, None
+
+        return result
+
+    def interval_ms(self):
+        """
+        Suggested minimum delay between two submissions: there is no point in
+        sending snapshots faster than the worker can process them.
+        """
+        if self.latency is None:
+            return self.MIN_INTERVAL_MS
+
+        interval = int(self.latency * 1000 * 1.2)
+        return max(self.MIN_INTERVAL_MS, min(interval, self.MAX_INTERVAL_MS))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+
+                if self._stopped:
+                    return
+
+                (job,), self._pending = self._pending, None
+
+            start = time.perf_counter()
+            try:
+                result = self._process(job)
+            except Exception:
+                # Keep the worker alive, the next snapshot will be processed normally
+                traceback.print_exc()
+                continue
+            elapsed = time.perf_counter() - start
+
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += self.LATENCY_SMOOTHING * (elapsed - self.latency)
+
+            with self._condition:
+                self._result = result
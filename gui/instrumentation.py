@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+
+# Returned by disabled profilers: entering and leaving it does nothing
+_NULL_STAGE = nullcontext()
+
+
+class Profiler:
+    """
+    Records how long each stage of the hot path takes.
+
+    Timings go into a fixed-size ring buffer (old ones are dropped), appended from
+    any thread without locking. When disabled, `stage` returns a shared no-op
+    context manager and nothing is recorded.
+
+        with profiler.stage("predict"):
+            ...
+    """
+
+    def __init__(self, enabled=False, capacity=20000):
+        self.enabled = enabled
+        self.events = deque(maxlen=capacity)
+        self._origin = time.perf_counter()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self.events, name)
+
+    def record(self, name, start, end):
+        """Records a stage measured by the caller (perf_counter timestamps)."""
+        if self.enabled:
+            self.events.append((name, start, end, threading.get_ident()))
+
+    def summary(self, last=None):
+        """
+        Rolling percentiles of each stage over the `last` most recent events
+        (all of them by default).
+
+        Returns:
+            dict: {stage: {"p50_ms", "p95_ms", "count"}}, in first-seen order.
+        """
+        events = list(self.events)[-last:] if last else list(self.events)
+
+        durations = {}
+        for name, start, end, _ in events:
+            durations.setdefault(name, []).append(end - start)
+
+        summary = {}
+        for name, values in durations.items():
+            p50, p95 = np.percentile(np.array(values) * 1000, [50, 95])
+            summary[name] = {"p50_ms": float(p50), "p95_ms": float(p95), "count": len(values)}
+
+        return summary
+
+    def dump(self, path):
+        """
+        Writes the recorded events as a Chrome trace (JSON), which can be opened
+        in chrome://tracing or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        trace = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, end, tid in list(self.events)
+        ]
+        trace += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in thread_names.items()
+        ]
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+class _Stage:
+    __slots__ = ("events", "name", "start")
+
+    def __init__(self, events, name):
+        self.events = events
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.events.append((self.name, self.start, time.perf_counter(), threading.get_ident()))
+        return False
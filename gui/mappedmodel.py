@@ -0,0 +1,147 @@
+"""
+Memory-mapped model files.
+
+Loading a `.npz` model decompresses every array into the private memory of the
+process, so each server worker or GUI instance holds its own copy of the
+weights. A mapped model file is laid out to be used in place:
+
+    MAGIC (8 bytes) | header size (uint64) | JSON header | arrays
+
+The header holds the architecture, the model_config and the dtype, shape and
+offset of every array. Arrays are stored raw and little-endian, each aligned on
+ALIGNMENT bytes. Loading maps the file read-only and gives the layers views of
+the mapping: nothing is copied, pages are only read when used, and processes
+loading the same file share the same physical pages (the OS page cache).
+
+Models are stored folded for inference (`gui.inferenceplan.fold_model`), without
+optimizer state, so the inference plan runs on the mapped arrays too. The
+"im2col" backend still keeps channels-last copies of the convolution kernels,
+which are small next to the Dense weights.
+"""
+
+import json
+from functools import partial
+
+import numpy as np
+
+from mpneuralnetwork.layers import Convolutional, Dense
+from mpneuralnetwork.model import Model
+
+from gui.inferenceplan import fold_model
+from gui.quantization import build_layers, build_loss
+
+MAGIC = b"HWRMMAP1"
+ALIGNMENT = 64
+SUFFIX = ".mmap"
+
+_SIZE_DTYPE = np.dtype("<u8")
+
+
+def is_mapped(model_path):
+    with open(model_path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_mapped(model, path, model_config=None):
+    """
+    Saves the inference-only version of a model as a mapped model file.
+
+    Args:
+        model (Model): The model to save.
+        path (str | Path): Destination file.
+        model_config (str | None): The model_config JSON of the source archive,
+            defaults to the one of the model's loss.
+    """
+    architecture, arrays = fold_model(model)
+    for config in architecture:
+        # Weights are then set by Model through init_weights, see load_mapped
+        if "initialization" in config:
+            config["initialization"] = "auto"
+    if model_config is None:
+        model_config = json.dumps({"loss": model.loss.get_config()})
+
+    entries = {}
+    offset = 0
+    for key, array in arrays.items():
+        array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        arrays[key] = array
+        entries[key] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+
+    header = json.dumps({
+        "architecture": json.dumps(architecture),
+        "model_config": model_config,
+        "arrays": entries,
+    }).encode()
+    data_start = _aligned(len(MAGIC) + _SIZE_DTYPE.itemsize + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array(len(header), dtype=_SIZE_DTYPE).tobytes())
+        f.write(header)
+        for key, array in arrays.items():
+            f.seek(data_start + entries[key]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def load_mapped(model_path):
+    """
+    Loads a mapped model file. The parameters and states of the layers are
+    read-only views of the mapping.
+    """
+    mapping = np.memmap(model_path, dtype=np.uint8, mode="r")
+
+    header_start = len(MAGIC) + _SIZE_DTYPE.itemsize
+    header_size = int(mapping[len(MAGIC) : header_start].view(_SIZE_DTYPE)[0])
+    header = json.loads(bytes(mapping[header_start : header_start + header_size]))
+    data_start = _aligned(header_start + header_size)
+
+    arrays = {
+        key: np.ndarray(entry["shape"], dtype=entry["dtype"], buffer=mapping, offset=data_start + entry["offset"])
+        for key, entry in header["arrays"].items()
+    }
+
+    network = build_layers(header["architecture"])
+    for i, layer in enumerate(network):
+        if isinstance(layer, (Dense, Convolutional)):
+            # Model initializes the weights of "auto" layers at random, which would
+            # take most of the load time: they get the mapped arrays instead
+            layer.init_weights = partial(_init_mapped, layer, arrays, i)
+
+    model = Model(network, build_loss(header["model_config"]))
+
+    # Assigned rather than restored with load_params, which would copy them into
+    # the arrays the layers were built with. Views are reshaped to those arrays
+    # (biases are stored per output channel).
+    for i, layer in enumerate(model.layers):
+        for name in getattr(layer, "params", {}):
+            key = f"layer_{i}_{name}"
+            if key in arrays:
+                setattr(layer, name, arrays[key].reshape(getattr(layer, name).shape))
+
+        state = getattr(layer, "state", {})
+        if state:
+            layer.state = {
+                name: arrays[f"layer_{i}_state_{name}"].reshape(np.shape(value)) for name, value in state.items()
+            }
+
+    return model
+
+
+def _init_mapped(layer, arrays, index, method, no_bias):
+    """`init_weights` of the Dense / Convolutional layers of a mapped model."""
+    name = "weights" if isinstance(layer, Dense) else "kernels"
+    weights = arrays[f"layer_{index}_{name}"]
+    biases = arrays[f"layer_{index}_biases"]
+
+    # Gradients are only written by training: np.zeros pages are not allocated until then
+    setattr(layer, name, weights)
+    setattr(layer, f"{name}_gradient", np.zeros(weights.shape, dtype=weights.dtype))
+
+    layer.no_bias = False
+    layer.biases = biases.reshape(1, -1) if isinstance(layer, Dense) else biases
+    layer.biases_gradient = np.zeros(layer.biases.shape, dtype=biases.dtype)
@@ -1,3 +1,4 @@
+import warnings
 from pathlib import Path
 
 import numpy as np
@@ -5,20 +6,114 @@ import numpy as np
 from mpneuralnetwork import serialization
 from mpneuralnetwork.layers import Convolutional
 
+from gui.inferenceplan import CONV_BACKENDS, compile_plan
+from gui.mappedmodel import is_mapped, load_mapped
+from gui.precision import compute_dtype
+from gui.predictioncache import PredictionCache
+from gui.quantization import is_quantized, load_quantized
+
 
 class NeuralNetHandler:
-    def __init__(self, model_path: Path):
-        self.model = serialization.load_model(model_path)
+    # "model" runs the layers as they are, the others an inference plan with
+    # the given convolution backend (see gui/inferenceplan.py)
+    BACKENDS = ("model",) + CONV_BACKENDS
+    # Largest output difference allowed between the inference plan and the model,
+    # per precision of the plan (see gui/precision.py)
+    PLAN_TOLERANCE = {"float64": 1e-4, "float32": 1e-4, "float16": 1e-2}
+
+    def __init__(
+        self,
+        model_path: Path,
+        cache_size=0,
+        near_duplicate_threshold=None,
+        backend="im2col",
+        precision="float32",
+    ):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {self.BACKENDS}")
+        # Inputs are computed in this dtype, weights stored in the precision (plans only)
+        self.dtype = compute_dtype(precision)
+
+        # Mapped models (tools/mapmodel.py) are detected from their header, quantized
+        # variants (tools/quantize.py) from the archive content
+        if is_mapped(model_path):
+            self.model = load_mapped(model_path)
+        elif is_quantized(model_path):
+            self.model = load_quantized(model_path)
+        else:
+            self.model = serialization.load_model(model_path)
+
+        self.input_shape = (1, 28, 28) if isinstance(self.model.layers[0], Convolutional) else (784,)
+
+        # Folded BatchNormalization / Dropout / ReLU, used only if it gives the same outputs
+        self.plan = None
+        if backend != "model":
+            plan = compile_plan(self.model, backend, precision)
+            difference = plan.max_difference(self.model, self.input_shape)
+            if difference <= self.PLAN_TOLERANCE[precision]:
+                self.plan = plan
+            else:
+                warnings.warn(
+                    f"Optimized inference plan differs from the model by {difference:.2e}, "
+                    "falling back to the unoptimized model"
+                )
+
+        # Identifies the weights in the prediction cache keys
+        stat = Path(model_path).stat()
+        self.model_id = f"{Path(model_path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+        self.cache = None
+        if cache_size > 0:
+            self.cache = PredictionCache(cache_size, near_duplicate_threshold=near_duplicate_threshold)
 
     def predict(self, image):
-        img = np.array(image).astype(np.float32) / 255.0
+        return self.predict_batch([image])
 
-        first_layer = self.model.layers[0]
+    def predict_batch(self, images):
+        """
+        Runs a whole batch of 28x28 images (PIL images or arrays, or an
+        (N, 28, 28) array) through the model with a single predict call.
+        """
+        batch = np.asarray(
+            images if isinstance(images, np.ndarray) else [np.asarray(image) for image in images]
+        )
+        return self.predict_normalized(batch.astype(self.dtype) / 255.0)
 
-        if isinstance(first_layer, Convolutional):
-            input_data = img.reshape(1, 28, 28)
-        else:
-            input_data = img.reshape(784)
+    def predict_normalized(self, batch):
+        """
+        Runs a (N, 28, 28) float array with values in [0, 1], such as the output
+        of `gui.preprocessing.preprocess_batch`, through the model.
+        When the cache is enabled, only the images not found in it are sent to
+        the model, still in a single predict call.
+        """
+        if self.cache is None:
+            return self._predict(batch)
+
+        batch = np.asarray(batch, dtype=self.dtype).reshape(-1, 28, 28)
+        keys = [self.cache.key(self.model_id, image) for image in batch]
+        outputs = [self.cache.get(key, image) for key, image in zip(keys, batch)]
+
+        # Identical images within the batch are only predicted once
+        missing = {}
+        for i, output in enumerate(outputs):
+            if output is None:
+                missing.setdefault(keys[i], []).append(i)
+
+        if missing:
+            first = [indices[0] for indices in missing.values()]
+            predictions = self._predict(batch[first])
+            for indices, prediction in zip(missing.values(), predictions):
+                for i in indices:
+                    outputs[i] = prediction
+                self.cache.put(keys[indices[0]], prediction, batch[indices[0]])
+
+        return np.stack(outputs)
+
+    def _predict(self, batch):
+        input_data = batch.reshape(-1, *self.input_shape)
+
+        if self.plan is not None:
+            return self.plan(input_data)
 
         return self.model.predict(input_data)
 
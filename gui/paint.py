@@ -1,6 +1,8 @@
 # Credits to nikhilkumarsingh
 # https://gist.github.com/nikhilkumarsingh/85501ee2c3d8c0cfa9d1a27be5781f06
 
+import threading
+import time
 from tkinter import (
     Tk,
     Canvas,
@@ -8,6 +10,7 @@ from tkinter import (
     Scale,
     Button,
     Label,
+    LEFT,
     StringVar,
     HORIZONTAL,
     RAISED,
@@ -16,21 +19,59 @@ from tkinter import (
     TRUE,
 )
 
-from gui.imagehandler import ImageHandler
-from gui.neuralnethandler import NeuralNetHandler
+import numpy as np
+from PIL import Image
+
+from gui.imagehandler import ImageHandler, preprocess
+from gui.inferenceworker import InferenceWorker
+from gui.instrumentation import Profiler
 from gui.labels import get_label_mapping
+from gui.recording import StrokeRecorder
+from gui.segmentation import predict_segments
+from gui.startup import StartupTimer
 
 
 class Paint(object):
+    TITLE = "Handwriting recognition"
     DEFAULT_PEN_SIZE = 50.0
     DEFAULT_COLOR = "white"
     DEFAULT_BACKGROUND = "black"
     TOP_N_PREDICTIONS = 10
-
-    def __init__(self, model_path):
-        self.model_path = model_path
+    SEGMENT_TOP_N = 3
+    RESULT_POLL_MS = 15
+    PREDICTION_CACHE_SIZE = 256
+    OVERLAY_REFRESH_MS = 500
+    OVERLAY_WINDOW = 500
+    STARTUP_POLL_MS = 20
+
+    def __init__(
+        self,
+        model_paths,
+        profile=False,
+        trace_path="output/trace.json",
+        fast_startup=False,
+        startup=None,
+        startup_report=None,
+        ensemble_weights=None,
+        cascade=None,
+        record_path=None,
+        record_label=None,
+        rasterization="canvas",
+        precision="float32",
+    ):
+        self.model_paths = list(model_paths)
+        self.precision = precision
+        self.ensemble_weights = ensemble_weights
+        self.cascade = cascade
+        self.record_path = record_path
+        self.record_label = record_label
+        self.rasterization = rasterization
+        self.profiler = Profiler(enabled=profile)
+        self.fast_startup = fast_startup
+        self.startup = startup if startup is not None else StartupTimer()
+        self.startup_report = startup_report
         self.root = Tk()
-        self.root.title("Handwriting recognition")
+        self.root.title(self.TITLE)
 
         self.pen_button = Button(self.root, text="Pen", command=self.use_pen)
         self.pen_button.grid(row=0, column=0)
@@ -48,6 +89,11 @@ class Paint(object):
         )
         self.export_image_button.grid(row=0, column=3)
 
+        self.segment_button = Button(
+            self.root, text="Multi-character", command=self.toggle_segmentation
+        )
+        self.segment_button.grid(row=0, column=5)
+
         self.choose_size_button = Scale(
             self.root,
             from_=self.DEFAULT_PEN_SIZE - 10,
@@ -94,9 +140,36 @@ class Paint(object):
             self.labels[i][0].grid(row=i, column=0, padx=10)
             self.labels[i][1].grid(row=i, column=1, padx=10)
 
+        # Rolling per-stage latencies, only shown when profiling
+        if self.profiler.enabled:
+            self.overlay_text = StringVar()
+            self.overlay = Label(
+                self.root,
+                font=("TkFixedFont", 10),
+                justify=LEFT,
+                anchor="w",
+                textvariable=self.overlay_text,
+            )
+            self.overlay.grid(row=11, column=0, columnspan=7, sticky="w", padx=10)
+
+        self.startup.mark("window")
+
         self._throttle_flag = False
         self.setup()
         self.root.mainloop()
+        self.worker.stop()
+
+        if len(self.model_paths) > 1 and self.neuralnet_handler is not None:
+            print(self.neuralnet_handler.report())
+            self.neuralnet_handler.close()
+
+        if self.recorder is not None and len(self.recorder):
+            path = self.recorder.save(self.record_path, models=self.model_paths)
+            print(f"Strokes recorded to {path}")
+
+        if self.profiler.enabled:
+            self.profiler.dump(trace_path)
+            print(f"Trace written to {trace_path}")
 
     def setup(self):
         self.old_x = None
@@ -104,19 +177,95 @@ class Paint(object):
         self.line_width = self.choose_size_button.get()
         self.color = self.DEFAULT_COLOR
         self.eraser_on = False
+        self.segment_on = False
         self.active_button = self.pen_button
         self.c.bind("<B1-Motion>", self.paint)
         self.c.bind("<ButtonRelease-1>", self.reset)
 
         self.root.update_idletasks()
 
-        self.image_handler = ImageHandler(self.root, self.c)
-        self.neuralnet_handler = NeuralNetHandler(self.model_path)
+        self.image_handler = ImageHandler(
+            self.c.winfo_width(), self.c.winfo_height(), rasterization=self.rasterization
+        )
 
-        self.label_mapping = get_label_mapping(self.neuralnet_handler.output_size)
+        # Strokes for headless replays (run_replay.py)
+        self.recorder = None
+        if self.record_path is not None:
+            self.recorder = StrokeRecorder(self.c.winfo_width(), self.c.winfo_height(), label=self.record_label)
+
+        # In fast startup mode the canvas takes input while the model loads on a
+        # background thread, the worker waits for it before the first prediction
+        self.neuralnet_handler = None
+        self._model_error = None
+        self._model_ready = threading.Event()
+        if self.fast_startup:
+            self.root.title(f"{self.TITLE} - loading model...")
+            threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+        else:
+            self._load_model()
+
+        # Preprocessing and inference run on a background thread, the canvas only
+        # takes snapshots of the drawing. Bumping the generation discards results
+        # of snapshots taken before the canvas was erased.
+        self._generation = 0
+        self.worker = InferenceWorker(self._run_inference)
+        self.worker.start()
+        self.root.after(self.RESULT_POLL_MS, self._poll_results)
+
+        if self.profiler.enabled:
+            self.root.after(self.OVERLAY_REFRESH_MS, self._refresh_overlay)
 
         self._clear_prediction_labels()
 
+        # Idle callbacks run once the first frame is drawn
+        self.root.after_idle(self.startup.mark, "interactive")
+        self.root.after(self.STARTUP_POLL_MS, self._watch_startup)
+
+    def _load_model(self):
+        try:
+            # Imported here: mpneuralnetwork is not needed to show the window
+            from gui.ensemble import load_handler
+
+            handler = load_handler(
+                self.model_paths,
+                weights=self.ensemble_weights,
+                cascade=self.cascade,
+                cache_size=self.PREDICTION_CACHE_SIZE,
+                precision=self.precision,
+            )
+            self.label_mapping = get_label_mapping(handler.output_size)
+            self.startup.mark("model_loaded")
+
+            # Keeps the one-off costs of the first prediction off the first stroke
+            handler.predict_normalized(np.zeros((1, 28, 28), dtype=np.float32))
+            self.startup.mark("model_warm")
+
+            self.neuralnet_handler = handler
+        except Exception as error:
+            if not self.fast_startup:
+                raise
+            self._model_error = error
+        finally:
+            self._model_ready.set()
+
+    def _watch_startup(self):
+        if not self._model_ready.is_set() or "interactive" not in self.startup.phases:
+            self.root.after(self.STARTUP_POLL_MS, self._watch_startup)
+            return
+
+        if self._model_error is not None:
+            self.root.title(f"{self.TITLE} - model not loaded")
+            print(f"Error: could not load the model: {self._model_error}")
+        else:
+            self.root.title(self.TITLE)
+
+        if self.fast_startup:
+            print(self.startup.report())
+
+        if self.startup_report is not None:
+            self.startup.save(self.startup_report)
+            self.root.quit()
+
     def use_pen(self):
         self.activate_button(self.pen_button)
 
@@ -129,8 +278,23 @@ class Paint(object):
     def erase_all(self):
         self.c.delete("all")
         self.image_handler.clear()
+        if self.recorder is not None:
+            self.recorder.clear()
+        self._generation += 1
         self._clear_prediction_labels()
 
+    def toggle_segmentation(self):
+        self.segment_on = not self.segment_on
+        self.segment_button.config(relief=SUNKEN if self.segment_on else RAISED)
+
+        # The top-N alternatives of each character need a smaller font
+        for _, probability_label in self.labels:
+            probability_label.config(font=("TkDefaultFont", 14 if self.segment_on else 30))
+
+        self.c.delete("segments")
+        self._clear_prediction_labels()
+        self._trigger_prediction()
+
     def activate_button(self, some_button, eraser_mode=False):
         self.active_button.config(relief=RAISED)
         some_button.config(relief=SUNKEN)
@@ -142,20 +306,24 @@ class Paint(object):
         paint_color = "black" if self.eraser_on else "white"
 
         if self.old_x and self.old_y:
-            self.c.create_line(
-                self.old_x,
-                self.old_y,
-                event.x,
-                event.y,
-                width=self.line_width,
-                fill=self.DEFAULT_BACKGROUND if self.eraser_on else self.DEFAULT_COLOR,
-                capstyle=ROUND,
-                smooth=TRUE,
-                splinesteps=36,
-            )
-            self.image_handler.add_line(
-                self.old_x, self.old_y, event.x, event.y, self.line_width, paint_color
-            )
+            with self.profiler.stage("create_line"):
+                self.c.create_line(
+                    self.old_x,
+                    self.old_y,
+                    event.x,
+                    event.y,
+                    width=self.line_width,
+                    fill=self.DEFAULT_BACKGROUND if self.eraser_on else self.DEFAULT_COLOR,
+                    capstyle=ROUND,
+                    smooth=TRUE,
+                    splinesteps=36,
+                )
+            with self.profiler.stage("add_line"):
+                self.image_handler.add_line(
+                    self.old_x, self.old_y, event.x, event.y, self.line_width, paint_color
+                )
+            if self.recorder is not None:
+                self.recorder.line(self.old_x, self.old_y, event.x, event.y, self.line_width, self.eraser_on)
 
         self.old_x = event.x
         self.old_y = event.y
@@ -163,15 +331,70 @@ class Paint(object):
         if not self._throttle_flag:
             self._throttle_flag = True
             self._trigger_prediction()
-            self.root.after(100, self._release_throttle)
+            # Adaptive throttle: snapshots are taken about as often as the worker
+            # can turn them into predictions, whatever the model
+            self.root.after(self.worker.interval_ms(), self._release_throttle)
 
     def _release_throttle(self):
         self._throttle_flag = False
 
     def _trigger_prediction(self):
-        self.image_handler.update()
-        prediction = self.neuralnet_handler.predict(self.image_handler.image)
-
+        submitted = time.perf_counter()
+        with self.profiler.stage("snapshot"):
+            region = self.image_handler.snapshot()
+
+        # Position and scale of the snapshot on the canvas, to place the character boxes
+        offset = (0, 0, 1.0)
+        if region is not None:
+            offset = (*self.image_handler.bbox[:2], self.image_handler.snapshot_scale)
+
+        self.worker.submit((self._generation, self.segment_on, region, offset, submitted))
+
+    def _run_inference(self, job):
+        """Runs on the worker thread."""
+        generation, segment_on, region, offset, submitted = job
+
+        self._model_ready.wait()
+        if self.neuralnet_handler is None:
+            return None
+
+        if segment_on:
+            # All the characters go through the model in a single batch
+            with self.profiler.stage("segment_predict"):
+                boxes, images, prediction = predict_segments(self.neuralnet_handler, region)
+
+            left, top, scale = offset
+            boxes = [(left + l / scale, top + t / scale, left + r / scale, top + b / scale) for l, t, r, b in boxes]
+            image = Image.fromarray((np.hstack(list(images)) * 255).astype(np.uint8)) if boxes else Image.new('L', (28, 28))
+
+            return generation, image, prediction, boxes, submitted
+
+        with self.profiler.stage("preprocess"):
+            image = preprocess(region)
+        with self.profiler.stage("predict"):
+            prediction = self.neuralnet_handler.predict(image)
+
+        return generation, image, prediction, None, submitted
+
+    def _poll_results(self):
+        result = self.worker.poll()
+
+        if result is not None:
+            generation, image, prediction, boxes, submitted = result
+            # Results of the other mode may still arrive right after a toggle
+            if generation == self._generation and (boxes is not None) == self.segment_on:
+                self.image_handler.image = image
+                with self.profiler.stage("show_prediction"):
+                    if boxes is None:
+                        self._show_prediction(prediction)
+                    else:
+                        self._show_segments(prediction, boxes)
+                # From the snapshot to the labels showing its prediction
+                self.profiler.record("end_to_end", submitted, time.perf_counter())
+
+        self.root.after(self.RESULT_POLL_MS, self._poll_results)
+
+    def _show_prediction(self, prediction):
         prediction_indexed = list(enumerate(prediction[0]))
 
         sorted_predictions = sorted(
@@ -194,6 +417,43 @@ class Paint(object):
                 self.textvars[i][0].set("")
                 self.textvars[i][1].set("")
 
+    def _show_segments(self, predictions, boxes):
+        """One row per character, left to right: its label and its top-N probabilities."""
+        self.c.delete("segments")
+
+        for i, (left, top, right, bottom) in enumerate(boxes):
+            self.c.create_rectangle(left, top, right, bottom, outline="#555", dash=(4, 2), tags="segments")
+            self.c.create_text(left + 4, top + 4, text=str(i + 1), anchor="nw", fill="#888", tags="segments")
+
+        for i in range(self.TOP_N_PREDICTIONS):
+            if i < len(predictions):
+                ranked = np.argsort(predictions[i])[::-1][: self.SEGMENT_TOP_N]
+                label_str = self.label_mapping.get(ranked[0], str(ranked[0]))
+                alternatives = "  ".join(
+                    f"{self.label_mapping.get(idx, str(idx))} {predictions[i][idx]:.0%}" for idx in ranked
+                )
+
+                self.textvars[i][0].set(label_str)
+                self.textvars[i][1].set(alternatives)
+
+                self.labels[i][0].config(fg="#000")
+                self.labels[i][1].config(fg="#888")
+            else:
+                self.textvars[i][0].set("")
+                self.textvars[i][1].set("")
+
+    def _refresh_overlay(self):
+        summary = self.profiler.summary(last=self.OVERLAY_WINDOW)
+        self.overlay_text.set(
+            "   ".join(
+                f"{name} {stats['p50_ms']:.2f}/{stats['p95_ms']:.2f}"
+                for name, stats in summary.items()
+            )
+            + ("   (p50/p95 ms)" if summary else "")
+        )
+
+        self.root.after(self.OVERLAY_REFRESH_MS, self._refresh_overlay)
+
     def _clear_prediction_labels(self):
         for i in range(self.TOP_N_PREDICTIONS):
             self.textvars[i][0].set("")
@@ -201,5 +461,7 @@ class Paint(object):
 
     def reset(self, event):
         self.old_x, self.old_y = None, None
+        if self.recorder is not None:
+            self.recorder.release()
         self._trigger_prediction()
 
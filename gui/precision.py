@@ -0,0 +1,34 @@
+"""
+Dtype policy of the inference plans (and, through train/dataset.py, of the
+training data).
+
+A precision sets the dtype weights and data are stored in, and the dtype
+products are computed and accumulated in:
+
+- "float64": stored and computed in float64, a reference for the other two.
+- "float32": stored and computed in float32 (the default, what the models are
+  trained in).
+- "float16": stored in float16, which halves the memory they take at rest, and
+  computed in float32. NumPy has no float16 BLAS: every product converts the
+  float16 weights to a temporary float32 copy, so each call moves more memory
+  than with float32 weights and is slower. Use it to save memory, not time.
+"""
+
+import numpy as np
+
+PRECISIONS = ("float64", "float32", "float16")
+
+
+def storage_dtype(precision):
+    _check(precision)
+    return np.dtype(precision)
+
+
+def compute_dtype(precision):
+    _check(precision)
+    return np.dtype(np.float64 if precision == "float64" else np.float32)
+
+
+def _check(precision):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
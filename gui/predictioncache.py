@@ -0,0 +1,89 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of model outputs, keyed by a hash of the quantized
+    28x28 input and of the model identity.
+
+    With a near-duplicate threshold, an input whose mean absolute pixel
+    difference (in [0, 1] units) with the previous lookup is below the
+    threshold reuses the previous result, even if it hashes differently.
+    """
+
+    def __init__(self, max_size=256, quantization_bits=8, near_duplicate_threshold=None):
+        self.max_size = max_size
+        self.quantization_shift = 8 - quantization_bits
+        self.near_duplicate_threshold = near_duplicate_threshold
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_input = None
+        self._last_output = None
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, model_id, image):
+        """Hash of a normalized (28, 28) float image, quantized to quantization_bits."""
+        quantized = (np.asarray(image) * 255.0 + 0.5).astype(np.uint8) >> self.quantization_shift
+        return hashlib.blake2b(model_id.encode() + quantized.tobytes(), digest_size=16).digest()
+
+    def get(self, key, image=None):
+        """Returns the cached output for key (or a near duplicate of image), or None."""
+        with self._lock:
+            output = self._entries.get(key)
+            if output is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._remember(image, output)
+                return output
+
+            if (
+                self.near_duplicate_threshold is not None
+                and image is not None
+                and self._last_input is not None
+                and np.abs(image - self._last_input).mean() < self.near_duplicate_threshold
+            ):
+                self.near_hits += 1
+                return self._last_output
+
+            self.misses += 1
+            return None
+
+    def put(self, key, output, image=None):
+        with self._lock:
+            self._entries[key] = output
+            self._entries.move_to_end(key)
+            self._remember(image, output)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_input = None
+            self._last_output = None
+
+    def _remember(self, image, output):
+        if self.near_duplicate_threshold is not None and image is not None:
+            self._last_input = image
+            self._last_output = output
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,189 @@
+"""
+Vectorized version of the ImageHandler preprocessing, working on whole
+(N, H, W) stacks of drawings at once instead of one PIL image at a time.
+
+The steps are the same as in `gui.imagehandler.preprocess`: bounding box crop,
+LANCZOS resize to fit a 20x20 box, center of mass, and paste onto a 28x28 canvas.
+The resize reproduces PIL's separable LANCZOS filter (same kernel, support and
+coefficient normalization, horizontal pass first with an 8-bit intermediate),
+so results match the single-image path up to PIL's fixed-point rounding:
+pixel values differ by at most 2/255 after normalization (1/255 for nearly all
+pixels), except for the rare inputs (well under 1%) whose center of mass lies
+on a rounding boundary, where the digit may be pasted one pixel away.
+"""
+
+import numpy as np
+
+TARGET_SIZE = 28
+BOX_SIZE = 20
+LANCZOS_SUPPORT = 3.0
+DEFAULT_CHUNK_SIZE = 32
+
+
+def _lanczos(x):
+    # Same kernel as PIL: sinc(x) * sinc(x / 3) on [-3, 3), written with a single
+    # pair of sines in float32 (np.sinc in float64 is several times slower)
+    px = np.float32(np.pi) * x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = LANCZOS_SUPPORT * np.sin(px) * np.sin(px / LANCZOS_SUPPORT) / (px * px)
+    values[x == 0] = 1.0
+    values[(x < -LANCZOS_SUPPORT) | (x >= LANCZOS_SUPPORT)] = 0.0
+    return values
+
+
+def _resample_weights(starts, in_sizes, out_sizes, length):
+    """
+    Builds the (N, BOX_SIZE, length) LANCZOS weight matrices resampling the
+    in_sizes[n] input pixels starting at starts[n] to out_sizes[n] output pixels,
+    following PIL's coefficient computation. Output rows beyond out_sizes[n] are
+    left at zero, as are the weights of the pixels outside of the crop.
+    """
+    in_sizes = in_sizes.astype(np.float32)[:, None, None]
+    out_sizes = out_sizes.astype(np.float32)[:, None, None]
+
+    out_idx = np.arange(BOX_SIZE, dtype=np.float32)[None, :, None]
+    in_idx = np.arange(length, dtype=np.float32)[None, None, :] - starts.astype(np.float32)[:, None, None]
+
+    scale = in_sizes / out_sizes
+    filterscale = np.maximum(scale, 1.0)
+    support = LANCZOS_SUPPORT * filterscale
+
+    center = (out_idx + 0.5) * scale
+    window_start = np.maximum(np.trunc(center - support + 0.5), 0)
+    window_end = np.minimum(np.trunc(center + support + 0.5), in_sizes)
+
+    weights = _lanczos((in_idx - center + 0.5) / filterscale)
+    weights *= (in_idx >= window_start) & (in_idx < window_end) & (out_idx < out_sizes)
+
+    total = weights.sum(axis=2, keepdims=True)
+    np.divide(weights, total, out=weights, where=total != 0)
+
+    return weights
+
+
+def _to_uint8(values):
+    return np.clip(np.floor(values + 0.5), 0, 255)
+
+
+def _bounding_boxes(stack):
+    """Returns the (top, left, height, width) of the ink of every image, and a validity mask."""
+    _, height, width = stack.shape
+
+    rows_any = stack.max(axis=2) > 0
+    cols_any = stack.max(axis=1) > 0
+    not_empty = rows_any.any(axis=1)
+
+    top = rows_any.argmax(axis=1)
+    bottom = height - 1 - rows_any[:, ::-1].argmax(axis=1)
+    left = cols_any.argmax(axis=1)
+    right = width - 1 - cols_any[:, ::-1].argmax(axis=1)
+
+    crop_h = bottom - top + 1
+    crop_w = right - left + 1
+
+    # Same rule as the single-image path: empty or single-pixel drawings give a black image
+    valid = not_empty & ((crop_h > 1) | (crop_w > 1))
+
+    return top, left, crop_h, crop_w, valid
+
+
+def _preprocess_crops(stack, indices, top, left, crop_h, crop_w):
+    _, height, width = stack.shape
+    n = len(indices)
+
+    # 1. Gather the crops into a common (N, max_h, max_w) array through a strided view of
+    # every window of that size. Windows that would overflow the image are shifted back
+    # inside it, the crop then starts at an offset within its window.
+    max_h, max_w = crop_h.max(), crop_w.max()
+    win_top = np.minimum(top, height - max_h)
+    win_left = np.minimum(left, width - max_w)
+
+    windows = np.lib.stride_tricks.sliding_window_view(stack, (max_h, max_w), axis=(1, 2))
+    crops = windows[indices, win_top, win_left].astype(np.float32)
+
+    # 2. Resize to fit in a 20x20 box while keeping the aspect ratio. The weights are
+    # zero outside of each crop, so the extra pixels of the windows are ignored.
+    percent = np.minimum(BOX_SIZE / crop_w.astype(np.float64), BOX_SIZE / crop_h.astype(np.float64))
+    wsize = np.maximum((crop_w * percent).astype(np.int64), 1)
+    hsize = np.maximum((crop_h * percent).astype(np.int64), 1)
+
+    weights_x = _resample_weights(left - win_left, crop_w, wsize, max_w)
+    weights_y = _resample_weights(top - win_top, crop_h, hsize, max_h)
+
+    resized = _to_uint8(crops @ weights_x.transpose(0, 2, 1))
+    resized = _to_uint8(weights_y @ resized)
+
+    # 3. Center of mass of each resized image
+    mass = resized.sum(axis=(1, 2))
+    has_mass = mass > 0
+    safe_mass = np.where(has_mass, mass, 1)
+    cy = (resized.sum(axis=2) * np.arange(BOX_SIZE)).sum(axis=1) / safe_mass
+    cx = (resized.sum(axis=1) * np.arange(BOX_SIZE)).sum(axis=1) / safe_mass
+
+    # 4. Paste on the 28x28 canvas, offset by the center of mass
+    offset_y = TARGET_SIZE // 2 - np.round(cy).astype(np.int64)
+    offset_x = TARGET_SIZE // 2 - np.round(cx).astype(np.int64)
+
+    src_y = np.arange(TARGET_SIZE)[None, :] - offset_y[:, None]
+    src_x = np.arange(TARGET_SIZE)[None, :] - offset_x[:, None]
+    inside = ((src_y >= 0) & (src_y < BOX_SIZE))[:, :, None] & ((src_x >= 0) & (src_x < BOX_SIZE))[:, None, :]
+
+    pasted = resized[
+        np.arange(n)[:, None, None],
+        np.clip(src_y, 0, BOX_SIZE - 1)[:, :, None],
+        np.clip(src_x, 0, BOX_SIZE - 1)[:, None, :],
+    ]
+    pasted *= inside & has_mass[:, None, None]
+
+    return pasted / 255.0
+
+
+def preprocess_batch(stack, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Preprocesses a (N, H, W) uint8 stack of drawings (white ink on black).
+
+    Args:
+        stack (np.ndarray): Images of shape (N, H, W), dtype uint8.
+        chunk_size (int): Number of images resized at once, bounds the memory used
+                          by the intermediate arrays.
+
+    Returns:
+        np.ndarray: (N, 28, 28) float32 array with values in [0, 1], ready for the model.
+    """
+    stack = np.asarray(stack)
+    if stack.ndim != 3:
+        raise ValueError(f"Expected a (N, H, W) stack, got shape {stack.shape}")
+
+    out = np.zeros((len(stack), TARGET_SIZE, TARGET_SIZE), dtype=np.float32)
+
+    boxes = [_bounding_boxes(stack[i:i + chunk_size]) for i in range(0, len(stack), chunk_size)]
+    if not boxes:
+        return out
+    top, left, crop_h, crop_w, valid = (np.concatenate(values) for values in zip(*boxes))
+
+    # Images are resized by chunks of similar crop size, so that the common crop
+    # array of a chunk is not much larger than its crops
+    indices = np.flatnonzero(valid)
+    indices = indices[np.argsort(np.maximum(crop_h, crop_w)[indices], kind="stable")]
+
+    for i in range(0, len(indices), chunk_size):
+        idx = indices[i:i + chunk_size]
+        out[idx] = _preprocess_crops(stack, idx, top[idx], left[idx], crop_h[idx], crop_w[idx])
+
+    return out
+
+
+def stack_images(images):
+    """
+    Stacks 2D uint8 images of different sizes into a single (N, H, W) array,
+    padding them with black at the bottom/right (which does not change the crop).
+    """
+    arrays = [np.asarray(image, dtype=np.uint8) for image in images]
+    height = max(a.shape[0] for a in arrays)
+    width = max(a.shape[1] for a in arrays)
+
+    stack = np.zeros((len(arrays), height, width), dtype=np.uint8)
+    for i, a in enumerate(arrays):
+        stack[i, :a.shape[0], :a.shape[1]] = a
+
+    return stack
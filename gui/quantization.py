@@ -0,0 +1,182 @@
+"""
+Post-training quantization of saved models.
+
+A quantized model is a regular `save_model` archive (same architecture and
+model_config, no optimizer state) with a `quantization` entry describing how
+its arrays are stored:
+
+- "float16": every parameter and state is stored as float16.
+- "int8": Dense weights and Convolutional kernels are stored as int8 with one
+  float32 scale per output channel (`<name>_scale`), symmetric around zero.
+  The clipping range of each layer is calibrated on sample inputs. Biases and
+  BatchNormalization parameters are small and stay float32.
+
+NumPy has no int8 matrix product, so quantized weights are dequantized to
+float32 at load time: the gain is in file size and load time, the predictions
+match those of the dequantized weights exactly.
+"""
+
+import json
+
+import numpy as np
+
+from mpneuralnetwork import activations, layers, losses
+from mpneuralnetwork.layers import Convolutional, Dense
+from mpneuralnetwork.model import Model
+from mpneuralnetwork.serialization import get_model_weights, restore_model_weights
+
+QUANTIZATION_KEY = "quantization"
+SCALE_SUFFIX = "_scale"
+MODES = ("int8", "float16")
+
+# Percentiles of |w| tried as the clipping limit of each output channel
+CLIP_PERCENTILES = (100.0, 99.99, 99.9, 99.5, 99.0)
+
+
+def is_quantized(model_path):
+    with np.load(model_path) as data:
+        return QUANTIZATION_KEY in data.files
+
+
+def build_layers(architecture):
+    """Instantiates the (unbuilt) layers described by the architecture JSON of a saved model."""
+    network = []
+    for conf in json.loads(architecture):
+        conf = dict(conf)
+        name = conf.pop("type")
+        module = layers if hasattr(layers, name) else activations
+        network.append(getattr(module, name)(**conf))
+
+    return network
+
+
+def build_loss(model_config):
+    loss_conf = dict(json.loads(model_config)["loss"])
+    return getattr(losses, loss_conf.pop("type"))(**loss_conf)
+
+
+def build_model(architecture, model_config):
+    """Instantiates the (untrained) model described by the JSON entries of a saved model."""
+    return Model(build_layers(architecture), build_loss(model_config))
+
+
+def load_quantized(model_path):
+    """Loads a quantized model, dequantizing its weights to float32."""
+    with np.load(model_path) as data:
+        arrays = {key: data[key] for key in data.files}
+
+    model = build_model(str(arrays.pop("architecture")), str(arrays.pop("model_config")))
+    arrays.pop(QUANTIZATION_KEY)
+
+    weights = {}
+    for key, value in arrays.items():
+        if key.endswith(SCALE_SUFFIX):
+            continue
+        if key + SCALE_SUFFIX in arrays:
+            value = value.astype(np.float32) * arrays[key + SCALE_SUFFIX]
+        weights[key] = value.astype(np.float32)
+
+    restore_model_weights(model.layers, weights)
+    return model
+
+
+def quantize_model(model, mode="int8", calibration=None):
+    """
+    Quantizes the parameters of a model.
+
+    Args:
+        model (Model): The float32 model. It is left untouched.
+        mode (str): "int8" or "float16".
+        calibration (np.ndarray | None): Sample inputs, shaped like the model
+            expects them, used to pick the clipping range of each int8 layer.
+            Without it, the full range of the weights is used.
+
+    Returns:
+        tuple: (arrays, report) where arrays maps the archive keys to the stored
+        arrays and report maps each int8 layer to its chosen clipping percentile.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown quantization mode {mode}, expected one of {MODES}")
+
+    weights = get_model_weights(model.layers)
+
+    if mode == "float16":
+        return {key: value.astype(np.float16) for key, value in weights.items()}, {}
+
+    arrays = dict(weights)
+    report = {}
+
+    x = calibration.astype(np.float32) if calibration is not None else None
+
+    for i, layer in enumerate(model.layers):
+        if isinstance(layer, (Dense, Convolutional)):
+            name = "weights" if isinstance(layer, Dense) else "kernels"
+            key = f"layer_{i}_{name}"
+            axis = 1 if isinstance(layer, Dense) else 0
+
+            if x is None:
+                percentile = 100.0
+            else:
+                percentile = _calibrate(layer, name, weights[key], axis, x)
+
+            q, scale = _quantize_int8(weights[key], axis, percentile)
+            arrays[key] = q
+            arrays[key + SCALE_SUFFIX] = scale
+            report[key] = percentile
+
+            if x is not None:
+                # Later layers are calibrated on the outputs of the quantized ones
+                _set_param(layer, name, q.astype(np.float32) * scale)
+                x = layer.forward(x, training=False)
+                _set_param(layer, name, weights[key])
+                continue
+
+        if x is not None:
+            x = layer.forward(x, training=False)
+
+    return arrays, report
+
+
+def _quantize_int8(w, axis, percentile):
+    reduce_axes = tuple(a for a in range(w.ndim) if a != axis)
+    limit = np.percentile(np.abs(w), percentile, axis=reduce_axes, keepdims=True)
+    scale = (np.maximum(limit, 1e-12) / 127).astype(np.float32)
+
+    q = np.clip(np.round(w / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+
+def _calibrate(layer, name, w, axis, x):
+    """Returns the clipping percentile giving the closest layer outputs on x."""
+    reference = layer.forward(x, training=False)
+
+    errors = {}
+    for percentile in CLIP_PERCENTILES:
+        q, scale = _quantize_int8(w, axis, percentile)
+        _set_param(layer, name, q.astype(np.float32) * scale)
+        errors[percentile] = float(np.mean((layer.forward(x, training=False) - reference) ** 2))
+
+    _set_param(layer, name, w)
+    return min(errors, key=errors.get)
+
+
+def _set_param(layer, name, value):
+    getattr(layer, name)[:] = value
+
+
+def save_quantized(model, path, architecture, model_config, mode="int8", calibration=None):
+    """
+    Quantizes a model and saves it next to its architecture and model_config
+    (the JSON strings stored by `save_model`).
+
+    Returns:
+        dict: The clipping percentile chosen for each int8 layer.
+    """
+    arrays, report = quantize_model(model, mode, calibration)
+
+    arrays["architecture"] = architecture
+    arrays["model_config"] = model_config
+    arrays[QUANTIZATION_KEY] = json.dumps({"mode": mode, "clip_percentiles": report})
+
+    np.savez_compressed(path, **arrays)
+    return report
@@ -0,0 +1,121 @@
+"""
+Stroke recordings: what was drawn on the canvas, event by event, so that a
+session can be replayed headlessly (see gui/replay.py).
+
+A recording is an .npz file with two entries:
+
+- events: a structured array with one 14-byte row per event (EVENT_DTYPE);
+- meta: a JSON string with the canvas size, the expected label if known, the
+  models used while recording and the recording date.
+"""
+
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Event kinds
+LINE = 0  # pen segment from (x0, y0) to (x1, y1)
+ERASE = 1  # eraser segment
+RELEASE = 2  # end of a stroke, the GUI predicts the drawing
+CLEAR = 3  # "Erase all", ends a drawing
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("t_ms", "<u4"),  # since the start of the recording
+        ("kind", "u1"),
+        ("x0", "<i2"),
+        ("y0", "<i2"),
+        ("x1", "<i2"),
+        ("y1", "<i2"),
+        ("width", "u1"),
+    ]
+)
+
+FORMAT_VERSION = 1
+
+
+class StrokeRecorder:
+    """
+    Collects the events of a drawing session. Appending is a tuple append, the
+    array is only built when saving.
+
+    Args:
+        canvas_width (int): Width of the canvas, in pixels.
+        canvas_height (int): Height of the canvas, in pixels.
+        label (str | None): What the user was asked to draw, for accuracy runs.
+    """
+
+    def __init__(self, canvas_width, canvas_height, label=None):
+        self.canvas_size = (canvas_width, canvas_height)
+        self.label = label
+
+        self._events = []
+        self._start = time.perf_counter()
+
+    def __len__(self):
+        return len(self._events)
+
+    def _append(self, kind, x0=0, y0=0, x1=0, y1=0, width=0):
+        t_ms = int((time.perf_counter() - self._start) * 1000)
+        self._events.append((t_ms, kind, x0, y0, x1, y1, int(width)))
+
+    def line(self, x0, y0, x1, y1, width, eraser=False):
+        self._append(ERASE if eraser else LINE, x0, y0, x1, y1, width)
+
+    def release(self):
+        self._append(RELEASE)
+
+    def clear(self):
+        self._append(CLEAR)
+
+    def save(self, path, models=()):
+        """
+        Writes the recording. If path is not an .npz file, it is taken as a
+        directory and the file is named after the current date and time.
+
+        Returns:
+            Path: The file written.
+        """
+        path = Path(path)
+        if path.suffix != ".npz":
+            path = path / f"{datetime.now():%Y%m%d-%H%M%S}.npz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "canvas": list(self.canvas_size),
+            "label": self.label,
+            "models": [str(model) for model in models],
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        np.savez_compressed(path, events=np.array(self._events, dtype=EVENT_DTYPE), meta=json.dumps(meta))
+
+        return path
+
+
+def load_recording(path):
+    """
+    Returns:
+        tuple: (events, meta) with events a structured array of EVENT_DTYPE.
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {meta.get('version')}")
+
+        return data["events"], meta
+
+
+def find_recordings(sources):
+    """Recording files among the given files and directories (searched recursively)."""
+    paths = []
+    for source in map(Path, sources):
+        if source.is_dir():
+            paths.extend(sorted(source.rglob("*.npz")))
+        else:
+            paths.append(source)
+
+    return paths
@@ -0,0 +1,153 @@
+"""
+Headless replay of stroke recordings (gui/recording.py).
+
+The strokes are drawn into an `ImageHandler` and predicted the way the GUI
+does: during a stroke at most once per throttle interval, and at the end of
+every stroke, each prediction going through snapshot, preprocessing and the
+model. Recordings are replayed as fast as possible, or in real time with the
+recorded delays between events.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gui.ensemble import load_handler
+from gui.imagehandler import ImageHandler, preprocess
+from gui.labels import get_label_mapping
+from gui.recording import CLEAR, ERASE, LINE, RELEASE, load_recording
+
+# Shortest delay between two predictions while drawing, as in InferenceWorker
+THROTTLE_MS = 16
+
+# Handler of each worker process, set once by _init_worker
+_worker_handler = None
+
+
+def replay(events, handler, canvas_size, realtime=False, throttle_ms=THROTTLE_MS, rasterization="canvas"):
+    """
+    Replays the events of one recording.
+
+    Args:
+        events (np.ndarray): Structured array of `gui.recording.EVENT_DTYPE`.
+        handler (NeuralNetHandler): The model(s) to predict with.
+        canvas_size (tuple): (width, height) of the recorded canvas.
+        realtime (bool): If True, waits for the recorded time of every event.
+        throttle_ms (int): Minimum delay between two predictions during a stroke, in recorded time.
+        rasterization (str): See `gui.imagehandler.RASTERIZATIONS`.
+
+    Returns:
+        dict: {"latencies_ms": end-to-end latency of every prediction (snapshot to
+        probabilities), "drawings": predicted class index at the end of every drawing,
+        "seconds": wall time of the replay}
+    """
+    image_handler = ImageHandler(*canvas_size, rasterization=rasterization)
+    latencies = []
+    drawings = []
+    last_prediction = None
+    last_trigger = None
+
+    def predict():
+        start = time.perf_counter()
+        image = preprocess(image_handler.snapshot())
+        prediction = handler.predict(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+        return int(np.argmax(prediction[0]))
+
+    start = time.perf_counter()
+    for t_ms, kind, x0, y0, x1, y1, width in events.tolist():
+        if realtime:
+            delay = start + t_ms / 1000 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if kind == LINE or kind == ERASE:
+            image_handler.add_line(x0, y0, x1, y1, width, "black" if kind == ERASE else "white")
+            if last_trigger is None or t_ms - last_trigger >= throttle_ms:
+                last_prediction = predict()
+                last_trigger = t_ms
+
+        elif kind == RELEASE:
+            last_prediction = predict()
+            last_trigger = None
+
+        elif kind == CLEAR:
+            if last_prediction is not None:
+                drawings.append(last_prediction)
+            image_handler.clear()
+            last_prediction = None
+
+    if last_prediction is not None:
+        drawings.append(last_prediction)
+
+    return {"latencies_ms": latencies, "drawings": drawings, "seconds": time.perf_counter() - start}
+
+
+def replay_file(handler, path, realtime=False, throttle_ms=THROTTLE_MS, rasterization="canvas"):
+    """
+    Replays a recording file and scores its drawings against its label, if any.
+
+    Returns:
+        dict: The `replay` result, plus "path", "label", "predicted" (labels of the
+        drawings) and "correct" (number of drawings predicted as the label, None if
+        the recording has no label).
+    """
+    events, meta = load_recording(path)
+    result = replay(events, handler, tuple(meta["canvas"]), realtime, throttle_ms, rasterization)
+
+    label_mapping = get_label_mapping(handler.output_size)
+    predicted = [label_mapping.get(index, str(index)) for index in result.pop("drawings")]
+
+    result.update(
+        path=str(path),
+        label=meta["label"],
+        predicted=predicted,
+        correct=None if meta["label"] is None else sum(label == meta["label"] for label in predicted),
+    )
+    return result
+
+
+def _init_worker(model_paths, handler_options):
+    global _worker_handler
+    _worker_handler = load_handler(model_paths, **handler_options)
+
+
+def _replay_in_worker(path, realtime, throttle_ms, rasterization):
+    return replay_file(_worker_handler, path, realtime, throttle_ms, rasterization)
+
+
+def replay_files(
+    paths,
+    model_paths,
+    workers=1,
+    realtime=False,
+    throttle_ms=THROTTLE_MS,
+    rasterization="canvas",
+    **handler_options,
+):
+    """
+    Replays recording files and yields their `replay_file` results, in order.
+
+    With workers > 1 the files are shared among a process pool, each worker
+    holding its own model(s). Extra keyword arguments (weights, cache_size, ...)
+    are passed to `load_handler`.
+    """
+    if workers <= 1:
+        handler = load_handler(model_paths, **handler_options)
+        for path in paths:
+            yield replay_file(handler, path, realtime, throttle_ms, rasterization)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(model_paths, handler_options)
+    ) as pool:
+        # Keep a bounded number of recordings in flight so huge corpora don't fill memory
+        pending = []
+        for path in paths:
+            pending.append(pool.submit(_replay_in_worker, path, realtime, throttle_ms, rasterization))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+
+        for future in pending:
+            yield future.result()
@@ -0,0 +1,113 @@
+"""
+Splits a drawing into characters.
+
+Ink is labelled into connected components, then components that belong to the
+same character are merged: parts stacked on top of each other (the dot of an
+i, the two bars of an =, the cap of a 5 drawn separately) and parts separated
+by a small gap (broken strokes). Each character keeps only its own ink, goes
+through the usual 20x20 / center-of-mass preprocessing, and all of them are
+sent to the model in a single batch.
+"""
+
+import numpy as np
+
+from gui.preprocessing import preprocess_batch, stack_images
+
+# Components overlapping horizontally by this fraction of the narrower one are merged
+OVERLAP_RATIO = 0.5
+# Components closer than this fraction of the tallest component are merged
+GAP_RATIO = 0.08
+# Characters with less ink than this fraction of the largest one are dropped as noise
+MIN_AREA_RATIO = 0.02
+
+
+def segment(region, overlap_ratio=OVERLAP_RATIO, gap_ratio=GAP_RATIO, min_area_ratio=MIN_AREA_RATIO):
+    """
+    Finds the characters of a grayscale drawing (white ink on black).
+
+    Args:
+        region (np.ndarray): uint8 image of shape (H, W), such as `ImageHandler.snapshot()`.
+
+    Returns:
+        list: (box, image) per character, from left to right. box is (left, top, right, bottom)
+        in region coordinates and image the character's own ink, cropped to its box.
+    """
+    if region is None:
+        return []
+
+    # Imported on first use: scipy.ndimage alone would double the GUI startup time
+    import scipy.ndimage as ndi
+
+    labels, count = ndi.label(region > 0, structure=np.ones((3, 3)))
+    if count == 0:
+        return []
+
+    areas = np.bincount(labels.ravel(), minlength=count + 1)
+    groups = [
+        {"labels": [i + 1], "box": (s[1].start, s[0].start, s[1].stop, s[0].stop), "area": int(areas[i + 1])}
+        for i, s in enumerate(ndi.find_objects(labels))
+    ]
+
+    max_gap = gap_ratio * max(group["box"][3] - group["box"][1] for group in groups)
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                if _belong_together(groups[i]["box"], groups[j]["box"], overlap_ratio, max_gap):
+                    groups[i] = _merge(groups[i], groups[j])
+                    del groups[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    largest = max(group["area"] for group in groups)
+    groups = [group for group in groups if group["area"] >= min_area_ratio * largest]
+    groups.sort(key=lambda group: group["box"][0])
+
+    segments = []
+    for group in groups:
+        left, top, right, bottom = group["box"]
+        own_ink = np.isin(labels[top:bottom, left:right], group["labels"])
+        segments.append((group["box"], np.where(own_ink, region[top:bottom, left:right], 0).astype(np.uint8)))
+
+    return segments
+
+
+def _belong_together(a, b, overlap_ratio, max_gap):
+    overlap = min(a[2], b[2]) - max(a[0], b[0])
+    if overlap >= overlap_ratio * min(a[2] - a[0], b[2] - b[0]):
+        return True
+
+    dx = max(0, max(a[0], b[0]) - min(a[2], b[2]))
+    dy = max(0, max(a[1], b[1]) - min(a[3], b[3]))
+    return max(dx, dy) <= max_gap
+
+
+def _merge(a, b):
+    return {
+        "labels": a["labels"] + b["labels"],
+        "box": (min(a["box"][0], b["box"][0]), min(a["box"][1], b["box"][1]),
+                max(a["box"][2], b["box"][2]), max(a["box"][3], b["box"][3])),
+        "area": a["area"] + b["area"],
+    }
+
+
+def predict_segments(handler, region):
+    """
+    Segments a drawing and predicts all its characters with one batched call.
+
+    Returns:
+        tuple: (boxes, images, predictions) with images the (N, 28, 28) float32
+        model inputs and predictions the (N, classes) probabilities, N possibly 0.
+    """
+    segments = segment(region)
+    if not segments:
+        return [], np.zeros((0, 28, 28), dtype=np.float32), np.zeros((0, handler.output_size), dtype=np.float32)
+
+    boxes = [box for box, _ in segments]
+    images = preprocess_batch(stack_images([image for _, image in segments]))
+
+    return boxes, images, handler.predict_normalized(images)
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from gui.labels import get_label_mapping
+from gui.preprocessing import preprocess_batch, stack_images
+
+# Largest side of a raw canvas: canvases of a batch are padded to the largest one
+MAX_CANVAS_SIZE = 4096
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class LatencyStats:
+    """Keeps the latencies and batch sizes of the most recent requests."""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, latencies):
+        self.latencies.extend(latencies)
+        self.batch_sizes[len(latencies)] += 1
+        self.requests += len(latencies)
+        self.batches += 1
+
+    def summary(self):
+        latencies = np.array(self.latencies) * 1000
+        p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0.0, 0.0)
+
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "latency_p50_ms": round(float(p50), 3),
+            "latency_p99_ms": round(float(p99), 3),
+            "mean_batch_size": round(self.requests / max(self.batches, 1), 2),
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent requests into batches: a batch is sent to the model when
+    it reaches max_batch_size, or max_delay_ms after its first request arrived,
+    whichever comes first.
+
+    The model runs on a single background thread: the layers keep per-call state
+    and must not be used concurrently, and the event loop stays free to accept
+    the requests of the next batch meanwhile.
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_delay_ms=5.0):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.stats = LatencyStats()
+
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+
+    async def predict(self, image, preprocessed):
+        """Queues one image and waits for its probability vector."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, preprocessed, time.perf_counter(), future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except TimeoutError:
+                    break
+
+            try:
+                predictions = await loop.run_in_executor(self._executor, self._predict, batch)
+            except Exception as e:  # noqa: BLE001 - any model error goes to the requests of the batch
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            self.stats.record_batch([now - arrival for _, _, arrival, _ in batch])
+
+            for (*_, future), prediction in zip(batch, predictions):
+                if future.done():
+                    continue
+                if isinstance(prediction, Exception):
+                    future.set_exception(prediction)
+                else:
+                    future.set_result(prediction)
+
+    def _predict(self, batch):
+        """
+        Predicts a batch. If it fails, its requests are retried one at a time,
+        so a bad image only fails its own request (its error takes its place in
+        the returned list).
+        """
+        try:
+            return list(self._predict_batch(batch))
+        except Exception:  # noqa: BLE001 - any error of the batch is retried request by request
+            if len(batch) == 1:
+                raise
+
+        predictions = []
+        for request in batch:
+            try:
+                predictions.append(self._predict_batch([request])[0])
+            except Exception as e:  # noqa: BLE001 - the error of one request must not fail the others
+                predictions.append(e)
+        return predictions
+
+    def _predict_batch(self, batch):
+        inputs = np.empty((len(batch), 28, 28), dtype=np.float32)
+
+        canvas_idx = [i for i, (_, preprocessed, _, _) in enumerate(batch) if not preprocessed]
+        ready_idx = [i for i, (_, preprocessed, _, _) in enumerate(batch) if preprocessed]
+
+        # Raw canvases of the whole batch go through the vectorized preprocessing at once
+        if canvas_idx:
+            inputs[canvas_idx] = preprocess_batch(stack_images([batch[i][0] for i in canvas_idx]))
+        for i in ready_idx:
+            inputs[i] = batch[i][0]
+
+        return self.handler.predict_normalized(inputs)
+
+
+def decode_image(body, content_type):
+    """
+    Decodes a request body into (image, preprocessed). Bodies are either .npy
+    arrays (application/x-npy) or image files (image/png, ...). 28x28 inputs
+    are taken as already preprocessed, anything else as a raw canvas (white ink
+    on black) that still needs the crop / resize / centering.
+
+    Raises:
+        ImageTooLarge: If a side of the image exceeds MAX_CANVAS_SIZE.
+        ValueError: If the body is not a 2D image.
+    """
+    if content_type == "application/x-npy":
+        array = np.load(BytesIO(body), allow_pickle=False)
+        shape = array.shape
+    else:
+        # Checked before decoding the pixels
+        image = Image.open(BytesIO(body))
+        shape = image.size[::-1]
+
+    if len(shape) != 2:
+        raise ValueError(f"Expected a 2D image, got shape {shape}")
+    if max(shape) > MAX_CANVAS_SIZE:
+        raise ImageTooLarge(f"Image of shape {shape} exceeds {MAX_CANVAS_SIZE} pixels per side")
+
+    if content_type != "application/x-npy":
+        array = np.asarray(image.convert("L"))
+
+    if array.shape == (28, 28):
+        if array.dtype == np.uint8:
+            return array.astype(np.float32) / 255.0, True
+        return array.astype(np.float32), True
+
+    # Like 28x28 inputs, canvases that are not uint8 are taken as values in [0, 1]
+    if array.dtype != np.uint8:
+        array = np.rint(np.clip(array.astype(np.float32), 0, 1) * 255)
+    return array.astype(np.uint8), False
+
+
+class InferenceServer:
+    """
+    Minimal HTTP/1.1 server (TCP or Unix socket) sharing one loaded model.
+
+    Routes:
+        POST /predict   body: .npy array or image file, returns the label and probabilities
+        GET  /stats     latency percentiles and batch size distribution
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_delay_ms=5.0):
+        self.batcher = MicroBatcher(handler, max_batch_size, max_delay_ms)
+        self.label_mapping = get_label_mapping(handler.output_size)
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_socket=None):
+        batcher_task = asyncio.create_task(self.batcher.run())
+
+        if unix_socket:
+            server = await asyncio.start_unix_server(self._handle_connection, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                batcher_task.cancel()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self._route(method, path, headers, body)
+                data = json.dumps(payload).encode()
+
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, headers, body):
+        if method == "GET" and path == "/stats":
+            return "200 OK", self.batcher.stats.summary()
+
+        if method == "POST" and path == "/predict":
+            try:
+                image, preprocessed = decode_image(body, headers.get("content-type", ""))
+            except ImageTooLarge as e:
+                return "413 Payload Too Large", {"error": str(e)}
+            except Exception as e:  # noqa: BLE001 - any decoding error is a bad request
+                return "400 Bad Request", {"error": str(e)}
+
+            try:
+                probabilities = await self.batcher.predict(image, preprocessed)
+            except Exception as e:  # noqa: BLE001 - any prediction error is answered with a 500
+                return "500 Internal Server Error", {"error": str(e)}
+            idx = int(np.argmax(probabilities))
+
+            return "200 OK", {
+                "label": self.label_mapping.get(idx, str(idx)),
+                "index": idx,
+                "probabilities": [round(float(p), 6) for p in probabilities],
+            }
+
+        return "404 Not Found", {"error": f"Unknown route {method} {path}"}
@@ -0,0 +1,41 @@
+"""
+Startup phases of the GUI, timed from the very first line of run_gui.py:
+
+- imports: the GUI modules are imported;
+- window: the widgets are created;
+- interactive: the first frame is drawn and the canvas takes input;
+- model_loaded: the model is loaded and its inference plan compiled;
+- model_warm: a first prediction went through (buffers allocated, BLAS initialized).
+"""
+
+import json
+import time
+from pathlib import Path
+
+
+class StartupTimer:
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.phases = {}
+
+    def mark(self, phase):
+        """Records the time elapsed since the origin. Thread safe."""
+        self.phases[phase] = time.perf_counter() - self.origin
+
+    def as_ms(self):
+        """{phase: milliseconds since the origin}, in chronological order."""
+        return {phase: seconds * 1000 for phase, seconds in sorted(self.phases.items(), key=lambda item: item[1])}
+
+    def report(self):
+        lines = ["Startup:"]
+        previous = 0.0
+        for phase, ms in self.as_ms().items():
+            lines.append(f"   {phase:<14} {ms:>8.1f} ms   (+{ms - previous:.1f})")
+            previous = ms
+
+        return "\n".join(lines)
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.as_ms(), f, indent=2)
@@ -0,0 +1,125 @@
+import argparse
+import contextlib
+import csv
+import sys
+import time
+from pathlib import Path
+
+from gui.batch import score
+from gui.labels import get_label_mapping
+from gui.precision import PRECISIONS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless batch handwriting recognition")
+
+    parser.add_argument(
+        "source",
+        type=str,
+        help="Directory or archive (.zip, .tar, .tar.gz) of scanned characters",
+    )
+    parser.add_argument(
+        "-m", "--model_path",
+        type=str,
+        nargs="+",
+        default=["output/dense_mnist.npz"],
+        help="Path to the trained model file (.npz), several for an ensemble",
+    )
+    parser.add_argument(
+        "--weights_file",
+        type=str,
+        default=None,
+        help="Ensemble only: weights learned by tools/ensemble.py (JSON)",
+    )
+    parser.add_argument(
+        "--cascade",
+        type=str,
+        default=None,
+        help="Run the models as a cascade calibrated by tools/cascade.py (JSON) instead of an ensemble",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="CSV file to write the predictions to (defaults to stdout)",
+    )
+    parser.add_argument(
+        "-b", "--batch_size",
+        type=int,
+        default=256,
+        help="Number of images sent to the model in a single predict call",
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to shard the batches across",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=4096,
+        help="Size of the prediction cache of each worker (0 disables it)",
+    )
+    parser.add_argument(
+        "--near_duplicate",
+        type=float,
+        default=None,
+        help="Reuse the previous result when the mean pixel difference is below this value (0-1)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="Dtype the weights are stored in for inference (float16 halves their memory, see gui/precision.py)",
+    )
+    parser.add_argument(
+        "--invert",
+        action="store_true",
+        help="Invert the images (use for dark ink on white paper)",
+    )
+
+    args = parser.parse_args()
+
+    model_paths = [Path(path) for path in args.model_path]
+
+    for model_path in model_paths:
+        if not model_path.exists():
+            print(f"Error: Model file not found at {model_path}")
+            print("Please train a model first using scripts in the train/ directory.")
+            sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(args.output, "w", newline="")) if args.output else sys.stdout
+        writer = csv.writer(out)
+        writer.writerow(["file", "label", "probability"])
+
+        start = time.perf_counter()
+        count = 0
+        cache_stats = {}
+        label_mapping = None
+
+        for name, idx, probabilities in score(
+            args.source,
+            model_paths,
+            args.batch_size,
+            args.workers,
+            args.invert,
+            cache_stats=cache_stats,
+            cache_size=args.cache_size,
+            near_duplicate_threshold=args.near_duplicate,
+            weights=args.weights_file,
+            cascade=args.cascade,
+            precision=args.precision,
+        ):
+            if label_mapping is None:
+                label_mapping = get_label_mapping(len(probabilities))
+            writer.writerow([name, label_mapping.get(idx, str(idx)), f"{probabilities[idx]:.4f}"])
+            count += 1
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scored {count} images in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} images/s)",
+        file=sys.stderr,
+    )
+    if cache_stats:
+        print("Prediction cache: " + ", ".join(f"{k}={v}" for k, v in cache_stats.items()), file=sys.stderr)
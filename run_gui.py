@@ -1,26 +1,122 @@
+import time
+
+# Origin of the startup breakdown, before any other import
+STARTED = time.perf_counter()
+
 import argparse
 from pathlib import Path
+from gui.imagehandler import RASTERIZATIONS
 from gui.paint import Paint
+from gui.precision import PRECISIONS
+from gui.startup import StartupTimer
 import sys
 
 if __name__ == "__main__":
+    startup = StartupTimer(STARTED)
+    startup.mark("imports")
+
     parser = argparse.ArgumentParser(description="Handwriting Recognition GUI")
 
     parser.add_argument(
         "-m", "--model_path",
         type=str,
-        default="output/dense_mnist.npz",
-        help="Path to the trained model file (.npz)",
+        nargs="+",
+        default=["output/dense_mnist.npz"],
+        help="Path to the trained model file (.npz), several for an ensemble",
+    )
+    parser.add_argument(
+        "--weights",
+        type=float,
+        nargs="+",
+        default=None,
+        help="Ensemble only: one weight per model (equal weights by default)",
+    )
+    parser.add_argument(
+        "--weights_file",
+        type=str,
+        default=None,
+        help="Ensemble only: weights learned by tools/ensemble.py (JSON)",
+    )
+    parser.add_argument(
+        "--cascade",
+        type=str,
+        default=None,
+        help="Run the models as a cascade calibrated by tools/cascade.py (JSON) instead of an ensemble",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Show per-stage latencies in an overlay and write a trace file on exit",
+    )
+    parser.add_argument(
+        "--trace_path",
+        type=str,
+        default="output/trace.json",
+        help="Where to write the trace file when profiling (Chrome trace format)",
+    )
+    parser.add_argument(
+        "--fast_startup",
+        action="store_true",
+        help="Show the canvas first and load the model in the background, then print the startup breakdown",
+    )
+    parser.add_argument(
+        "--startup_report",
+        type=str,
+        default=None,
+        help="Write the startup phases (JSON, ms) to this file and exit once the model is ready",
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        default=None,
+        help="Record the strokes for run_replay.py, to this .npz file or to a timestamped file in this directory",
+    )
+    parser.add_argument(
+        "--record_label",
+        type=str,
+        default=None,
+        help="What is being drawn (e.g. 7), stored in the recording to measure the replay accuracy",
+    )
+    parser.add_argument(
+        "--rasterization",
+        choices=RASTERIZATIONS,
+        default="canvas",
+        help="Draw the strokes on a canvas-sized image, or only rasterize the inked region (vector, for large screens)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="Dtype the weights are stored in for inference (float16 halves their memory, see gui/precision.py)",
     )
 
     args = parser.parse_args()
 
-    model_path = Path(args.model_path)
+    model_paths = [Path(path) for path in args.model_path]
 
-    if not model_path.exists():
-        print(f"Error: Model file not found at {model_path}")
-        print("Please train a model first using scripts in the train/ directory.")
-        sys.exit(1)
+    for model_path in model_paths:
+        if not model_path.exists():
+            print(f"Error: Model file not found at {model_path}")
+            print("Please train a model first using scripts in the train/ directory.")
+            sys.exit(1)
 
-    print(f"Starting GUI with model: {model_path}")
-    Paint(model_path)
\ No newline at end of file
+    if args.cascade:
+        print(f"Starting GUI with a cascade of: {', '.join(str(path) for path in model_paths)}")
+    elif len(model_paths) > 1:
+        print(f"Starting GUI with an ensemble of: {', '.join(str(path) for path in model_paths)}")
+    else:
+        print(f"Starting GUI with model: {model_paths[0]}")
+    Paint(
+        model_paths,
+        profile=args.profile,
+        trace_path=args.trace_path,
+        fast_startup=args.fast_startup,
+        startup=startup,
+        startup_report=args.startup_report,
+        ensemble_weights=args.weights_file or args.weights,
+        cascade=args.cascade,
+        record_path=args.record,
+        record_label=args.record_label,
+        rasterization=args.rasterization,
+        precision=args.precision,
+    )
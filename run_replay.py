@@ -0,0 +1,143 @@
+import argparse
+import contextlib
+import csv
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gui.imagehandler import RASTERIZATIONS
+from gui.precision import PRECISIONS
+from gui.recording import find_recordings
+from gui.replay import THROTTLE_MS, replay_files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay stroke recordings headlessly")
+
+    parser.add_argument(
+        "sources",
+        type=str,
+        nargs="+",
+        help="Recording files (.npz) or directories of recordings",
+    )
+    parser.add_argument(
+        "-m", "--model_path",
+        type=str,
+        nargs="+",
+        default=["output/dense_mnist.npz"],
+        help="Path to the trained model file (.npz), several for an ensemble",
+    )
+    parser.add_argument(
+        "--weights_file",
+        type=str,
+        default=None,
+        help="Ensemble only: weights learned by tools/ensemble.py (JSON)",
+    )
+    parser.add_argument(
+        "--cascade",
+        type=str,
+        default=None,
+        help="Run the models as a cascade calibrated by tools/cascade.py (JSON) instead of an ensemble",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Wait for the recorded delays between events instead of replaying at full speed",
+    )
+    parser.add_argument(
+        "--throttle_ms",
+        type=int,
+        default=THROTTLE_MS,
+        help="Minimum delay between two predictions during a stroke (recorded time)",
+    )
+    parser.add_argument(
+        "--rasterization",
+        choices=RASTERIZATIONS,
+        default="canvas",
+        help="Draw the strokes on a canvas-sized image, or only rasterize the inked region (vector)",
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to share the recordings across",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=256,
+        help="Size of the prediction cache (256 like the GUI, 0 disables it)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="Dtype the weights are stored in for inference (float16 halves their memory, see gui/precision.py)",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="CSV file to write the per-recording results to",
+    )
+
+    args = parser.parse_args()
+
+    for model_path in args.model_path:
+        if not Path(model_path).exists():
+            print(f"Error: Model file not found at {model_path}")
+            sys.exit(1)
+
+    paths = find_recordings(args.sources)
+    if not paths:
+        print("Error: no recordings found")
+        sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(args.output, "w", newline="")) if args.output else None
+        writer = csv.writer(out) if out else None
+        if writer:
+            writer.writerow(["file", "label", "predicted", "predictions", "p50_ms", "max_ms"])
+
+        start = time.perf_counter()
+        latencies = []
+        drawings = 0
+        labelled = 0
+        correct = 0
+
+        for result in replay_files(
+            paths,
+            args.model_path,
+            args.workers,
+            args.realtime,
+            args.throttle_ms,
+            args.rasterization,
+            weights=args.weights_file,
+            cascade=args.cascade,
+            cache_size=args.cache_size,
+            precision=args.precision,
+        ):
+            latencies.extend(result["latencies_ms"])
+            drawings += len(result["predicted"])
+            if result["correct"] is not None:
+                labelled += len(result["predicted"])
+                correct += result["correct"]
+
+            if writer:
+                writer.writerow([
+                    result["path"],
+                    result["label"] or "",
+                    " ".join(result["predicted"]),
+                    len(result["latencies_ms"]),
+                    f"{np.percentile(result['latencies_ms'], 50):.3f}" if result["latencies_ms"] else "",
+                    f"{max(result['latencies_ms']):.3f}" if result["latencies_ms"] else "",
+                ])
+
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(paths)} recordings ({drawings} drawings, {len(latencies)} predictions) in {elapsed:.2f}s")
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"   end-to-end latency  p50 {p50:.2f} ms   p95 {p95:.2f} ms   p99 {p99:.2f} ms")
+    if labelled:
+        print(f"   accuracy            {correct / labelled:.2%} of {labelled} labelled drawings")
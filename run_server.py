@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from gui.neuralnethandler import NeuralNetHandler
+from gui.precision import PRECISIONS
+from gui.server import InferenceServer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Handwriting Recognition inference server")
+
+    parser.add_argument(
+        "-m", "--model_path",
+        type=str,
+        default="output/dense_mnist.npz",
+        help="Path to the trained model file (.npz)",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument(
+        "--unix_socket",
+        type=str,
+        default=None,
+        help="Listen on this Unix socket instead of TCP",
+    )
+    parser.add_argument(
+        "-b", "--max_batch_size",
+        type=int,
+        default=64,
+        help="Maximum number of requests sent to the model at once",
+    )
+    parser.add_argument(
+        "-d", "--max_delay_ms",
+        type=float,
+        default=5.0,
+        help="Latency budget: how long the first request of a batch waits for others",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=4096,
+        help="Size of the prediction cache (0 disables it)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="Dtype the weights are stored in for inference (float16 halves their memory, see gui/precision.py)",
+    )
+
+    args = parser.parse_args()
+
+    model_path = Path(args.model_path)
+
+    if not model_path.exists():
+        print(f"Error: Model file not found at {model_path}")
+        print("Please train a model first using scripts in the train/ directory.")
+        sys.exit(1)
+
+    handler = NeuralNetHandler(model_path, cache_size=args.cache_size, precision=args.precision)
+    server = InferenceServer(handler, args.max_batch_size, args.max_delay_ms)
+
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Serving {model_path} on {where}")
+
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
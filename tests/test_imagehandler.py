@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from gui.imagehandler import RASTERIZATIONS, ImageHandler
+
+
+@pytest.mark.parametrize("rasterization", RASTERIZATIONS)
+def test_off_canvas_stroke_leaves_no_ink(rasterization):
+    handler = ImageHandler(600, 600, rasterization)
+    handler.add_line(650, 300, 700, 300, 10, "white")
+
+    assert handler.bbox is None
+    assert handler.snapshot() is None
+
+
+@pytest.mark.parametrize("rasterization", RASTERIZATIONS)
+def test_stroke_leaving_the_canvas_is_clipped(rasterization):
+    handler = ImageHandler(600, 600, rasterization)
+    handler.add_line(650, 300, 700, 300, 10, "white")
+    handler.add_line(590, 300, 700, 300, 10, "white")
+
+    region = handler.snapshot()
+    assert region is not None and np.asarray(region).max() > 0
+    assert handler.bbox[2] <= 600
@@ -0,0 +1,27 @@
+from mpneuralnetwork.layers import Dense
+from mpneuralnetwork.losses import CategoricalCrossEntropy
+from mpneuralnetwork.model import Model
+from mpneuralnetwork.optimizers import Adam
+from mpneuralnetwork.serialization import save_model
+
+from gui.recording import StrokeRecorder
+from gui.replay import replay_files
+
+
+def test_replay_with_an_off_canvas_segment(tmp_path):
+    model_path = tmp_path / "model.npz"
+    save_model(Model([Dense(10, input_size=784)], CategoricalCrossEntropy(), Adam()), str(model_path))
+
+    # The drag starts beyond the right edge of the canvas, then comes back onto it
+    recorder = StrokeRecorder(600, 600)
+    recorder.line(650, 300, 700, 300, 10)
+    recorder.release()
+    recorder.line(700, 300, 590, 300, 10)
+    recorder.line(590, 300, 400, 350, 10)
+    recorder.release()
+    recording = recorder.save(tmp_path / "recording.npz")
+
+    for rasterization in ("canvas", "vector"):
+        (result,) = replay_files([recording], [model_path], rasterization=rasterization)
+        assert len(result["predicted"]) == 1
+        assert len(result["latencies_ms"]) == 4
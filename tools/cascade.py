@@ -0,0 +1,116 @@
+"""
+Calibrates a two-stage cascade (see gui/cascade.py) on MNIST and reports how
+often it escalates.
+
+    python -m tools.cascade output/dense_mnist.npz output/super_cnn_mnist.npz -o output/cascade.json
+
+The threshold is the lowest one reaching the target accuracy on the validation
+images (by default, the accuracy of the second model alone). The cascade is
+then compared with both models on the test set. The calibration file is used
+with `run_gui.py -m <first> <second> --cascade output/cascade.json`.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gui.cascade import CRITERIA, CascadeHandler, calibrate, save_calibration
+from gui.neuralnethandler import NeuralNetHandler
+from train.dataset import load_mnist
+
+
+def predict_probabilities(handler, X, batch_size=1000):
+    return np.concatenate(
+        [handler.predict_batch(X[i : i + batch_size].reshape(-1, 28, 28)) for i in range(0, len(X), batch_size)]
+    )
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate a confidence-gated cascade of two models")
+
+    parser.add_argument("first", type=str, help="The fast model, run on every image (.npz)")
+    parser.add_argument("second", type=str, help="The strong model, run on the escalated images (.npz)")
+    parser.add_argument(
+        "-t", "--target_accuracy",
+        type=float,
+        default=None,
+        help="Validation accuracy the cascade must reach (defaults to the second model's)",
+    )
+    parser.add_argument(
+        "--criterion",
+        choices=CRITERIA,
+        default=None,
+        help="Confidence measure (defaults to the one escalating the fewest images)",
+    )
+    parser.add_argument("-o", "--output", type=str, default="output/cascade.json", help="Calibration file")
+
+    args = parser.parse_args()
+
+    for path in (args.first, args.second):
+        if not Path(path).exists():
+            print(f"Error: Model file not found at {path}")
+            sys.exit(1)
+
+    print("Loading data...")
+    (_, _), (X_val, y_val), (X_test, y_test) = load_mnist(lazy=True, one_hot=False)
+    y_val, y_test = np.asarray(y_val), np.asarray(y_test)
+
+    first, second = NeuralNetHandler(args.first), NeuralNetHandler(args.second)
+    first_val, second_val = predict_probabilities(first, X_val), predict_probabilities(second, X_val)
+
+    target = args.target_accuracy
+    if target is None:
+        target = float(np.mean(second_val.argmax(axis=1) == y_val))
+
+    results = calibrate(first_val, second_val, y_val, target)
+    criterion = args.criterion or min(
+        CRITERIA, key=lambda c: (results[c]["accuracy"] < target, results[c]["escalation_rate"])
+    )
+
+    print(f"Validation (target accuracy {target:.4f}):")
+    for name, result in results.items():
+        print(
+            f"   {name:<12} threshold {result['threshold']:.4f}   accuracy {result['accuracy']:.4f}   "
+            f"escalation rate {result['escalation_rate']:.2%}{'   <-' if name == criterion else ''}"
+        )
+    if results[criterion]["accuracy"] < target:
+        print("   The target is out of reach, using the most accurate threshold")
+
+    handler = CascadeHandler([args.first, args.second], thresholds=[results[criterion]["threshold"]], criterion=criterion)
+    cascade_test = predict_probabilities(handler, X_test)
+    escalation_rate = handler.summary()["cascade"]["escalation_rate"]
+
+    print("Test:")
+    for name, model in ((handler.names[0], first), (handler.names[1], second)):
+        accuracy = np.mean(predict_probabilities(model, X_test).argmax(axis=1) == y_test)
+        seconds = timed(lambda model=model: predict_probabilities(model, X_test))
+        print(f"   {name:<24} accuracy {accuracy:.4f}   {len(X_test) / seconds:8.0f} images/s")
+
+    cascade_accuracy = float(np.mean(cascade_test.argmax(axis=1) == y_test))
+    seconds = timed(lambda: predict_probabilities(handler, X_test))
+    print(
+        f"   {'cascade':<24} accuracy {cascade_accuracy:.4f}   {len(X_test) / seconds:8.0f} images/s"
+        f"   escalation rate {escalation_rate:.2%}"
+    )
+
+    save_calibration(
+        args.output,
+        handler.names,
+        criterion,
+        [results[criterion]["threshold"]],
+        report={
+            "target_accuracy": target,
+            "validation": results[criterion],
+            "test": {"accuracy": cascade_accuracy, "escalation_rate": escalation_rate},
+        },
+    )
+    print(f"Calibration saved to {args.output}")
@@ -0,0 +1,89 @@
+"""
+Evaluates an ensemble of trained models on MNIST and optionally learns the
+weights of its members.
+
+    python -m tools.ensemble output/dense_mnist.npz output/cnn_mnist.npz output/super_cnn_mnist.npz \
+        --fit output/ensemble_weights.json
+
+The weights are fitted on the validation images, every member and the ensemble
+are then compared on the test set. The weights file is used with
+`run_gui.py -m <models...> --weights_file output/ensemble_weights.json`.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from gui.ensemble import EXECUTORS, EnsembleHandler, fit_weights, save_weights
+from train.dataset import load_mnist
+
+
+def member_predictions(handler, X, batch_size=1000):
+    """(members, N, classes) probabilities of every member, batch by batch through the ensemble."""
+    return np.concatenate(
+        [
+            handler.predict_members(X[i : i + batch_size].reshape(-1, 28, 28).astype(np.float32) / 255.0)
+            for i in range(0, len(X), batch_size)
+        ],
+        axis=1,
+    )
+
+
+def predict_labels(handler, X, batch_size=1000):
+    return np.concatenate(
+        [
+            handler.predict_batch(X[i : i + batch_size].reshape(-1, 28, 28)).argmax(axis=1)
+            for i in range(0, len(X), batch_size)
+        ]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate (and fit) an ensemble of saved models")
+
+    parser.add_argument("model_paths", type=str, nargs="+", help="Model files of the members (.npz)")
+    parser.add_argument(
+        "--weights",
+        type=float,
+        nargs="+",
+        default=None,
+        help="One weight per member (equal weights by default)",
+    )
+    parser.add_argument(
+        "--fit",
+        type=str,
+        default=None,
+        help="Learn the weights on the validation set and save them to this JSON file",
+    )
+    parser.add_argument("--executor", choices=EXECUTORS, default="thread", help="Where the members run")
+
+    args = parser.parse_args()
+
+    for path in args.model_paths:
+        if not Path(path).exists():
+            print(f"Error: Model file not found at {path}")
+            sys.exit(1)
+
+    print("Loading data...")
+    (_, _), (X_val, y_val), (X_test, y_test) = load_mnist(lazy=True, one_hot=False)
+
+    handler = EnsembleHandler(args.model_paths, weights=args.weights, executor=args.executor)
+
+    if args.fit:
+        weights = fit_weights(member_predictions(handler, X_val), np.asarray(y_val))
+        save_weights(args.fit, handler.names, weights)
+        print(f"Learned weights saved to {args.fit}")
+        handler.close()
+        handler = EnsembleHandler(args.model_paths, weights=args.fit, executor=args.executor)
+
+    test_predictions = member_predictions(handler, X_test)
+    for name, prediction in zip(handler.names, test_predictions):
+        print(f"   {name:<24} accuracy {np.mean(prediction.argmax(axis=1) == y_test):.4f}")
+
+    ensemble_labels = predict_labels(handler, X_test)
+    print(f"   {'ensemble':<24} accuracy {np.mean(ensemble_labels == y_test):.4f}\n")
+    print(handler.report())
+
+    handler.close()
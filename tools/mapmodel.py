@@ -0,0 +1,62 @@
+"""
+Exports a trained model (or a quantized variant) as a memory-mapped model file
+(see gui/mappedmodel.py) and checks it predicts like the original.
+
+    python -m tools.mapmodel output/dense_mnist.npz
+
+Mapped files load in a few milliseconds and share their weights across the
+processes using them. They are inference-only: keep the .npz to train further.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from gui.mappedmodel import SUFFIX, save_mapped
+from gui.neuralnethandler import NeuralNetHandler
+
+
+def timed_load(model_path):
+    start = time.perf_counter()
+    handler = NeuralNetHandler(model_path)
+    return handler, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a model as a memory-mapped file")
+
+    parser.add_argument("model_path", type=str, help="Path to the trained model file (.npz)")
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help=f"Where to save the mapped model (defaults to <model>{SUFFIX})",
+    )
+
+    args = parser.parse_args()
+
+    model_path = Path(args.model_path)
+    output = Path(args.output) if args.output else model_path.with_suffix(SUFFIX)
+
+    if not model_path.exists():
+        print(f"Error: Model file not found at {model_path}")
+        sys.exit(1)
+
+    with np.load(model_path) as data:
+        model_config = str(data["model_config"])
+
+    save_mapped(NeuralNetHandler(model_path, backend="model").model, output, model_config)
+
+    original, original_load = timed_load(model_path)
+    mapped, mapped_load = timed_load(output)
+
+    x = np.random.default_rng(0).random((256, 28, 28), dtype=np.float32)
+    difference = np.max(np.abs(original.predict_normalized(x) - mapped.predict_normalized(x)))
+
+    print(f"Mapped model saved to {output}")
+    print(f"   size      {model_path.stat().st_size / 1e6:8.2f} MB -> {output.stat().st_size / 1e6:8.2f} MB")
+    print(f"   load time {original_load * 1000:8.1f} ms -> {mapped_load * 1000:8.1f} ms")
+    print(f"   largest output difference {difference:.2e}")
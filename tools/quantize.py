@@ -0,0 +1,96 @@
+"""
+Quantizes a trained model to int8 or float16 and reports the accuracy drop.
+
+    python -m tools.quantize output/dense_mnist.npz --mode int8
+
+The int8 clipping ranges are calibrated on the first validation images of
+MNIST, the accuracy is compared on the test set.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from mpneuralnetwork import serialization
+from mpneuralnetwork.layers import Convolutional
+
+from gui.neuralnethandler import NeuralNetHandler
+from gui.quantization import MODES, save_quantized
+from train.dataset import load_mnist, normalize
+
+
+def predict_labels(handler, X, batch_size=1000):
+    return np.concatenate(
+        [
+            handler.predict_batch(X[i : i + batch_size].reshape(-1, 28, 28)).argmax(axis=1)
+            for i in range(0, len(X), batch_size)
+        ]
+    )
+
+
+def timed_load(model_path):
+    start = time.perf_counter()
+    handler = NeuralNetHandler(model_path)
+    return handler, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post-training quantization of a saved model")
+
+    parser.add_argument("model_path", type=str, help="Path to the trained model file (.npz)")
+    parser.add_argument("--mode", choices=MODES, default="int8", help="Storage type of the weights")
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="Where to save the quantized model (defaults to <model>_<mode>.npz)",
+    )
+    parser.add_argument(
+        "-c", "--calibration_size",
+        type=int,
+        default=1000,
+        help="Number of validation images used to calibrate the int8 ranges",
+    )
+
+    args = parser.parse_args()
+
+    model_path = Path(args.model_path)
+    output = Path(args.output) if args.output else model_path.with_name(f"{model_path.stem}_{args.mode}.npz")
+
+    if not model_path.exists():
+        print(f"Error: Model file not found at {model_path}")
+        sys.exit(1)
+
+    model = serialization.load_model(model_path)
+    conv = isinstance(model.layers[0], Convolutional)
+
+    print("Loading data...")
+    (_, _), (X_val, _), (X_test, y_test) = load_mnist(conv=conv, lazy=True, one_hot=False)
+
+    with np.load(model_path) as data:
+        architecture, model_config = str(data["architecture"]), str(data["model_config"])
+
+    calibration = normalize(X_val[: args.calibration_size])
+    report = save_quantized(model, output, architecture, model_config, args.mode, calibration)
+
+    for key, percentile in report.items():
+        print(f"   {key}: clipped at the {percentile}th percentile")
+
+    original, original_load = timed_load(model_path)
+    quantized, quantized_load = timed_load(output)
+
+    original_labels = predict_labels(original, X_test)
+    quantized_labels = predict_labels(quantized, X_test)
+
+    original_accuracy = float(np.mean(original_labels == y_test))
+    quantized_accuracy = float(np.mean(quantized_labels == y_test))
+
+    print(f"Quantized model saved to {output}")
+    print(f"   size      {model_path.stat().st_size / 1e6:8.2f} MB -> {output.stat().st_size / 1e6:8.2f} MB")
+    print(f"   load time {original_load * 1000:8.1f} ms -> {quantized_load * 1000:8.1f} ms")
+    print(f"   accuracy  {original_accuracy:8.4f}    -> {quantized_accuracy:8.4f}    "
+          f"(drop {original_accuracy - quantized_accuracy:+.4f})")
+    print(f"   same prediction on {np.mean(original_labels == quantized_labels):.2%} of the test set")
@@ -0,0 +1,320 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.ndimage as ndi
+from dataset import normalize, to_one_hot
+
+
+class Augmenter:
+    """
+    Random distortions applied to a whole batch of images at once, to make MNIST
+    look more like drawings from the GUI (thicker, off-center, slanted):
+
+    - affine: rotation, shear, scaling and translation around the image center;
+    - elastic: smooth random displacement field (Simard et al., 2003);
+    - morphology: thicker (dilation) or thinner (erosion) strokes.
+
+    The affine and elastic displacements are combined into a single bilinear
+    resampling of the batch.
+
+    Args:
+        rotation (float): Maximum rotation, in degrees.
+        shear (float): Maximum horizontal shear factor.
+        scale (tuple): Range of the scaling factor.
+        translation (float): Maximum translation, in pixels.
+        elastic_alpha (float): Strength of the elastic displacement, in pixels.
+        elastic_sigma (float): Smoothness of the elastic displacement field.
+        elastic_probability (float): Fraction of the images distorted elastically.
+        morphology_probability (float): Fraction of the images dilated or eroded.
+    """
+
+    def __init__(
+        self,
+        rotation=15.0,
+        shear=0.3,
+        scale=(0.85, 1.15),
+        translation=3.0,
+        elastic_alpha=8.0,
+        elastic_sigma=3.0,
+        elastic_probability=0.5,
+        morphology_probability=0.5,
+    ):
+        self.rotation = rotation
+        self.shear = shear
+        self.scale = scale
+        self.translation = translation
+        self.elastic_alpha = elastic_alpha
+        self.elastic_sigma = elastic_sigma
+        self.elastic_probability = elastic_probability
+        self.morphology_probability = morphology_probability
+
+    def __call__(self, images, rng):
+        """
+        Augments a batch.
+
+        Args:
+            images (np.ndarray): uint8 images of shape (N, H, W).
+            rng (np.random.Generator): Source of all the random parameters.
+
+        Returns:
+            np.ndarray: float32 images in [0, 1] of shape (N, H, W).
+        """
+        images = normalize(images)
+        n, h, w = images.shape
+
+        src_y, src_x = self._affine_coordinates(n, h, w, rng)
+
+        elastic = rng.random(n) < self.elastic_probability
+        if elastic.any():
+            # Uniform noise smoothed over each image (not across the batch)
+            field = rng.uniform(-1, 1, size=(2, int(elastic.sum()), h, w)).astype(np.float32)
+            field = ndi.gaussian_filter(field, sigma=(0, 0, self.elastic_sigma, self.elastic_sigma))
+            field *= self.elastic_alpha / (np.abs(field).max(axis=(2, 3), keepdims=True) + 1e-6)
+            src_y[elastic] += field[0]
+            src_x[elastic] += field[1]
+
+        images = _bilinear_sample(images, src_y, src_x)
+
+        operation = rng.choice(3, size=n, p=[1 - self.morphology_probability, *[self.morphology_probability / 2] * 2])
+        if (operation == 1).any():
+            images[operation == 1] = ndi.grey_dilation(images[operation == 1], size=(1, 3, 3))
+        if (operation == 2).any():
+            images[operation == 2] = ndi.grey_erosion(images[operation == 2], size=(1, 3, 3))
+
+        return np.clip(images, 0, 1, out=images)
+
+    def _affine_coordinates(self, n, h, w, rng):
+        """Source coordinates of every output pixel, shape (N, H, W) each."""
+        angle = np.deg2rad(rng.uniform(-self.rotation, self.rotation, n))
+        shear = rng.uniform(-self.shear, self.shear, n)
+        scale = rng.uniform(*self.scale, n)
+        ty, tx = rng.uniform(-self.translation, self.translation, (2, n))
+
+        cos, sin = np.cos(angle), np.sin(angle)
+
+        # Forward transform of (y, x) around the center: rotation @ shear @ scale
+        forward = np.empty((n, 2, 2))
+        forward[:, 0, 0] = cos * scale
+        forward[:, 0, 1] = (-sin + cos * shear) * scale
+        forward[:, 1, 0] = sin * scale
+        forward[:, 1, 1] = (cos + sin * shear) * scale
+        inverse = np.linalg.inv(forward).astype(np.float32)
+
+        cy, cx = (h - 1) / 2, (w - 1) / 2
+        y = (np.arange(h, dtype=np.float32) - cy)[None, :, None] - ty[:, None, None].astype(np.float32)
+        x = (np.arange(w, dtype=np.float32) - cx)[None, None, :] - tx[:, None, None].astype(np.float32)
+
+        src_y = inverse[:, 0, 0, None, None] * y + inverse[:, 0, 1, None, None] * x + cy
+        src_x = inverse[:, 1, 0, None, None] * y + inverse[:, 1, 1, None, None] * x + cx
+        return src_y, src_x
+
+
+def _bilinear_sample(images, src_y, src_x):
+    """Samples (N, H, W) images at fractional coordinates, zero outside."""
+    n, h, w = images.shape
+
+    # A one-pixel black border: clipped out-of-range coordinates land on it
+    padded = np.zeros((n, h + 2, w + 2), dtype=np.float32)
+    padded[:, 1:-1, 1:-1] = images
+    flat = padded.ravel()
+
+    src_y = np.clip(src_y + 1, 0, h + 1 - 1e-3)
+    src_x = np.clip(src_x + 1, 0, w + 1 - 1e-3)
+    y0 = src_y.astype(np.int32)
+    x0 = src_x.astype(np.int32)
+    fy = src_y - y0
+    fx = src_x - x0
+
+    # Flat index of the top-left neighbour, the others are at +1, +stride, +stride + 1
+    stride = w + 2
+    top_left = y0 * stride + x0 + (np.arange(n, dtype=np.int32) * (h + 2) * stride)[:, None, None]
+
+    top = np.take(flat, top_left)
+    top += (np.take(flat, top_left + 1) - top) * fx
+    bottom = np.take(flat, top_left + stride)
+    bottom += (np.take(flat, top_left + stride + 1) - bottom) * fx
+
+    top += (bottom - top) * fy
+    return top
+
+
+# State of the worker processes, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(X, y, augmenter, dtype):
+    _worker.update(X=X, y=y, augmenter=augmenter, dtype=dtype)
+
+
+def _augment_batch(seed, epoch, index, batch_idx):
+    """Builds one augmented batch. Its randomness depends only on (seed, epoch, index)."""
+    start = time.perf_counter()
+
+    X, augmenter = _worker["X"], _worker["augmenter"]
+    rng = np.random.default_rng(np.random.SeedSequence([seed, epoch, index]))
+
+    images = np.asarray(X[batch_idx]).reshape(len(batch_idx), 28, 28)
+    # Cast here: smaller dtypes are also cheaper to send back from the worker
+    X_batch = augmenter(images, rng).astype(_worker["dtype"], copy=False).reshape((len(batch_idx),) + X.shape[1:])
+    y_batch = np.asarray(_worker["y"][batch_idx], dtype=np.int64)
+
+    return X_batch, y_batch, time.perf_counter() - start
+
+
+class AugmentedBatchIterator:
+    """
+    Iterable over augmented (X, y) float mini-batches, like `dataset.BatchIterator`,
+    with the augmentation running in worker processes that prefetch batches ahead
+    of the training loop.
+
+    The stream is reproducible: the shuffling of an epoch and the distortions of
+    each batch are derived from (seed, epoch, batch index) only, whatever the
+    number of workers or the order in which they finish.
+
+    Args:
+        X (np.ndarray): uint8 28x28 images, in any shape with the samples first.
+        y (np.ndarray): Integer labels of shape (N,).
+        batch_size (int): Number of samples per batch.
+        num_classes (int): Number of classes for the one-hot encoding.
+        augmenter (Augmenter | None): The distortions. Defaults to `Augmenter()`.
+        seed (int): Seed of the stream.
+        workers (int): Number of worker processes. 0 augments in the calling process.
+        prefetch (int | None): Number of batches in flight. Defaults to 2 per worker.
+        one_hot (bool): If False, labels are yielded as integers.
+        drop_last (bool): Whether to drop the last incomplete batch.
+        verbose (bool): Whether to print the throughput report after every epoch.
+        dtype (str): Dtype of the images and one-hot labels, see `dataset.DTYPES`.
+    """
+
+    def __init__(
+        self,
+        X,
+        y,
+        batch_size,
+        num_classes,
+        augmenter=None,
+        seed=0,
+        workers=2,
+        prefetch=None,
+        one_hot=True,
+        drop_last=True,
+        verbose=True,
+        dtype="float32",
+    ):
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.num_classes = num_classes
+        self.augmenter = augmenter if augmenter is not None else Augmenter()
+        self.seed = seed
+        self.workers = workers
+        self.prefetch = prefetch if prefetch is not None else max(2 * workers, 1)
+        self.one_hot = one_hot
+        self.drop_last = drop_last
+        self.verbose = verbose
+        self.dtype = np.dtype(dtype)
+
+        self.epoch = 0
+        self.stats = {}
+        self._executor = None
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.X) // self.batch_size
+        return -(-len(self.X) // self.batch_size)
+
+    def __iter__(self):
+        epoch = self.epoch
+        self.epoch += 1
+
+        rng = np.random.default_rng(np.random.SeedSequence([self.seed, epoch]))
+        indices = rng.permutation(len(self.X))
+        # Sorted indices read the memory-mapped file sequentially
+        tasks = [
+            (self.seed, epoch, i, np.sort(indices[i * self.batch_size : (i + 1) * self.batch_size]))
+            for i in range(len(self))
+        ]
+
+        samples = 0
+        augment_seconds = 0.0
+        wait_seconds = 0.0
+        start = time.perf_counter()
+
+        results = self._results(tasks)
+        while True:
+            requested = time.perf_counter()
+            try:
+                X_batch, y_batch, elapsed = next(results)
+            except StopIteration:
+                break
+            wait_seconds += time.perf_counter() - requested
+
+            samples += len(X_batch)
+            augment_seconds += elapsed
+
+            if self.one_hot:
+                y_batch = to_one_hot(y_batch, self.num_classes, self.dtype)
+
+            yield X_batch, y_batch
+
+        self.stats = {
+            "samples": samples,
+            # What the workers could sustain if never waiting on the trainer
+            "augment_samples_per_s": samples / max(augment_seconds, 1e-9) * max(self.workers, 1),
+            "train_samples_per_s": samples / max(time.perf_counter() - start, 1e-9),
+            "wait_seconds": wait_seconds,
+        }
+
+        if self.verbose:
+            print(
+                f"   augmentation: {self.stats['augment_samples_per_s']:,.0f} samples/s "
+                f"({self.workers} workers)   |   consumed: {self.stats['train_samples_per_s']:,.0f} samples/s"
+                f"   |   waited {wait_seconds:.2f}s for batches"
+            )
+
+    def _results(self, tasks):
+        if self.workers == 0:
+            _init_worker(self.X, self.y, self.augmenter, self.dtype)
+            for task in tasks:
+                yield _augment_batch(*task)
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.X, self.y, self.augmenter, self.dtype)
+            )
+
+        pending = []
+        next_task = 0
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < self.prefetch:
+                pending.append(self._executor.submit(_augment_batch, *tasks[next_task]))
+                next_task += 1
+
+            yield pending.pop(0).result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+if __name__ == "__main__":
+    # Throughput of the augmentation alone, without any training
+    import argparse
+
+    from dataset import load_mnist
+
+    parser = argparse.ArgumentParser(description="Measure the augmentation throughput")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("-b", "--batch_size", type=int, default=128, help="Number of samples per batch")
+    args = parser.parse_args()
+
+    (X_train, y_train), _, _ = load_mnist(lazy=True, one_hot=False)
+    batches = AugmentedBatchIterator(X_train, y_train, args.batch_size, 10, workers=args.workers)
+
+    for _ in batches:
+        pass
+    batches.close()
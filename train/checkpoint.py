@@ -0,0 +1,137 @@
+"""
+Resumable training state for `trainer.fit`.
+
+A checkpoint holds everything the remaining epochs depend on: the weights and
+layer states, the optimizer moments and globals (Adam's t), the global NumPy
+random state (shuffling, Dropout masks), the epoch of the batch iterator (the
+augmentation stream), the number of epochs done and the early-stopping
+counters with the best weights so far. Resuming from it replays the remaining
+epochs exactly like the uninterrupted run.
+
+The state is copied on the training thread at the end of an epoch, and written
+by a background thread to a temporary file that replaces the previous
+checkpoint once it is complete, so a crash leaves either the old or the new
+checkpoint, never a partial one.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from mpneuralnetwork.serialization import NumpyEncoder, get_model_weights, restore_model_weights
+
+CHECKPOINT_DIR = "output/checkpoints"
+BEST_PREFIX = "best/"
+
+
+class Checkpointer:
+    """
+    Saves and restores the training state of `trainer.fit`.
+
+    Args:
+        path (str | Path): The checkpoint file (.npz).
+        every (int): Number of epochs between two checkpoints. The last epoch
+            (end of training or early stopping) is always saved.
+    """
+
+    def __init__(self, path, every=1):
+        self.path = Path(path)
+        self.every = max(int(every), 1)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending = None
+
+    def save(self, model, batches, epoch, progress, best_weights=None):
+        """
+        Snapshots the state after `epoch` epochs and writes it in the background.
+
+        Args:
+            model (Model): The model being trained.
+            batches (Iterable): The training batches (their `epoch` attribute, if any, is saved).
+            epoch (int): Number of epochs done.
+            progress (dict): Early-stopping counters (JSON serializable).
+            best_weights (dict | None): Weights of the best epoch so far.
+        """
+        optimizer_globals = {}
+        optimizer_params = {}
+        for name, param in model.optimizer.params.items():
+            if isinstance(param, dict):
+                optimizer_params[name] = param
+            else:
+                optimizer_globals[name] = param
+
+        # Copies: training goes on while the file is written
+        arrays = get_model_weights(model.layers, optimizer_params)
+        for key, value in (best_weights or {}).items():
+            arrays[BEST_PREFIX + key] = value
+
+        _, rng_key, rng_pos, has_gauss, gauss = np.random.get_state()
+        arrays["rng_key"] = rng_key
+
+        arrays["state"] = json.dumps({
+            "epoch": epoch,
+            "progress": progress,
+            "optimizer_globals": optimizer_globals,
+            "batches_epoch": getattr(batches, "epoch", None),
+            "rng": {"pos": rng_pos, "has_gauss": has_gauss, "gauss": gauss},
+        }, cls=NumpyEncoder)
+
+        # One write at a time, so at most one snapshot waits in memory
+        self.wait()
+        self._pending = self._executor.submit(self._write, arrays)
+
+    def _write(self, arrays):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+
+        with open(temporary, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temporary, self.path)
+
+    def wait(self):
+        """Waits for the checkpoint being written, raising its error if it failed."""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+    def restore(self, model, batches):
+        """
+        Restores the last checkpoint into the model, its optimizer, the global
+        random state and the batches.
+
+        Returns:
+            tuple | None: (epochs done, progress, best weights or None), None if
+            there is no checkpoint yet.
+        """
+        if not self.path.exists():
+            return None
+
+        with np.load(self.path) as data:
+            arrays = {key: data[key] for key in data.files}
+
+        state = json.loads(str(arrays.pop("state")))
+        rng = state["rng"]
+        np.random.set_state(("MT19937", arrays.pop("rng_key"), rng["pos"], rng["has_gauss"], rng["gauss"]))
+
+        best_weights = {
+            key[len(BEST_PREFIX) :]: arrays.pop(key) for key in list(arrays) if key.startswith(BEST_PREFIX)
+        }
+
+        restore_model_weights(model.layers, arrays, model.optimizer)
+        for name, value in state["optimizer_globals"].items():
+            setattr(model.optimizer, name, value)
+
+        if state["batches_epoch"] is not None:
+            batches.epoch = state["batches_epoch"]
+
+        return state["epoch"], state["progress"], best_weights or None
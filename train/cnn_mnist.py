@@ -1,7 +1,10 @@
+import argparse
 from pathlib import Path
 
 import numpy as np
-from dataset import load_mnist
+from checkpoint import CHECKPOINT_DIR, Checkpointer
+from dataset import DTYPES, BatchIterator, load_mnist
+from trainer import fit, test
 
 from mpneuralnetwork.activations import ReLU
 from mpneuralnetwork.layers import (
@@ -16,16 +19,9 @@ from mpneuralnetwork.model import Model
 from mpneuralnetwork.optimizers import Adam
 from mpneuralnetwork.serialization import save_model
 
-if __name__ == "__main__":
-    print("Classification example with convolution: MNIST Dataset")
-    seed = 69
-    np.random.seed(seed)
-
-    print("Loading data...")
-    (X_train, y_train), (X_val, y_val), (X_test, y_test) = load_mnist(conv=True)
 
-    print(f"Data loaded. Training on {X_train.shape[0]} samples.")
-    network = [
+def build_network():
+    return [
         Convolutional(output_depth=32, kernel_size=3, input_shape=(1, 28, 28)),
         ReLU(),
         MaxPooling2D(),
@@ -36,12 +32,66 @@ if __name__ == "__main__":
         Dense(10),
     ]
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--checkpoint_every",
+        type=int,
+        default=None,
+        help="Save the training state to output/checkpoints/ every N epochs (streams the mini-batches)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the last checkpoint, implies --checkpoint_every 1",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=DTYPES,
+        default="float32",
+        help="Dtype the mini-batches are stored in (float16 halves their memory), other than float32 streams them",
+    )
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_every is None:
+        args.checkpoint_every = 1
+    stream = args.checkpoint_every is not None or args.dtype != "float32"
+
+    print("Classification example with convolution: MNIST Dataset")
+    seed = 69
+    np.random.seed(seed)
+
+    print("Loading data...")
+    (X_train, y_train), (X_val, y_val), (X_test, y_test) = load_mnist(
+        conv=True, lazy=stream, one_hot=not stream, dtype=args.dtype
+    )
+
+    print(f"Data loaded. Training on {X_train.shape[0]} samples.")
+    network = build_network()
+
     model = Model(network, CategoricalCrossEntropy(), Adam())
 
-    model.train(X_train, y_train, epochs=10, batch_size=64, evaluation=(X_val, y_val))
+    checkpoint = None
+    if args.checkpoint_every is not None:
+        checkpoint = Checkpointer(f"{CHECKPOINT_DIR}/cnn_mnist.npz", args.checkpoint_every)
+
+    if stream:
+        fit(
+            model,
+            BatchIterator(X_train, y_train, batch_size=64, num_classes=10, dtype=args.dtype),
+            epochs=10,
+            evaluation=BatchIterator(X_val, y_val, batch_size=1024, num_classes=10, shuffle=False, dtype=args.dtype),
+            checkpoint=checkpoint,
+            resume=args.resume,
+        )
+
+        print("Evaluating on test set...")
+        test(model, BatchIterator(X_test, y_test, batch_size=1024, num_classes=10, shuffle=False, dtype=args.dtype))
+    else:
+        model.train(X_train, y_train, epochs=10, batch_size=64, evaluation=(X_val, y_val))
 
-    print("Evaluating on test set...")
-    model.test(X_test, y_test)
+        print("Evaluating on test set...")
+        model.test(X_test, y_test)
 
     Path("output/").mkdir(parents=True, exist_ok=True)
 
@@ -1,11 +1,24 @@
+import argparse
 import gzip
-import shutil
+import hashlib
+import json
+import os
+import time
 import urllib.request
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import numpy as np
 
+CACHE_DIR_NAME = "npy"
+
+# Dtypes the images and one-hot labels can be stored in, like the inference
+# precisions of gui/precision.py. The library trains in float32 whatever the
+# storage: float16 halves the memory and bandwidth of the batches, float64 is a
+# reference.
+DTYPES = ("float64", "float32", "float16")
+
 
 def get_file(url, path):
     if not path.exists():
@@ -14,32 +27,220 @@ def get_file(url, path):
         urllib.request.urlretrieve(url, path)
 
 
-def load_mnist(conv=False):
+def cache_path(gz_path):
+    """Path of the uncompressed .npy cache of a gzipped IDX file."""
+    gz_path = Path(gz_path)
+    return gz_path.parent / CACHE_DIR_NAME / (gz_path.name.removesuffix(".gz") + ".npy")
+
+
+def convert_idx(stream, npy_path, manifest, transform=None, chunk_size=10000):
+    """
+    Decodes an uncompressed IDX stream straight into a uint8 .npy file, chunk_size
+    samples at a time (so memory stays bounded), applying transform to each chunk.
+    The file is written atomically, with manifest saved next to it.
+
+    Returns:
+        int: Number of uncompressed bytes decoded.
+    """
+    header = stream.read(4)
+    ndim = header[3]
+    shape = tuple(int.from_bytes(stream.read(4), "big") for _ in range(ndim))
+
+    sample_shape = shape[1:]
+    if transform is not None:
+        sample_shape = transform(np.zeros((1, *shape[1:]), dtype=np.uint8)).shape[1:]
+    sample_size = int(np.prod(shape[1:], dtype=np.int64))
+
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Several jobs may convert the same file concurrently, each one writes to
+    # its own temporary file and the last rename wins (they are identical)
+    tmp_path = npy_path.with_suffix(f".{os.getpid()}.tmp")
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=(shape[0], *sample_shape))
+
+    for start in range(0, shape[0], chunk_size):
+        count = min(chunk_size, shape[0] - start)
+        chunk = np.frombuffer(stream.read(count * sample_size), dtype=np.uint8).reshape(count, *shape[1:])
+        out[start : start + count] = chunk if transform is None else transform(chunk)
+
+    out.flush()
+    del out
+    os.replace(tmp_path, npy_path)
+
+    manifest = dict(manifest, shape=[shape[0], *sample_shape], dtype="uint8")
+    tmp_path = npy_path.with_suffix(f".json.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, npy_path.with_suffix(".json"))
+
+    return len(header) + 4 * ndim + shape[0] * sample_size
+
+
+def read_manifest(npy_path):
+    """Returns the manifest of a cached array, or None if the cache is missing."""
+    manifest_path = npy_path.with_suffix(".json")
+    if not npy_path.exists() or not manifest_path.exists():
+        return None
+
+    return json.loads(manifest_path.read_text())
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_idx_cached(gz_path, transform=None):
+    """
+    Loads a gzipped IDX file as a uint8 array, through a cache of uncompressed
+    .npy files stored in a `npy/` folder next to it.
+
+    The first call decompresses the file, applies transform (if any) and writes
+    the result along with a manifest recording the size, modification time and
+    SHA-256 of the source. Later calls return a read-only memory-mapped view,
+    which costs no decompression nor copy, and is shared through the page cache
+    by every process reading the same file. The cache is rebuilt when the source
+    file changes.
+    """
+    gz_path = Path(gz_path)
+    npy_path = cache_path(gz_path)
+
+    stat = gz_path.stat()
+    source = {"source": gz_path.name, "source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+    manifest = read_manifest(npy_path)
+    if manifest is None or {key: manifest.get(key) for key in source} != source:
+        with gzip.open(gz_path, "rb") as stream:
+            convert_idx(stream, npy_path, dict(source, sha256=_file_sha256(gz_path)), transform)
+
+    return np.load(npy_path, mmap_mode="r")
+
+
+def normalize(batch, dtype=np.float32):
+    """Converts a batch of uint8 images to values in [0, 1], float32 by default."""
+    # Divided in float32 at least, then stored in dtype
+    scaled = np.asarray(batch, dtype=np.result_type(dtype, np.float32)) / 255.0
+    return scaled.astype(dtype, copy=False)
+
+
+def to_one_hot(labels, num_classes, dtype=np.float32):
+    """One-hot encodes a batch of integer labels, as float32 by default (0 and 1 are exact in every dtype)."""
+    encoded = np.zeros((len(labels), num_classes), dtype=dtype)
+    encoded[np.arange(len(labels)), labels] = 1.0
+    return encoded
+
+
+def count_classes(*label_arrays):
+    """Number of classes of integer label arrays."""
+    return int(max(np.max(labels) for labels in label_arrays)) + 1
+
+
+class BatchIterator:
+    """
+    Iterable over (X, y) float mini-batches of a dataset, built one batch at a
+    time from uint8 images and integer labels (as returned by the loaders with
+    lazy=True, one_hot=False), so that memory use is bounded by the batch size
+    rather than the dataset size.
+
+    Each pass over the iterator is one epoch, reshuffled if shuffle is True.
+
+    Args:
+        X (np.ndarray): uint8 images, in any shape with the samples first (memory-mapped is fine).
+        y (np.ndarray): Integer labels of shape (N,).
+        batch_size (int): Number of samples per batch.
+        num_classes (int): Number of classes for the one-hot encoding.
+        shuffle (bool): Whether to reshuffle the samples at every epoch.
+        one_hot (bool): If False, labels are yielded as integers (for sparse-label losses).
+        drop_last (bool): Whether to drop the last incomplete batch (like `Model.train`).
+        rng (np.random.Generator | None): Source of the shuffling. Defaults to the global
+                                          NumPy random state, so `np.random.seed` applies.
+        dtype (str): Dtype of the images and one-hot labels, see DTYPES.
+    """
+
+    def __init__(
+        self, X, y, batch_size, num_classes, shuffle=True, one_hot=True, drop_last=None, rng=None, dtype="float32"
+    ):
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.num_classes = num_classes
+        self.shuffle = shuffle
+        self.one_hot = one_hot
+        self.drop_last = shuffle if drop_last is None else drop_last
+        self.rng = rng if rng is not None else np.random
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.X) // self.batch_size
+        return -(-len(self.X) // self.batch_size)
+
+    def __iter__(self):
+        indices = self.rng.permutation(len(self.X)) if self.shuffle else np.arange(len(self.X))
+
+        for i in range(len(self)):
+            batch_idx = indices[i * self.batch_size : (i + 1) * self.batch_size]
+            if self.shuffle:
+                # Sorted indices read the memory-mapped file sequentially
+                batch_idx = np.sort(batch_idx)
+
+            X_batch = normalize(self.X[batch_idx], self.dtype)
+            y_batch = np.asarray(self.y[batch_idx], dtype=np.int64)
+
+            if self.one_hot:
+                y_batch = to_one_hot(y_batch, self.num_classes, self.dtype)
+
+            yield X_batch, y_batch
+
+
+def load_mnist(conv=False, lazy=False, one_hot=True, dtype="float32"):
+    """
+    Downloads and loads the MNIST dataset.
+
+    Args:
+        conv (bool): If True, returns data in (N, 1, 28, 28) format.
+                     If False, returns (N, 784).
+        lazy (bool): If True, images are returned as read-only uint8 memory-mapped
+                     views, to be normalized per batch with `normalize`.
+                     If False, they are returned as dtype arrays in [0, 1].
+        one_hot (bool): If True, labels are one-hot encoded (dtype).
+                        If False, they are returned as integer class indices.
+        dtype (str): Dtype of the images and one-hot labels, see DTYPES.
+
+    Returns:
+        tuple: ((X_train, y_train), (X_val, y_val), (X_test, y_test))
+    """
     base_path = Path("data/mnist")
     base_url = "https://storage.googleapis.com/cvdf-datasets/mnist/"
     files = {
-        "x_train": ("train-images-idx3-ubyte.gz", 16),
-        "y_train": ("train-labels-idx1-ubyte.gz", 8),
-        "x_test": ("t10k-images-idx3-ubyte.gz", 16),
-        "y_test": ("t10k-labels-idx1-ubyte.gz", 8),
+        "x_train": "train-images-idx3-ubyte.gz",
+        "y_train": "train-labels-idx1-ubyte.gz",
+        "x_test": "t10k-images-idx3-ubyte.gz",
+        "y_test": "t10k-labels-idx1-ubyte.gz",
     }
 
     data = {}
-    for key, (filename, offset) in files.items():
+    for key, filename in files.items():
         p = base_path / filename
         get_file(base_url + filename, p)
-        with gzip.open(p, "rb") as f_in:
-            data[key] = np.frombuffer(f_in.read(), dtype=np.uint8, offset=offset)
+        data[key] = load_idx_cached(p)
 
-    if conv:
-        X_train = data["x_train"].reshape(-1, 1, 28, 28).astype(np.float32) / 255.0
-        X_test = data["x_test"].reshape(-1, 1, 28, 28).astype(np.float32) / 255.0
-    else:
-        X_train = data["x_train"].reshape(-1, 784).astype(np.float32) / 255.0
-        X_test = data["x_test"].reshape(-1, 784).astype(np.float32) / 255.0
+    shape = (-1, 1, 28, 28) if conv else (-1, 784)
+    X_train = data["x_train"].reshape(shape)
+    X_test = data["x_test"].reshape(shape)
 
-    y_train = np.eye(10)[data["y_train"]]
-    y_test = np.eye(10)[data["y_test"]]
+    if not lazy:
+        X_train = normalize(X_train, dtype)
+        X_test = normalize(X_test, dtype)
+
+    y_train = data["y_train"]
+    y_test = data["y_test"]
+
+    if one_hot:
+        y_train = to_one_hot(y_train, 10, dtype)
+        y_test = to_one_hot(y_test, 10, dtype)
 
     return (
         (X_train[:50000], y_train[:50000]),
@@ -48,7 +249,98 @@ def load_mnist(conv=False):
     )
 
 
-def load_emnist(split="balanced", conv=False):
+EMNIST_SPLITS = ["balanced", "byclass", "bymerge", "digits", "letters", "mnist"]
+EMNIST_URL = "https://biometrics.nist.gov/cs_links/EMNIST/gzip.zip"
+EMNIST_PATH = Path("data/emnist")
+
+
+def _emnist_files(split):
+    return {
+        "x_train": f"emnist-{split}-train-images-idx3-ubyte.gz",
+        "y_train": f"emnist-{split}-train-labels-idx1-ubyte.gz",
+        "x_test": f"emnist-{split}-test-images-idx3-ubyte.gz",
+        "y_test": f"emnist-{split}-test-labels-idx1-ubyte.gz",
+    }
+
+
+def _emnist_orientation(x):
+    # EMNIST images are rotated 90 degrees clockwise and flipped.
+    # Transpose (swap height and width) to fix rotation
+    return x.transpose(0, 2, 1)
+
+
+def _ingest_member(zip_path, file_name, base_path):
+    """Decodes one member of the EMNIST zip into the .npy cache. Runs in a worker process."""
+    start = time.perf_counter()
+    npy_path = cache_path(base_path / file_name)
+
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        # files are inside a 'gzip/' folder in the zip
+        info = zip_ref.getinfo(f"gzip/{file_name}")
+        source = {"source": f"{Path(zip_path).name}:{info.filename}", "source_size": info.file_size, "source_crc": info.CRC}
+
+        manifest = read_manifest(npy_path)
+        if manifest is not None and {key: manifest.get(key) for key in source} == source:
+            return file_name, 0, 0, time.perf_counter() - start
+
+        transform = _emnist_orientation if "-images-" in file_name else None
+        with zip_ref.open(info) as member, gzip.GzipFile(fileobj=member) as stream:
+            decoded = convert_idx(stream, npy_path, source, transform)
+
+    return file_name, info.file_size, decoded, time.perf_counter() - start
+
+
+def ingest_emnist(zip_path, splits=None, workers=None, base_path=EMNIST_PATH):
+    """
+    Decodes the given EMNIST splits from a local copy of the official `gzip.zip`
+    straight into the memory-mapped .npy cache used by `load_emnist`, without
+    extracting the intermediate .gz files. Every member is decoded by its own
+    worker process, and members whose cache already matches the archive are skipped.
+
+    Args:
+        zip_path (str | Path): Path to the EMNIST gzip.zip archive.
+        splits (list[str] | None): Splits to ingest. Defaults to all of them.
+        workers (int | None): Number of worker processes. Defaults to the number of CPUs.
+        base_path (Path): Dataset folder, the arrays go to its `npy/` subfolder.
+
+    Returns:
+        dict: Per split, {"seconds": ..., "compressed_bytes": ..., "decoded_bytes": ..., "skipped": ...}.
+              "seconds" is the sum of the time spent on the members of the split.
+    """
+    splits = EMNIST_SPLITS if splits is None else splits
+    for split in splits:
+        if split not in EMNIST_SPLITS:
+            raise ValueError(f"Invalid split '{split}'. Expected one of {EMNIST_SPLITS}")
+
+    members = {file_name: split for split in splits for file_name in _emnist_files(split).values()}
+    report = {split: {"seconds": 0.0, "compressed_bytes": 0, "decoded_bytes": 0, "skipped": 0} for split in splits}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_ingest_member, zip_path, file_name, base_path) for file_name in members]
+
+        for future in futures:
+            file_name, compressed, decoded, seconds = future.result()
+            stats = report[members[file_name]]
+            stats["seconds"] += seconds
+            stats["compressed_bytes"] += compressed
+            stats["decoded_bytes"] += decoded
+            stats["skipped"] += decoded == 0
+
+    return report
+
+
+def _download_emnist(split, zip_path):
+    print(f"Downloading EMNIST ({split}). This might take a while (approx 530MB)...")
+    try:
+        get_file(EMNIST_URL, zip_path)
+    except Exception as e:
+        print("Download failed. Please check your internet connection or the URL.")
+        if zip_path.exists():
+            zip_path.unlink()
+        raise e
+
+
+def load_emnist(split="balanced", conv=False, lazy=False, one_hot=True, dtype="float32"):
     """
     Downloads and loads the EMNIST dataset.
 
@@ -57,96 +349,69 @@ def load_emnist(split="balanced", conv=False):
                      Defaults to 'balanced'.
         conv (bool): If True, returns data in (N, 1, 28, 28) format.
                      If False, returns (N, 784).
+        lazy (bool): If True, images are returned as read-only uint8 memory-mapped
+                     views, to be normalized per batch with `normalize`.
+                     If False, they are returned as dtype arrays in [0, 1].
+        one_hot (bool): If True, labels are one-hot encoded (dtype).
+                        If False, they are returned as integer class indices.
+        dtype (str): Dtype of the images and one-hot labels, see DTYPES.
 
     Returns:
         tuple: ((X_train, y_train), (X_val, y_val), (X_test, y_test))
     """
-    valid_splits = ["balanced", "byclass", "bymerge", "digits", "letters", "mnist"]
-    if split not in valid_splits:
-        raise ValueError(f"Invalid split '{split}'. Expected one of {valid_splits}")
+    if split not in EMNIST_SPLITS:
+        raise ValueError(f"Invalid split '{split}'. Expected one of {EMNIST_SPLITS}")
 
-    base_path = Path("data/emnist")
+    base_path = EMNIST_PATH
     base_path.mkdir(parents=True, exist_ok=True)
 
     # Files we need for the requested split
-    files_map = {
-        "x_train": f"emnist-{split}-train-images-idx3-ubyte.gz",
-        "y_train": f"emnist-{split}-train-labels-idx1-ubyte.gz",
-        "x_test": f"emnist-{split}-test-images-idx3-ubyte.gz",
-        "y_test": f"emnist-{split}-test-labels-idx1-ubyte.gz",
-    }
+    files_map = _emnist_files(split)
 
-    # Check if we need to download/extract
-    missing_files = [f for f in files_map.values() if not (base_path / f).exists()]
+    # Extracted .gz files are still supported, otherwise the arrays are decoded
+    # from the zip straight into the cache (see ingest_emnist)
+    missing_files = [
+        f for f in files_map.values() if not (base_path / f).exists() and read_manifest(cache_path(base_path / f)) is None
+    ]
 
     if missing_files:
-        zip_name = "emnist-gzip.zip"
-        zip_path = base_path / zip_name
-        zip_url = "https://biometrics.nist.gov/cs_links/EMNIST/gzip.zip"
+        zip_path = base_path / "emnist-gzip.zip"
 
         if not zip_path.exists():
-            print(
-                f"Downloading EMNIST ({split}). This might take a while (approx 530MB)..."
-            )
-            try:
-                get_file("https://biometrics.nist.gov/cs_links/EMNIST/gzip.zip", zip_path)
-            except Exception as e:
-                print(
-                    "Download failed. Please check your internet connection or the URL."
-                )
-                if zip_path.exists():
-                    zip_path.unlink()
-                raise e
+            _download_emnist(split, zip_path)
 
         print(f"Extracting files for split '{split}'...")
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            for file_name in files_map.values():
-                # files are inside a 'gzip/' folder in the zip
-                member_name = f"gzip/{file_name}"
-                try:
-                    with (
-                        zip_ref.open(member_name) as source,
-                        open(base_path / file_name, "wb") as target,
-                    ):
-                        shutil.copyfileobj(source, target)
-                except KeyError:
-                    print(f"Error: Could not find {member_name} in zip.")
-                    raise
+        ingest_emnist(zip_path, [split], base_path=base_path)
 
     # Load data
     data = {}
-    offsets = {"x_train": 16, "y_train": 8, "x_test": 16, "y_test": 8}
-
     for key, filename in files_map.items():
-        p = base_path / filename
-        with gzip.open(p, "rb") as f_in:
-            data[key] = np.frombuffer(f_in.read(), dtype=np.uint8, offset=offsets[key])
-
-    def process_x(x):
-        # EMNIST images are rotated 90 degrees clockwise and flipped.
-        # 1. Reshape to (N, 28, 28)
-        x = x.reshape(-1, 28, 28)
-        # 2. Transpose (swap height and width) to fix rotation
-        x = x.transpose(0, 2, 1)
-
-        if conv:
-            x = x.reshape(-1, 1, 28, 28)
+        if (base_path / filename).exists():
+            transform = _emnist_orientation if key.startswith("x_") else None
+            data[key] = load_idx_cached(base_path / filename, transform)
         else:
-            x = x.reshape(-1, 784)
+            data[key] = np.load(cache_path(base_path / filename), mmap_mode="r")
 
-        return x.astype(np.float32) / 255.0
+    shape = (-1, 1, 28, 28) if conv else (-1, 784)
+    X_train = data["x_train"].reshape(shape)
+    X_test = data["x_test"].reshape(shape)
 
-    X_train = process_x(data["x_train"])
-    X_test = process_x(data["x_test"])
+    if not lazy:
+        X_train = normalize(X_train, dtype)
+        X_test = normalize(X_test, dtype)
 
     # Labels
     y_train_raw = data["y_train"]
     y_test_raw = data["y_test"]
 
-    num_classes = int(max(y_train_raw.max(), y_test_raw.max()) + 1)
+    num_classes = count_classes(y_train_raw, y_test_raw)
+
+    y_train = y_train_raw
+    y_test = y_test_raw
 
-    y_train = np.eye(num_classes)[y_train_raw]
-    y_test = np.eye(num_classes)[y_test_raw]
+    if one_hot:
+        y_train = to_one_hot(y_train_raw, num_classes, dtype)
+        y_test = to_one_hot(y_test_raw, num_classes, dtype)
 
     # Create validation split (10% of training data)
     split_idx = int(len(X_train) * 0.9)
@@ -155,4 +420,33 @@ def load_emnist(split="balanced", conv=False):
         (X_train[:split_idx], y_train[:split_idx]),
         (X_train[split_idx:], y_train[split_idx:]),
         (X_test, y_test),
-    )
\ No newline at end of file
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dataset preparation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Decode EMNIST splits from a local gzip.zip into the memory-mapped cache"
+    )
+    ingest_parser.add_argument("zip_path", type=str, help="Path to the EMNIST gzip.zip archive")
+    ingest_parser.add_argument(
+        "-s", "--splits", nargs="+", choices=EMNIST_SPLITS, default=None, help="Splits to ingest (default: all)"
+    )
+    ingest_parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = ingest_emnist(args.zip_path, args.splits, args.workers)
+    elapsed = time.perf_counter() - start
+
+    for split, stats in report.items():
+        print(
+            f"{split:>9}: {stats['seconds']:7.2f}s   "
+            f"{stats['compressed_bytes'] / 1e6:8.1f} MB read   "
+            f"{stats['decoded_bytes'] / 1e6:8.1f} MB decoded   "
+            f"{stats['skipped']} member(s) already up to date"
+        )
+    print(f"Total: {elapsed:.2f}s wall time")
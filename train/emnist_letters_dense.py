@@ -1,7 +1,11 @@
+import argparse
 from pathlib import Path
 
 import numpy as np
-from dataset import load_emnist
+from augmentation import AugmentedBatchIterator
+from checkpoint import CHECKPOINT_DIR, Checkpointer
+from dataset import DTYPES, BatchIterator, count_classes, load_emnist
+from trainer import fit, test
 
 from mpneuralnetwork.activations import ReLU
 from mpneuralnetwork.layers import Dense, Dropout, BatchNormalization
@@ -10,46 +14,121 @@ from mpneuralnetwork.model import Model
 from mpneuralnetwork.optimizers import Adam
 from mpneuralnetwork.serialization import save_model
 
+
+def build_network(num_classes=27):
+    return [
+        Dense(800, input_size=784),
+        BatchNormalization(),
+        ReLU(),
+        Dropout(0.2),
+        Dense(800),
+        BatchNormalization(),
+        ReLU(),
+        Dropout(0.3),
+        Dense(num_classes),
+    ]
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream normalized mini-batches from the memory-mapped dataset instead of loading it all as float32",
+    )
+    parser.add_argument(
+        "--augment",
+        action="store_true",
+        help="Train on randomly distorted images (affine, elastic, stroke width), implies --stream",
+    )
+    parser.add_argument(
+        "--augment_workers",
+        type=int,
+        default=2,
+        help="Number of processes preparing augmented batches ahead of training",
+    )
+    parser.add_argument(
+        "--checkpoint_every",
+        type=int,
+        default=None,
+        help="Save the training state to output/checkpoints/ every N epochs, implies --stream",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the last checkpoint (same options as the interrupted run), implies --checkpoint_every 1",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=DTYPES,
+        default="float32",
+        help="Dtype the mini-batches are stored in (float16 halves their memory), other than float32 implies --stream",
+    )
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_every is None:
+        args.checkpoint_every = 1
+    args.stream = args.stream or args.augment or args.checkpoint_every is not None or args.dtype != "float32"
+
     print("Classification example: EMNIST Letters Dataset (Dense)")
     seed = 69
     np.random.seed(seed)
 
     print("Loading data (this may take a while first time)...")
     (X_train, y_train), (X_val, y_val), (X_test, y_test) = load_emnist(
-        split="letters", conv=False
+        split="letters", conv=False, lazy=args.stream, one_hot=not args.stream, dtype=args.dtype
     )
 
-    num_classes = y_train.shape[1]
+    num_classes = count_classes(y_train, y_test) if args.stream else y_train.shape[1]
     print(
         f"Data loaded. Training on {X_train.shape[0]} samples. Number of classes: {num_classes}"
     )
 
-    network = [
-        Dense(800, input_size=784),
-        BatchNormalization(),
-        ReLU(),
-        Dropout(0.2),
-        Dense(800),
-        BatchNormalization(),
-        ReLU(),
-        Dropout(0.3),
-        Dense(num_classes),
-    ]
+    network = build_network(num_classes)
 
     model = Model(network, CategoricalCrossEntropy(), Adam())
 
-    model.train(
-        X_train,
-        y_train,
-        epochs=15,
-        batch_size=128,
-        evaluation=(X_val, y_val),
-        early_stopping=5,
-    )
+    checkpoint = None
+    if args.checkpoint_every is not None:
+        checkpoint = Checkpointer(f"{CHECKPOINT_DIR}/dense_emnist_letters.npz", args.checkpoint_every)
+
+    if args.stream:
+        if args.augment:
+            train_batches = AugmentedBatchIterator(
+                X_train, y_train, batch_size=128, num_classes=num_classes, seed=seed, workers=args.augment_workers,
+                dtype=args.dtype,
+            )
+        else:
+            train_batches = BatchIterator(X_train, y_train, batch_size=128, num_classes=num_classes, dtype=args.dtype)
+
+        fit(
+            model,
+            train_batches,
+            epochs=15,
+            evaluation=BatchIterator(
+                X_val, y_val, batch_size=1024, num_classes=num_classes, shuffle=False, dtype=args.dtype
+            ),
+            early_stopping=5,
+            checkpoint=checkpoint,
+            resume=args.resume,
+        )
+
+        print("Evaluating on test set...")
+        test(
+            model,
+            BatchIterator(X_test, y_test, batch_size=1024, num_classes=num_classes, shuffle=False, dtype=args.dtype),
+        )
+    else:
+        model.train(
+            X_train,
+            y_train,
+            epochs=15,
+            batch_size=128,
+            evaluation=(X_val, y_val),
+            early_stopping=5,
+        )
 
-    print("Evaluating on test set...")
-    model.test(X_test, y_test)
+        print("Evaluating on test set...")
+        model.test(X_test, y_test)
 
     Path("output/").mkdir(parents=True, exist_ok=True)
 
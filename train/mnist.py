@@ -1,7 +1,11 @@
+import argparse
 from pathlib import Path
 
 import numpy as np
-from dataset import load_mnist
+from augmentation import AugmentedBatchIterator
+from checkpoint import CHECKPOINT_DIR, Checkpointer
+from dataset import DTYPES, BatchIterator, load_mnist
+from trainer import fit, test
 
 from mpneuralnetwork.activations import ReLU
 from mpneuralnetwork.layers import Dense, Dropout, BatchNormalization
@@ -10,17 +14,9 @@ from mpneuralnetwork.model import Model
 from mpneuralnetwork.optimizers import Adam
 from mpneuralnetwork.serialization import save_model
 
-if __name__ == "__main__":
-    print("Classification example: MNIST Dataset")
-    seed = 69
-    np.random.seed(seed)
-
-    print("Loading data...")
-    (X_train, y_train), (X_val, y_val), (X_test, y_test) = load_mnist()
-
-    print(f"Data loaded. Training on {X_train.shape[0]} samples.")
 
-    network = [
+def build_network():
+    return [
         Dense(800, input_size=784),
         BatchNormalization(),
         ReLU(),
@@ -32,19 +28,99 @@ if __name__ == "__main__":
         Dense(10),
     ]
 
-    model = Model(network, CategoricalCrossEntropy(), Adam())
 
-    model.train(
-        X_train,
-        y_train,
-        epochs=20,
-        batch_size=128,
-        evaluation=(X_val, y_val),
-        early_stopping=5,
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream normalized mini-batches from the memory-mapped dataset instead of loading it all as float32",
+    )
+    parser.add_argument(
+        "--augment",
+        action="store_true",
+        help="Train on randomly distorted images (affine, elastic, stroke width), implies --stream",
+    )
+    parser.add_argument(
+        "--augment_workers",
+        type=int,
+        default=2,
+        help="Number of processes preparing augmented batches ahead of training",
     )
+    parser.add_argument(
+        "--checkpoint_every",
+        type=int,
+        default=None,
+        help="Save the training state to output/checkpoints/ every N epochs, implies --stream",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the last checkpoint (same options as the interrupted run), implies --checkpoint_every 1",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=DTYPES,
+        default="float32",
+        help="Dtype the mini-batches are stored in (float16 halves their memory), other than float32 implies --stream",
+    )
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_every is None:
+        args.checkpoint_every = 1
+    args.stream = args.stream or args.augment or args.checkpoint_every is not None or args.dtype != "float32"
+
+    print("Classification example: MNIST Dataset")
+    seed = 69
+    np.random.seed(seed)
+
+    print("Loading data...")
+    (X_train, y_train), (X_val, y_val), (X_test, y_test) = load_mnist(
+        lazy=args.stream, one_hot=not args.stream, dtype=args.dtype
+    )
+
+    print(f"Data loaded. Training on {X_train.shape[0]} samples.")
+
+    network = build_network()
+
+    model = Model(network, CategoricalCrossEntropy(), Adam())
+
+    checkpoint = None
+    if args.checkpoint_every is not None:
+        checkpoint = Checkpointer(f"{CHECKPOINT_DIR}/dense_mnist.npz", args.checkpoint_every)
+
+    if args.stream:
+        if args.augment:
+            train_batches = AugmentedBatchIterator(
+                X_train, y_train, batch_size=128, num_classes=10, seed=seed, workers=args.augment_workers,
+                dtype=args.dtype,
+            )
+        else:
+            train_batches = BatchIterator(X_train, y_train, batch_size=128, num_classes=10, dtype=args.dtype)
+
+        fit(
+            model,
+            train_batches,
+            epochs=20,
+            evaluation=BatchIterator(X_val, y_val, batch_size=1024, num_classes=10, shuffle=False, dtype=args.dtype),
+            early_stopping=5,
+            checkpoint=checkpoint,
+            resume=args.resume,
+        )
+
+        print("Evaluating on test set...")
+        test(model, BatchIterator(X_test, y_test, batch_size=1024, num_classes=10, shuffle=False, dtype=args.dtype))
+    else:
+        model.train(
+            X_train,
+            y_train,
+            epochs=20,
+            batch_size=128,
+            evaluation=(X_val, y_val),
+            early_stopping=5,
+        )
 
-    print("Evaluating on test set...")
-    model.test(X_test, y_test)
+        print("Evaluating on test set...")
+        model.test(X_test, y_test)
 
     Path("output/").mkdir(parents=True, exist_ok=True)
 
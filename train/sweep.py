@@ -0,0 +1,262 @@
+"""
+Trains several architectures and hyperparameter combinations in parallel and
+ranks them by validation accuracy.
+
+The sweep is described by a JSON file (see train/sweep.json): for every
+architecture, a grid of hyperparameters whose combinations are all trained.
+The datasets are loaded once and copied into shared memory as uint8; the worker
+processes attach to them by name and train on normalized mini-batches (like
+`--stream`), so N workers cost one copy of the data, not N float32 copies.
+
+    python3 train/sweep.py train/sweep.json -w 8
+
+Every run saves its model and its training log under the output directory,
+next to leaderboard.csv.
+"""
+
+import os
+
+# One BLAS thread per worker, the parallelism comes from the processes
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import contextlib
+import csv
+import importlib
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+from dataset import DTYPES, BatchIterator, count_classes, load_emnist, load_mnist
+from trainer import evaluate, fit
+
+from mpneuralnetwork.layers import Convolutional
+from mpneuralnetwork.losses import CategoricalCrossEntropy
+from mpneuralnetwork.model import Model
+from mpneuralnetwork.optimizers import Adam
+from mpneuralnetwork.serialization import save_model
+
+# Architecture (training script with a build_network function) -> dataset it trains on
+ARCHITECTURES = {
+    "mnist": "mnist",
+    "cnn_mnist": "mnist",
+    "super_cnn": "mnist",
+    "emnist_letters_dense": "emnist_letters",
+}
+
+# Hyperparameters a grid may set, with their defaults
+DEFAULTS = {
+    "learning_rate": 0.001,
+    "batch_size": 128,
+    "epochs": 10,
+    "early_stopping": 3,
+    "seed": 69,
+    # Dtype of the mini-batches, see dataset.DTYPES
+    "dtype": "float32",
+}
+
+# Shared arrays of the worker processes, set once by _init_worker
+_shared = {}
+
+
+def load_dataset(name):
+    """((X_train, y_train), (X_val, y_val)) as uint8 images (N, 784) and integer labels."""
+    if name == "mnist":
+        train, val, _ = load_mnist(lazy=True, one_hot=False)
+    elif name == "emnist_letters":
+        train, val, _ = load_emnist("letters", lazy=True, one_hot=False)
+    else:
+        raise ValueError(f"Unknown dataset {name}")
+
+    return train, val
+
+
+def expand_runs(config):
+    """
+    One (run name, architecture, hyperparameters) per combination of every grid.
+    Values of the config's "defaults" apply to all the runs.
+    """
+    defaults = {**DEFAULTS, **config.get("defaults", {})}
+    runs = []
+
+    for entry in config["runs"]:
+        architecture = entry["architecture"]
+        if architecture not in ARCHITECTURES:
+            raise ValueError(f"Unknown architecture {architecture}, expected one of {list(ARCHITECTURES)}")
+
+        grid = entry.get("grid", {})
+        unknown = set(grid) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown hyperparameters {sorted(unknown)}, expected some of {list(DEFAULTS)}")
+
+        for values in itertools.product(*grid.values()):
+            params = {**defaults, **dict(zip(grid, values))}
+            if params["dtype"] not in DTYPES:
+                raise ValueError(f"Unknown dtype {params['dtype']}, expected one of {DTYPES}")
+            name = "_".join([architecture] + [f"{key}={value}" for key, value in zip(grid, values)])
+            runs.append((name, architecture, params))
+
+    return runs
+
+
+def share(arrays):
+    """
+    Copies arrays into shared memory blocks.
+
+    Returns:
+        tuple: (blocks, specs) with specs {key: (block name, shape, dtype)} to attach from
+        other processes. The blocks must be closed and unlinked by the caller.
+    """
+    blocks = []
+    specs = {}
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[key] = (block.name, array.shape, array.dtype.str)
+
+    return blocks, specs
+
+
+def _init_worker(specs, output_dir):
+    for key, (name, shape, dtype) in specs.items():
+        # Workers share the parent's resource tracker: the blocks are unlinked once, by the parent
+        block = shared_memory.SharedMemory(name=name)
+        _shared[key] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    _shared["output_dir"] = output_dir
+
+
+def train_run(name, architecture, params):
+    """Trains one configuration in a worker process and returns its leaderboard row."""
+    start = time.perf_counter()
+    dataset = ARCHITECTURES[architecture]
+    output_dir = Path(_shared["output_dir"])
+
+    X_train, y_train = _shared[f"{dataset}/X_train"][1], _shared[f"{dataset}/y_train"][1]
+    X_val, y_val = _shared[f"{dataset}/X_val"][1], _shared[f"{dataset}/y_val"][1]
+    num_classes = count_classes(y_train, y_val)
+
+    np.random.seed(params["seed"])
+    network = importlib.import_module(architecture).build_network()
+    if isinstance(network[0], Convolutional):
+        X_train = X_train.reshape(-1, 1, 28, 28)
+        X_val = X_val.reshape(-1, 1, 28, 28)
+
+    model = Model(network, CategoricalCrossEntropy(), Adam(learning_rate=params["learning_rate"]))
+    evaluation = BatchIterator(
+        X_val, y_val, batch_size=1024, num_classes=num_classes, shuffle=False, dtype=params["dtype"]
+    )
+
+    log_path = output_dir / f"{name}.log"
+    with open(log_path, "w") as log, contextlib.redirect_stdout(log):
+        fit(
+            model,
+            BatchIterator(
+                X_train, y_train, batch_size=params["batch_size"], num_classes=num_classes, dtype=params["dtype"]
+            ),
+            epochs=params["epochs"],
+            evaluation=evaluation,
+            early_stopping=params["early_stopping"],
+        )
+
+    metrics = evaluate(model, evaluation)
+    model_path = output_dir / f"{name}.npz"
+    save_model(model, str(model_path))
+
+    return {
+        "run": name,
+        "architecture": architecture,
+        **params,
+        "val_loss": metrics["loss"],
+        "val_accuracy": metrics["accuracy"],
+        "seconds": time.perf_counter() - start,
+        "model": str(model_path),
+        "log": str(log_path),
+    }
+
+
+def write_leaderboard(rows, path):
+    rows = sorted(rows, key=lambda row: row["val_accuracy"], reverse=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a grid of architectures and hyperparameters in parallel")
+    parser.add_argument("config", type=str, help="JSON description of the sweep")
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of runs trained at the same time",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default="output/sweep",
+        help="Directory of the models, logs and leaderboard",
+    )
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        runs = expand_runs(json.load(f))
+
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print("Loading data...")
+    arrays = {}
+    for dataset in sorted({ARCHITECTURES[architecture] for _, architecture, _ in runs}):
+        (X_train, y_train), (X_val, y_val) = load_dataset(dataset)
+        arrays.update({
+            f"{dataset}/X_train": X_train,
+            f"{dataset}/y_train": y_train,
+            f"{dataset}/X_val": X_val,
+            f"{dataset}/y_val": y_val,
+        })
+
+    blocks, specs = share(arrays)
+    shared_mb = sum(block.size for block in blocks) / 1e6
+    workers = max(1, min(args.workers, len(runs)))
+    print(f"{len(runs)} runs on {workers} workers, sharing {shared_mb:.1f} MB of data")
+
+    start = time.perf_counter()
+    rows = []
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(specs, str(output_dir))) as pool:
+            futures = {pool.submit(train_run, *run): run[0] for run in runs}
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as error:
+                    print(f"   {futures[future]} failed: {error!r}")
+                    continue
+                rows.append(row)
+                print(f"   {row['run']:<48} val accuracy {row['val_accuracy']:.4f}   {row['seconds']:7.1f}s")
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    elapsed = time.perf_counter() - start
+    if not rows:
+        print("No run finished")
+    else:
+        leaderboard = write_leaderboard(rows, output_dir / "leaderboard.csv")
+        print(f"\nSweep done in {elapsed:.1f}s (runs took {sum(row['seconds'] for row in rows):.1f}s in total)")
+        print(f"Leaderboard ({output_dir / 'leaderboard.csv'}):")
+        for rank, row in enumerate(leaderboard, start=1):
+            print(
+                f"   {rank:>3}. {row['run']:<48} val accuracy {row['val_accuracy']:.4f}"
+                f"   val loss {row['val_loss']:.4f}   {row['seconds']:7.1f}s"
+            )
@@ -0,0 +1,147 @@
+from mpneuralnetwork import DTYPE, to_device, to_host
+from mpneuralnetwork.optimizers import Adam
+from mpneuralnetwork.serialization import get_model_weights, restore_model_weights
+
+
+def evaluate(model, batches):
+    """
+    Computes the loss and accuracy of the model over an iterable of (X, y) batches
+    with one-hot labels, one batch at a time.
+
+    Returns:
+        dict: {"loss": ..., "accuracy": ...}, averaged over the samples.
+    """
+    total_loss = 0.0
+    correct = 0
+    count = 0
+
+    for X_batch, y_batch in batches:
+        X_batch = to_device(X_batch)
+        y_batch = to_device(y_batch.astype(DTYPE, copy=False))
+
+        predictions, metric_dict = model.evaluate(X_batch, y_batch, training=False, compute_metrics=False)
+
+        total_loss += metric_dict["loss"] * len(X_batch)
+        correct += int((to_host(predictions).argmax(axis=1) == to_host(y_batch).argmax(axis=1)).sum())
+        count += len(X_batch)
+
+    return {"loss": total_loss / count, "accuracy": correct / count}
+
+
+def test(model, batches):
+    """Streaming equivalent of `Model.test`."""
+    metric_dict = evaluate(model, batches)
+
+    print("Test results:")
+    for key, value in metric_dict.items():
+        print(f"   {key} = {value:.4f}")
+
+
+def train_step(model, X_batch, y_batch):
+    """One forward pass, backward pass and optimizer step on a mini-batch. Returns its loss."""
+    X_batch = to_device(X_batch)
+    # The model casts the inputs to its dtype, labels of another dtype
+    # would promote the loss and the gradients
+    y_batch = to_device(y_batch.astype(DTYPE, copy=False))
+
+    predictions, metric_dict = model.evaluate(X_batch, y_batch, training=True, compute_metrics=False)
+
+    grad = model.loss.prime(predictions, y_batch)
+    for layer in reversed(model.layers):
+        grad = layer.backward(grad)
+
+    model.optimizer.step(model.layers)
+    return metric_dict["loss"]
+
+
+def fit(
+    model,
+    batches,
+    epochs,
+    evaluation=None,
+    early_stopping=None,
+    model_checkpoint=True,
+    checkpoint=None,
+    resume=False,
+):
+    """
+    Streaming equivalent of `Model.train`: trains on an iterable of (X, y) mini-batches
+    (such as a `dataset.BatchIterator`, iterated once per epoch) instead of full arrays,
+    so the whole dataset never has to be materialized as float32.
+
+    Args:
+        model (Model): The model to train.
+        batches (Iterable): Training batches, re-iterated at every epoch.
+        epochs (int): Number of passes over the batches.
+        evaluation (Iterable | None): Validation batches, evaluated after every epoch.
+        early_stopping (int | None): Number of epochs with no improvement to wait before stopping.
+        model_checkpoint (bool): Whether to restore the best weights after training.
+        checkpoint (Checkpointer | None): Saves the training state every `checkpoint.every` epochs.
+        resume (bool): Whether to start from the last checkpoint, if there is one.
+    """
+    early_stopping = early_stopping if early_stopping else epochs + 1
+    patience = early_stopping
+    best_error = float("inf")
+    best_weights = None
+    best_t = 0
+    start = 0
+
+    if resume and checkpoint is not None:
+        restored = checkpoint.restore(model, batches)
+        if restored is not None:
+            start, progress, best_weights = restored
+            patience, best_error, best_t = progress["patience"], progress["best_error"], progress["best_t"]
+            print(f"Resuming from {checkpoint.path} after epoch {start}")
+
+    # A run that stopped early is already over
+    for epoch in range(start, epochs if patience > 0 else start):
+        total_loss = 0.0
+        num_batches = 0
+
+        for X_batch, y_batch in batches:
+            total_loss += train_step(model, X_batch, y_batch)
+            num_batches += 1
+
+        loss = total_loss / max(num_batches, 1)
+
+        spacing_str = " " * abs(len(str(epochs)) - len(str(epoch + 1)))
+        message = f"epoch {spacing_str}{epoch + 1}/{epochs}   |   [training]   loss = {loss:.4f}"
+
+        if evaluation is not None:
+            val_metric_dict = evaluate(model, evaluation)
+            error = val_metric_dict["loss"]
+
+            message += "   |   [evaluation]"
+            for key, value in val_metric_dict.items():
+                message += f"   {key} = {value:.4f}"
+        else:
+            error = loss
+
+        if error < best_error:
+            best_error = error
+            patience = early_stopping
+            if model_checkpoint:
+                best_weights = get_model_weights(model.layers)
+                if isinstance(model.optimizer, Adam):
+                    best_t = model.optimizer.t
+        else:
+            patience -= 1
+
+        print(message)
+
+        if checkpoint is not None and ((epoch + 1) % checkpoint.every == 0 or epoch + 1 == epochs or patience == 0):
+            progress = {"patience": patience, "best_error": best_error, "best_t": best_t}
+            checkpoint.save(model, batches, epoch + 1, progress, best_weights)
+
+        if patience == 0:
+            print(f"EARLY STOPPING - Model did not learn since {early_stopping} epochs")
+            break
+
+    if checkpoint is not None:
+        checkpoint.close()
+
+    if model_checkpoint and best_weights is not None:
+        restore_model_weights(model.layers, best_weights)
+        if isinstance(model.optimizer, Adam):
+            model.optimizer.t = best_t
+        print(f"MODEL CHECKPOINT: {best_error:.4f}")